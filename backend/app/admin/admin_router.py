@@ -0,0 +1,94 @@
+import hmac
+import ipaddress
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Path, Request
+from fastapi.responses import PlainTextResponse
+
+from app.cache import caches
+from app.config import METRICS_TOKEN
+from app.dependencies import get_current_user
+from app.metrics import metrics
+from app.vms.vm_session import vcenters
+from app.vms.vm_service import (
+    inventory, inventory_syncs, inventory_events, power_jobs, inventory_leadership,
+)
+
+router = APIRouter()
+# Sin prefijo /api: Prometheus espera /metrics
+metrics_router = APIRouter()
+
+# —————— Endpoint: Estado de las sesiones con vCenter ——————
+@router.get("/admin/vcenter/sessions")
+def vcenter_sessions(current_user: str = Depends(get_current_user)):
+    """
+    Devuelve, por vCenter, el estado de las sesiones persistentes REST/SOAP:
+    - Logins, re-autenticaciones y peticiones realizadas.
+    - Conexiones abiertas, ociosas y tamaño del pool HTTP.
+    """
+    return {name: session.metrics() for name, session in vcenters.items()}
+
+# —————— Endpoint: Estado del snapshot de inventario ——————
+@router.get("/admin/inventory")
+def inventory_status(current_user: str = Depends(get_current_user)):
+    """
+    Devuelve versión, antigüedad y tamaño del snapshot de inventario,
+    si hay un refresco en curso, el último error registrado, el estado
+    de la sincronización incremental, los clientes SSE conectados, los
+    trabajos de energía por lotes y el rol (líder/seguidor) del worker.
+    """
+    return {
+        **inventory.status(),
+        "sync":       {name: sync.status() for name, sync in inventory_syncs.items()},
+        "events":     inventory_events.status(),
+        "power_jobs": power_jobs.status(),
+        "leadership": inventory_leadership.status() if inventory_leadership else None,
+    }
+
+# —————— Endpoints: Métricas e invalidación de cachés ——————
+@router.get("/admin/cache")
+def cache_stats(current_user: str = Depends(get_current_user)):
+    """
+    Devuelve, por espacio de nombres, tamaño, TTL, aciertos (positivos y
+    negativos), fallos, tasa de acierto y desalojos, para ajustar los
+    tamaños con tráfico real (CACHE_MAXSIZES / CACHE_TTLS).
+    """
+    return caches.stats()
+
+@router.delete("/admin/cache/{name}")
+def cache_clear(
+    name: str         = Path(..., description="Espacio de nombres a vaciar"),
+    current_user: str = Depends(get_current_user),
+):
+    """
+    Vacía un espacio de caché concreto.
+    """
+    if caches.get(name) is None:
+        raise HTTPException(status_code=404, detail="Caché no encontrada")
+    caches.clear(name)
+    return {"message": f"Caché '{name}' vaciada"}
+
+# —————— Endpoint: Métricas para Prometheus ——————
+def _is_loopback(host: Optional[str]) -> bool:
+    try:
+        return ipaddress.ip_address(host or "").is_loopback
+    except ValueError:
+        return False
+
+@metrics_router.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics(request: Request, authorization: Optional[str] = Header(None)):
+    """
+    Expone en formato de texto de Prometheus:
+    - Peticiones a vCenter por endpoint y estado, latencias y reintentos.
+    - Operaciones SOAP, etapas y duración de los refrescos del inventario.
+    - Aciertos/fallos de cada caché y estado del snapshot.
+    - Peticiones HTTP atendidas y su latencia por ruta.
+    Si METRICS_TOKEN está definido exige "Authorization: Bearer <token>";
+    si no, solo atiende a clientes locales (scrape desde la misma máquina).
+    """
+    if METRICS_TOKEN:
+        if not hmac.compare_digest(authorization or "", f"Bearer {METRICS_TOKEN}"):
+            raise HTTPException(status_code=401, detail="Token de métricas inválido")
+    elif not _is_loopback(request.client.host if request.client else None):
+        raise HTTPException(status_code=403, detail="Métricas solo accesibles en local sin METRICS_TOKEN")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
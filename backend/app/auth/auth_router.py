@@ -1,12 +1,15 @@
+import logging
 from fastapi import APIRouter, HTTPException, status, Depends
 from sqlmodel import Session, select
 from pydantic import BaseModel
-from app.auth.jwt_handler import create_access_token
+from app.auth.jwt_handler import create_access_token, create_stream_token
 from app.auth.user_model import User
+from app.config import STREAM_TOKEN_EXPIRE_SECONDS
 from passlib.hash import bcrypt
-from app.dependencies import get_session  # inyección de sesión de base de datos
+from app.dependencies import get_current_user, get_session  # inyección de sesión de base de datos
 
 router = APIRouter()
+log = logging.getLogger(__name__)
 
 
 # —————— Esquemas de datos ——————
@@ -28,6 +31,21 @@ class TokenResponse(BaseModel):
     token_type: str = "bearer"
 
 
+class StreamTokenRequest(BaseModel):
+    """
+    Canal SSE que se quiere abrir (ruta completa, p. ej. /api/vms/events).
+    """
+    path: str
+
+
+class StreamTokenResponse(BaseModel):
+    """
+    Token de canal para ?stream_token= y sus segundos de validez.
+    """
+    stream_token: str
+    expires_in: int
+
+
 # —————— Punto de entrada: autenticación ——————
 @router.post("/login", response_model=TokenResponse)
 def login(request: LoginRequest, session: Session = Depends(get_session)):
@@ -42,19 +60,10 @@ def login(request: LoginRequest, session: Session = Depends(get_session)):
     statement = select(User).where(User.username == request.username)
     user = session.exec(statement).first()
 
-    # Logs para depuración del proceso de autenticación
-    print("🔎 Intento login con:", request.username)
-    if not user:
-        print("❌ Usuario no encontrado en la base")
-    else:
-        print("✅ Usuario encontrado:", user.username)
-        print("🔐 Comparando hash:")
-        print("Contraseña enviada:", request.password)
-        print("Hash guardado:", user.hashed_password)
-        print("Verificación:", bcrypt.verify(request.password, user.hashed_password))
-
-    # Validación de credenciales
+    # Validación de credenciales (nunca se registran contraseñas ni hashes)
     if not user or not bcrypt.verify(request.password, user.hashed_password):
+        log.info("Login fallido para %s (%s)", request.username,
+                 "usuario inexistente" if not user else "contraseña incorrecta")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Credenciales inválidas"
@@ -63,3 +72,24 @@ def login(request: LoginRequest, session: Session = Depends(get_session)):
     # Generación del token de acceso
     token = create_access_token({"sub": user.username})
     return {"access_token": token}
+
+
+# —————— Punto de entrada: token de canal SSE ——————
+@router.post("/stream-token", response_model=StreamTokenResponse)
+def stream_token(request: StreamTokenRequest, current_user: str = Depends(get_current_user)):
+    """
+    Endpoint POST /stream-token
+    1. Requiere el JWT de acceso en la cabecera Authorization.
+    2. Emite un token de corta duración que solo abre el canal SSE indicado
+       (EventSource no puede enviar cabeceras: el token va en la URL).
+    3. Devuelve 400 si la ruta no es un canal SSE de la API.
+    """
+    if not (request.path.startswith("/api/") and request.path.endswith("/events")):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="La ruta no es un canal SSE"
+        )
+    return {
+        "stream_token": create_stream_token(current_user, request.path),
+        "expires_in":   STREAM_TOKEN_EXPIRE_SECONDS,
+    }
@@ -1,6 +1,9 @@
 from datetime import datetime, timedelta
 from jose import jwt
-from app.config import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES
+from app.config import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES, STREAM_TOKEN_EXPIRE_SECONDS
+
+# Tipo ('typ') de los tokens que solo sirven para abrir un canal SSE
+STREAM_TOKEN_TYPE = "stream"
 
 # —————— Gestión de tokens JWT ——————
 def create_access_token(data: dict):
@@ -16,6 +19,18 @@ def create_access_token(data: dict):
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
+def create_stream_token(username: str, path: str) -> str:
+    """
+    Genera un token de canal SSE (EventSource no envía cabeceras, así que
+    viaja en la URL y puede acabar en logs o en el historial):
+    1. Solo abre el canal `path` (claim 'scope').
+    2. Caduca a los STREAM_TOKEN_EXPIRE_SECONDS.
+    3. Lleva 'typ' = stream: no se acepta como token de acceso.
+    """
+    expire = datetime.utcnow() + timedelta(seconds=STREAM_TOKEN_EXPIRE_SECONDS)
+    payload = {"sub": username, "typ": STREAM_TOKEN_TYPE, "scope": path, "exp": expire}
+    return jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
+
 def decode_token(token: str):
     """
     Decodifica y verifica un JWT:
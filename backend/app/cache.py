@@ -0,0 +1,244 @@
+import sys
+import threading
+from typing import Any, Callable, Dict, Hashable, Iterator, NamedTuple, Optional, Tuple
+
+from cachetools import LRUCache, TLRUCache
+
+from app.config import CACHE_TTLS, CACHE_MAXSIZES, CACHE_MAX_BYTES, CACHE_NEGATIVE_TTL
+
+# ───────────────────────────────────────────────────────────────────────
+# Capa de caché unificada (espacios de nombres, métricas e invalidación)
+# ───────────────────────────────────────────────────────────────────────
+# Cada espacio de nombres es una caché acotada (por entradas o, si se
+# configura CACHE_MAX_BYTES, por memoria aproximada) con TTL propio.
+# Los fallos se guardan como entradas negativas con un TTL corto para
+# no repetir la llamada en cada petición, pero sin fijar el error
+# durante todo el TTL normal.
+
+MISSING = object()
+
+
+class _Entry(NamedTuple):
+    value: Any
+    negative: bool
+
+
+def approx_size(obj: Any, _depth: int = 0) -> int:
+    """
+    Tamaño aproximado en bytes de un valor (recorre contenedores simples).
+    """
+    size = sys.getsizeof(obj)
+    if _depth > 3:
+        return size
+    if isinstance(obj, dict):
+        size += sum(approx_size(k, _depth + 1) + approx_size(v, _depth + 1) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(approx_size(v, _depth + 1) for v in obj)
+    return size
+
+
+class CacheNamespace:
+    """
+    Caché con nombre, segura entre hilos:
+    - ttl=None la convierte en una LRU sin caducidad (p. ej. índices por
+      versión de snapshot, cuya clave ya cambia con cada refresco).
+    - set(..., negative=True) guarda un fallo con `negative_ttl`.
+    - Cuenta aciertos, fallos, aciertos negativos, inserciones y desalojos.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        maxsize: int,
+        ttl: Optional[float],
+        negative_ttl: float = CACHE_NEGATIVE_TTL,
+        max_bytes: Optional[int] = None,
+    ):
+        self.name         = name
+        self.ttl          = ttl
+        self.negative_ttl = min(negative_ttl, ttl) if ttl else negative_ttl
+        self.max_bytes    = max_bytes
+        self._lock        = threading.RLock()
+        self.hits = self.misses = self.negative_hits = self.sets = self.evictions = 0
+
+        on_evict = self._count_eviction
+        if max_bytes:
+            limit, getsizeof = max_bytes, (lambda e: approx_size(e.value))
+        else:
+            limit, getsizeof = maxsize, None
+        if ttl is None:
+            class _Cache(LRUCache):
+                def popitem(self):
+                    item = super().popitem()
+                    on_evict()
+                    return item
+            self._data = _Cache(limit, getsizeof=getsizeof)
+        else:
+            ttu = lambda _k, e, now: now + (self.negative_ttl if e.negative else self.ttl)
+            class _Cache(TLRUCache):
+                def popitem(self):
+                    item = super().popitem()
+                    on_evict()
+                    return item
+            self._data = _Cache(limit, ttu, getsizeof=getsizeof)
+        self.maxsize = limit
+
+    def _count_eviction(self) -> None:
+        self.evictions += 1
+
+    # —————— Lectura / escritura ——————
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Devuelve el valor cacheado (también si es negativo) o `default`.
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            if entry.negative:
+                self.negative_hits += 1
+            else:
+                self.hits += 1
+            return entry.value
+
+    def set(self, key: Hashable, value: Any, negative: bool = False) -> None:
+        with self._lock:
+            try:
+                self._data[key] = _Entry(value, negative)
+            except ValueError:      # mayor que todo el límite en bytes: no se cachea
+                return
+            self.sets += 1
+
+    def __setitem__(self, key: Hashable, value: Any) -> None:
+        self.set(key, value)
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._data
+
+    def update(self, values: Dict[Hashable, Any]) -> None:
+        with self._lock:
+            for key, value in values.items():
+                self._data[key] = _Entry(value, False)
+            self.sets += len(values)
+
+    def items(self) -> Iterator[Tuple[Hashable, Any]]:
+        """
+        Pares (clave, valor) vigentes y no negativos (copia estable).
+        """
+        with self._lock:
+            return iter([(k, e.value) for k, e in list(self._data.items()) if not e.negative])
+
+    def get_or_load(
+        self,
+        key: Hashable,
+        loader: Callable[[], Any],
+        is_negative: Callable[[Any], bool] = lambda v: False,
+    ) -> Any:
+        """
+        Lee la clave o la carga con `loader`. Los resultados para los que
+        `is_negative` es True se guardan como negativos (TTL corto); las
+        excepciones se propagan sin cachear nada.
+        """
+        value = self.get(key, MISSING)
+        if value is not MISSING:
+            return value
+        value = loader()
+        self.set(key, value, negative=is_negative(value))
+        return value
+
+    # —————— Invalidación ——————
+    def invalidate(self, key: Hashable) -> bool:
+        with self._lock:
+            return self._data.pop(key, None) is not None
+
+    def invalidate_where(self, predicate: Callable[[Hashable], bool]) -> int:
+        """
+        Elimina las entradas cuya clave cumple `predicate`; devuelve cuántas.
+        """
+        with self._lock:
+            stale = [k for k in list(self._data.keys()) if predicate(k)]
+            for k in stale:
+                self._data.pop(k, None)
+            return len(stale)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses + self.negative_hits
+            return {
+                "ttl":           self.ttl,
+                "negative_ttl":  self.negative_ttl if self.ttl else None,
+                "maxsize":       self.maxsize,
+                "unit":          "bytes" if self.max_bytes else "entries",
+                "size":          self._data.currsize,
+                "entries":       len(self._data),
+                "hits":          self.hits,
+                "negative_hits": self.negative_hits,
+                "misses":        self.misses,
+                "hit_rate":      round((self.hits + self.negative_hits) / lookups, 3) if lookups else None,
+                "sets":          self.sets,
+                "evictions":     self.evictions,
+            }
+
+
+class CacheRegistry:
+    """
+    Registro de espacios de nombres: aplica la configuración de
+    tamaños/TTL del entorno, expone métricas agregadas y permite
+    invalidar una clave en varios espacios a la vez.
+    """
+
+    def __init__(self):
+        self._namespaces: Dict[str, CacheNamespace] = {}
+        self._lock = threading.Lock()
+
+    def namespace(
+        self,
+        name: str,
+        maxsize: int,
+        ttl: Optional[float] = 300,
+        max_bytes: Optional[int] = None,
+    ) -> CacheNamespace:
+        """
+        Crea (o devuelve) un espacio de nombres. CACHE_MAXSIZES, CACHE_TTLS
+        y CACHE_MAX_BYTES ({nombre: valor}) prevalecen sobre los valores por
+        defecto; con `max_bytes` el límite es de memoria, no de entradas.
+        """
+        with self._lock:
+            ns = self._namespaces.get(name)
+            if ns is None:
+                ns = self._namespaces[name] = CacheNamespace(
+                    name,
+                    maxsize   = CACHE_MAXSIZES.get(name, maxsize),
+                    ttl       = CACHE_TTLS.get(name, ttl) if ttl is not None else None,
+                    max_bytes = CACHE_MAX_BYTES.get(name, max_bytes),
+                )
+            return ns
+
+    def get(self, name: str) -> Optional[CacheNamespace]:
+        return self._namespaces.get(name)
+
+    def invalidate(self, key: Hashable, *names: str) -> int:
+        """
+        Elimina `key` de los espacios indicados (o de todos); devuelve
+        cuántas entradas se borraron.
+        """
+        targets = names or tuple(self._namespaces)
+        return sum(self._namespaces[n].invalidate(key) for n in targets if n in self._namespaces)
+
+    def clear(self, *names: str) -> None:
+        for n in names or tuple(self._namespaces):
+            if n in self._namespaces:
+                self._namespaces[n].clear()
+
+    def stats(self) -> Dict[str, dict]:
+        return {name: ns.stats() for name, ns in sorted(self._namespaces.items())}
+
+
+# Registro global de la aplicación
+caches = CacheRegistry()
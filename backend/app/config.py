@@ -3,7 +3,18 @@ from dotenv import load_dotenv
 # Carga las variables de entorno definidas en el archivo .env
 load_dotenv()
 
+import json
 import os
+from urllib.parse import urlparse
+
+def _int_map(value: str) -> dict:
+    """Interpreta "nombre=valor,nombre=valor" como {nombre: int(valor)}."""
+    out = {}
+    for part in value.split(","):
+        if "=" in part:
+            k, v = part.split("=", 1)
+            out[k.strip()] = int(v)
+    return out
 
 # —————— Parámetros de conexión a vCenter ——————
 # VCENTER_HOST : URL o dirección del servidor vCenter (incluye protocolo y puerto)
@@ -13,10 +24,134 @@ VCENTER_HOST = os.getenv("VCENTER_HOST")
 VCENTER_USER = os.getenv("VCENTER_USER")
 VCENTER_PASS = os.getenv("VCENTER_PASS")
 
+# —————— Varios vCenter (federación) ——————
+# VCENTER_NAME : Nombre del vCenter por defecto (por omisión, el hostname de VCENTER_HOST)
+# VCENTERS     : Lista JSON [{"name", "host", "user", "password"}, ...]; si se omite,
+#                solo se usa el vCenter definido por VCENTER_HOST/USER/PASS
+VCENTER_NAME = os.getenv("VCENTER_NAME") or (
+    urlparse(VCENTER_HOST if "://" in (VCENTER_HOST or "") else f"https://{VCENTER_HOST}").hostname
+    if VCENTER_HOST else "default"
+)
+VCENTERS = json.loads(os.getenv("VCENTERS") or "null") or [
+    {"name": VCENTER_NAME, "host": VCENTER_HOST, "user": VCENTER_USER, "password": VCENTER_PASS}
+]
+
+# —————— Sesiones persistentes contra vCenter ——————
+# VCENTER_POOL_SIZE        : Conexiones HTTP keep-alive máximas en el pool REST
+# VCENTER_SESSION_MAX_IDLE : Segundos de inactividad tras los que se renueva el token REST
+# VCENTER_MAX_CONCURRENCY  : Peticiones REST simultáneas máximas contra un mismo vCenter
+#                            (síncronas y asíncronas suman en el mismo cupo)
+VCENTER_POOL_SIZE        = int(os.getenv("VCENTER_POOL_SIZE", "20"))
+VCENTER_SESSION_MAX_IDLE = int(os.getenv("VCENTER_SESSION_MAX_IDLE", "1500"))
+VCENTER_MAX_CONCURRENCY  = int(os.getenv("VCENTER_MAX_CONCURRENCY", "16"))
+
+# —————— Recolección de inventario ——————
+# COLLECTOR_PAGE_SIZE       : Objetos por página en RetrievePropertiesEx (PropertyCollector)
+# INVENTORY_REFRESH_SECONDS : Intervalo del refresco del inventario en segundo plano
+COLLECTOR_PAGE_SIZE       = int(os.getenv("COLLECTOR_PAGE_SIZE", "1000"))
+INVENTORY_REFRESH_SECONDS = int(os.getenv("INVENTORY_REFRESH_SECONDS", "300"))
+
+# —————— Resolución de nombres de red (app/vms/vm_networks.py) ——————
+# NETWORK_REFRESH_SECONDS : Cada cuánto se recarga en bloque el mapa de redes de cada vCenter
+# NETWORK_BATCH_SIZE      : Ids de red desconocidos por consulta REST filtrada
+NETWORK_REFRESH_SECONDS = int(os.getenv("NETWORK_REFRESH_SECONDS", "900"))
+NETWORK_BATCH_SIZE      = int(os.getenv("NETWORK_BATCH_SIZE", "100"))
+
+# —————— Persistencia del snapshot de inventario ——————
+# INVENTORY_PERSIST_ENABLED     : Guarda el snapshot en app.db para servirlo tras un reinicio
+# INVENTORY_PERSIST_MIN_SECONDS : Intervalo mínimo entre dos guardados consecutivos en app.db
+#                                 (el almacén compartido usa SHARED_PUBLISH_MIN_SECONDS)
+INVENTORY_PERSIST_ENABLED     = os.getenv("INVENTORY_PERSIST_ENABLED", "true").lower() in ("1", "true", "yes")
+INVENTORY_PERSIST_MIN_SECONDS = int(os.getenv("INVENTORY_PERSIST_MIN_SECONDS", "30"))
+
+# —————— Caché de consultas a vCenter (app/cache.py) ——————
+# CACHE_TTLS         : TTL por espacio de nombres, p. ej. "identity=600,placement=120"
+# CACHE_MAXSIZES     : Entradas máximas por espacio de nombres, p. ej. "identity=20000"
+# CACHE_MAX_BYTES    : Límite por memoria aproximada (bytes) en lugar de por entradas
+# CACHE_NEGATIVE_TTL : TTL de los fallos cacheados (red "<error>", identidad vacía...)
+CACHE_TTLS         = _int_map(os.getenv("CACHE_TTLS", ""))
+CACHE_MAXSIZES     = _int_map(os.getenv("CACHE_MAXSIZES", ""))
+CACHE_MAX_BYTES    = _int_map(os.getenv("CACHE_MAX_BYTES", ""))
+CACHE_NEGATIVE_TTL = int(os.getenv("CACHE_NEGATIVE_TTL", "30"))
+
+# —————— Listados ya serializados (GET /api/vms) ——————
+# RENDER_CACHE_BYTES    : Memoria máxima de las páginas montadas en caché
+#                         (CACHE_MAX_BYTES "rendered_pages=..." también la fija)
+# RENDER_PAGE_MAX_BYTES : Las páginas más grandes no se cachean: se montan en
+#                         cada petición a partir de las filas ya codificadas
+RENDER_CACHE_BYTES    = int(os.getenv("RENDER_CACHE_BYTES", str(64 * 1024 * 1024)))
+RENDER_PAGE_MAX_BYTES = int(os.getenv("RENDER_PAGE_MAX_BYTES", str(4 * 1024 * 1024)))
+
+# —————— Inventario compartido entre workers/hosts ——————
+# SHARED_BACKEND      : "" (cada worker por su cuenta), "file" (misma máquina) o "redis"
+# SHARED_FILE_PATH    : Fichero del snapshot compartido (backend "file")
+# SHARED_REDIS_URL    : URL del servidor Redis (backend "redis")
+# SHARED_POLL_SECONDS : Cada cuánto comprueban los seguidores si hay versión nueva
+# SHARED_LOCK_TTL     : Caducidad del lock de líder en Redis (se renueva mientras vive)
+# SHARED_PUBLISH_MIN_SECONDS : Intervalo mínimo entre dos publicaciones del líder
+#                              (0 = cada snapshot nuevo; los seguidores no esperan al de app.db)
+SHARED_BACKEND      = os.getenv("SHARED_BACKEND", "").lower()
+SHARED_FILE_PATH    = os.getenv("SHARED_FILE_PATH", "app/shared/inventory.snap")
+SHARED_REDIS_URL    = os.getenv("SHARED_REDIS_URL", "redis://localhost:6379/0")
+SHARED_POLL_SECONDS = int(os.getenv("SHARED_POLL_SECONDS", "5"))
+SHARED_LOCK_TTL     = int(os.getenv("SHARED_LOCK_TTL", "30"))
+SHARED_PUBLISH_MIN_SECONDS = float(os.getenv("SHARED_PUBLISH_MIN_SECONDS", "1"))
+
+# —————— Deltas entre snapshots (GET /api/vms?since=) ——————
+# INVENTORY_HISTORY_SIZE : Versiones recientes de las que se conserva la huella por VM
+INVENTORY_HISTORY_SIZE = int(os.getenv("INVENTORY_HISTORY_SIZE", "16"))
+
+# —————— Eventos en vivo del inventario (GET /api/vms/events, SSE) ——————
+# INVENTORY_EVENTS_QUEUE             : Mensajes pendientes por cliente antes de pedirle una recarga
+# INVENTORY_EVENTS_HEARTBEAT_SECONDS : Intervalo de los comentarios keep-alive hacia el navegador
+INVENTORY_EVENTS_QUEUE             = int(os.getenv("INVENTORY_EVENTS_QUEUE", "32"))
+INVENTORY_EVENTS_HEARTBEAT_SECONDS = int(os.getenv("INVENTORY_EVENTS_HEARTBEAT_SECONDS", "15"))
+
+# —————— Sincronización incremental (WaitForUpdatesEx) ——————
+# INVENTORY_SYNC_ENABLED       : Mantiene el inventario al día aplicando deltas en vez de reconstruirlo
+# INVENTORY_SYNC_WAIT_SECONDS  : Espera máxima de cada WaitForUpdatesEx (long-poll)
+# INVENTORY_SYNC_RETRY_SECONDS : Pausa antes de reabrir el filtro tras un error
+INVENTORY_SYNC_ENABLED       = os.getenv("INVENTORY_SYNC_ENABLED", "true").lower() in ("1", "true", "yes")
+INVENTORY_SYNC_WAIT_SECONDS  = int(os.getenv("INVENTORY_SYNC_WAIT_SECONDS", "60"))
+INVENTORY_SYNC_RETRY_SECONDS = int(os.getenv("INVENTORY_SYNC_RETRY_SECONDS", "30"))
+
+# —————— Detalle de VM (GET /api/vms/{id}) ——————
+# VM_DETAIL_MAX_AGE_SECONDS : Antigüedad máxima del snapshot para servir el detalle sin consultar vCenter
+VM_DETAIL_MAX_AGE_SECONDS = int(os.getenv("VM_DETAIL_MAX_AGE_SECONDS", "600"))
+
+# —————— Endpoints asíncronos (listado, detalle y energía de una VM) ——————
+# API_VCENTER_TIMEOUT_SECONDS : Plazo máximo de un endpoint esperando a vCenter (después responde 504)
+# API_DISCONNECT_POLL_SECONDS : Cada cuánto se comprueba si el cliente se ha desconectado para cancelar
+API_VCENTER_TIMEOUT_SECONDS = float(os.getenv("API_VCENTER_TIMEOUT_SECONDS", "30"))
+API_DISCONNECT_POLL_SECONDS = float(os.getenv("API_DISCONNECT_POLL_SECONDS", "0.5"))
+
+# —————— Acciones de energía por lotes (POST /api/vms/power) ——————
+# POWER_JOB_CONCURRENCY  : Acciones simultáneas máximas contra vCenter (todas las tareas)
+# POWER_JOB_MAX_VMS      : VMs máximas por lote
+# POWER_JOB_RETENTION    : Trabajos terminados que se conservan para consulta
+POWER_JOB_CONCURRENCY = int(os.getenv("POWER_JOB_CONCURRENCY", "8"))
+POWER_JOB_MAX_VMS     = int(os.getenv("POWER_JOB_MAX_VMS", "500"))
+POWER_JOB_RETENTION   = int(os.getenv("POWER_JOB_RETENTION", "200"))
+
+# —————— Observabilidad (GET /metrics, Server-Timing y logs) ——————
+# METRICS_TOKEN         : Si se define, GET /metrics exige "Authorization: Bearer <token>";
+#                         sin él solo responde a clientes locales (127.0.0.1 / ::1). Tras un
+#                         proxy en la misma máquina todo parece local: defínalo en producción
+# SERVER_TIMING_ENABLED : Añade a cada respuesta la cabecera Server-Timing con el desglose de fases
+#                         (desactivado por defecto: revela tiempos internos a cualquier cliente)
+# LOG_LEVEL             : Nivel de los logs de la aplicación (DEBUG, INFO, WARNING...)
+# LOG_FORMAT            : Formato de cada línea de log (logging.Formatter)
+METRICS_TOKEN         = os.getenv("METRICS_TOKEN", "")
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED", "false").lower() in ("1", "true", "yes")
+LOG_LEVEL             = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT            = os.getenv("LOG_FORMAT", "%(asctime)s %(levelname)s [%(name)s] %(message)s")
+
 # —————— Configuración de JWT ——————
 # SECRET_KEY                 : Clave secreta utilizada para firmar y verificar tokens JWT
 # ALGORITHM                  : Algoritmo de cifrado empleado para los JWT
 # ACCESS_TOKEN_EXPIRE_MINUTES: Duración (en minutos) antes de que el token caduque
+# STREAM_TOKEN_EXPIRE_SECONDS: Validez de los tokens de canal SSE (?stream_token=)
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
+STREAM_TOKEN_EXPIRE_SECONDS = int(os.getenv("STREAM_TOKEN_EXPIRE_SECONDS", "60"))
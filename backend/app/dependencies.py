@@ -1,40 +1,71 @@
-from fastapi import Depends, HTTPException, status
+from typing import Optional
+from fastapi import Depends, HTTPException, Query, Request, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from jose import jwt, JWTError, ExpiredSignatureError
 from app.config import SECRET_KEY, ALGORITHM
+from app.auth.jwt_handler import STREAM_TOKEN_TYPE
 from sqlmodel import Session
 from app.db import engine
 
 # —————— Seguridad y autenticación JWT ——————
 security = HTTPBearer()
+# Variante opcional: los canales SSE, que el navegador abre sin cabeceras
+# propias (EventSource), aceptan en su lugar un token de canal en la query
+optional_security = HTTPBearer(auto_error=False)
 
-def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> str:
+def _unauthorized(detail: str) -> HTTPException:
+    return HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=detail)
+
+def _username_from_token(token: str, path: Optional[str] = None) -> str:
     """
-    1. Extrae el token Bearer de la cabecera Authorization.
-    2. Decodifica y valida el JWT (firma y expiración).
-    3. Recupera el campo 'sub' (username) del payload.
-    4. Lanza 401 si el token está expirado, inválido o carece de 'sub'.
+    Decodifica y valida el JWT (firma y expiración) y devuelve su 'sub'.
+    Sin `path` solo admite tokens de acceso; con `path`, solo un token
+    de canal SSE emitido para esa ruta.
+    Lanza 401 si el token está expirado, inválido, carece de 'sub' o no
+    es del tipo esperado.
     """
-    token = credentials.credentials
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Token inválido (sin 'sub')"
-            )
-        return username
     except ExpiredSignatureError:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Token expirado"
-        )
+        raise _unauthorized("Token expirado")
     except JWTError:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Token inválido"
-        )
+        raise _unauthorized("Token inválido")
+    username: str = payload.get("sub")
+    if username is None:
+        raise _unauthorized("Token inválido (sin 'sub')")
+    if path is None:
+        if payload.get("typ") == STREAM_TOKEN_TYPE:
+            raise _unauthorized("Token de canal: no es un token de acceso")
+    elif payload.get("typ") != STREAM_TOKEN_TYPE or payload.get("scope") != path:
+        raise _unauthorized("Token de canal inválido para esta ruta")
+    return username
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> str:
+    """
+    1. Extrae el token Bearer de la cabecera Authorization.
+    2. Decodifica y valida el JWT (firma y expiración).
+    3. Recupera el campo 'sub' (username) del payload.
+    4. Lanza 401 si el token está expirado, inválido o carece de 'sub'.
+    Es async (solo CPU, microsegundos) para no pasar por el threadpool.
+    """
+    return _username_from_token(credentials.credentials)
+
+def get_current_user_stream(
+    request: Request,
+    stream_token: Optional[str] = Query(None, description="Token de canal (POST /api/stream-token)"),
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security),
+) -> str:
+    """
+    Igual que get_current_user, pero sin cabecera Authorization (EventSource
+    no puede enviarla) acepta un token de canal de corta duración en la
+    query (?stream_token=), emitido para esta misma ruta. El JWT de acceso
+    nunca viaja en la URL.
+    """
+    if credentials is not None:
+        return _username_from_token(credentials.credentials)
+    if stream_token:
+        return _username_from_token(stream_token, request.url.path)
+    raise _unauthorized("Not authenticated")
 
 def get_session():
     """
@@ -0,0 +1,36 @@
+import atexit
+import logging
+import logging.handlers
+import queue
+import sys
+
+from app.config import LOG_LEVEL, LOG_FORMAT
+
+# ───────────────────────────────────────────────────────────────────────
+# Logging no bloqueante de la aplicación
+# ───────────────────────────────────────────────────────────────────────
+# Los módulos usan logging.getLogger(__name__) (jerarquía "app.*"). Los
+# registros se encolan en memoria (QueueHandler) y un único hilo los
+# escribe en stderr (QueueListener), de modo que los hilos que atienden
+# peticiones o recolectan inventario no esperan a la salida estándar.
+
+_listener = None
+
+def setup_logging() -> None:
+    """
+    Configura el logger "app" una sola vez (idempotente).
+    """
+    global _listener
+    if _listener is not None:
+        return
+    stream = logging.StreamHandler(sys.stderr)
+    stream.setFormatter(logging.Formatter(LOG_FORMAT))
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(records, stream, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    logger = logging.getLogger("app")
+    logger.setLevel(LOG_LEVEL)
+    logger.addHandler(logging.handlers.QueueHandler(records))
+    logger.propagate = False
@@ -1,17 +1,31 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
+import logging
 import os
 
 # Carga las variables de entorno desde .env
 load_dotenv()
 
+# Logs de la aplicación (cola en memoria + hilo escritor, ver app/log.py)
+from app.log import setup_logging
+setup_logging()
+log = logging.getLogger("app.main")
+
+from app.config import SERVER_TIMING_ENABLED
+from app.metrics import ObservabilityMiddleware
+
 # Importación de cachés para limpiarlas al iniciar la aplicación
-from app.vms.vm_service import vm_cache, network_cache, identity_cache
+from app.cache import caches
+from app.vms.vm_service import (
+    power_jobs, inventory_leadership, start_inventory_feed, stop_inventory_feed,
+)
+from app.vms.vm_session import vcenters
 
-# Importación de routers de autenticación y VMs
+# Importación de routers de autenticación, VMs y administración
 from app.auth import auth_router
 from app.vms import vm_router
+from app.admin import admin_router
 
 # —————— Creación de la aplicación FastAPI ——————
 app = FastAPI()
@@ -21,13 +35,34 @@ app = FastAPI()
 async def clear_caches():
     """
     Al iniciar la app:
-    1. Vacía los cachés usados para VMs, redes e identidad de guest.
-    2. Imprime un mensaje de debug para confirmar la limpieza.
+    1. Vacía todos los espacios de caché (redes, identidad, ubicación...).
+    2. Arranca la sincronización incremental del inventario de VMs
+       (o el refresco completo periódico si está desactivada); con un
+       almacén compartido, solo en el worker que resulte líder.
+    3. Registra un mensaje para confirmar la limpieza.
     """
-    vm_cache.clear()
-    network_cache.clear()
-    identity_cache.clear()
-    print("[DEBUG] Cachés limpiadas al arranque")
+    caches.clear()
+    if inventory_leadership:
+        inventory_leadership.start()
+    else:
+        start_inventory_feed()
+    log.info("Cachés limpiadas al arranque")
+
+# —————— Evento de apagado ——————
+@app.on_event("shutdown")
+async def close_vcenter_sessions():
+    """
+    Al detener la app detiene la sincronización/refresco del inventario y cierra las
+    sesiones REST/SOAP persistentes con vCenter para no dejar sesiones
+    huérfanas ocupando el límite del appliance.
+    """
+    if inventory_leadership:
+        inventory_leadership.stop()
+    stop_inventory_feed()
+    power_jobs.shutdown()
+    for session in vcenters.values():
+        await session.aclose()
+        session.close()
 
 # —————— Configuración de CORS ——————
 # Se permite que el front-end (origen definido en .env) interactúe con esta API.
@@ -38,10 +73,21 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Cabeceras de paginación/snapshot legibles desde el navegador
+    expose_headers=["ETag", "X-Total-Count", "X-Next-Offset", "X-Inventory-Version", "X-Inventory-Age"],
 )
 
+# —————— Métricas y Server-Timing ——————
+# Cuenta y mide cada petición por plantilla de ruta; con SERVER_TIMING_ENABLED
+# añade el desglose de fases (vCenter, render...) en la cabecera Server-Timing.
+app.add_middleware(ObservabilityMiddleware, server_timing=SERVER_TIMING_ENABLED)
+
 # —————— Registro de routers ——————
 # Todas las rutas de autenticación estarán bajo /api
 app.include_router(auth_router.router, prefix="/api")
 # Todas las rutas de VM estarán también bajo /api
 app.include_router(vm_router.router, prefix="/api")
+# Rutas de administración (estado de sesiones, cachés, etc.)
+app.include_router(admin_router.router, prefix="/api")
+# Métricas en formato Prometheus en /metrics (ruta estándar de scrape)
+app.include_router(admin_router.metrics_router)
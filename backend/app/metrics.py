@@ -0,0 +1,332 @@
+import bisect
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from app.cache import caches
+
+# ───────────────────────────────────────────────────────────────────────
+# Métricas de la aplicación (formato de texto de Prometheus) y Server-Timing
+# ───────────────────────────────────────────────────────────────────────
+# Contadores e histogramas con etiquetas, seguros entre hilos y sin
+# dependencias externas; GET /metrics los expone en el formato de texto
+# 0.0.4 de Prometheus. Los valores que ya llevan su propia cuenta (cachés,
+# snapshot) se leen en el momento del scrape mediante colectores.
+#
+# En paralelo, cada petición HTTP puede acumular la duración de sus fases
+# (llamadas a vCenter, etapas del refresco...) en una variable de contexto
+# que el middleware convierte en la cabecera Server-Timing.
+
+# Buckets por defecto (segundos): de 1 ms a 60 s
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+Sample = Tuple[str, Dict[str, str], float]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(pairs: Dict[str, str]) -> str:
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs.items()) + "}"
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        self.name       = name
+        self.help       = help
+        self.labelnames = tuple(labelnames)
+        self._lock      = threading.Lock()
+
+    def _key(self, labels: Tuple[str, ...]) -> Tuple[str, ...]:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} espera las etiquetas {self.labelnames}")
+        return tuple(str(v) for v in labels)
+
+    def samples(self) -> List[Sample]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """
+    Contador monotónico con etiquetas: counter.inc("vc1", "GET").
+    """
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            items = list(self._values.items())
+        return [(self.name, dict(zip(self.labelnames, k)), v) for k, v in items]
+
+
+class Histogram(_Metric):
+    """
+    Histograma acumulativo con etiquetas: histogram.observe(0.12, "vc1").
+    """
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # por etiquetas: [cuentas por bucket..., +Inf], suma
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        key = self._key(labels)
+        pos = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key) or self._values.setdefault(
+                key, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[pos] += 1
+            total[0] += value
+
+    @contextmanager
+    def time(self, *labels: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def samples(self) -> List[Sample]:
+        out: List[Sample] = []
+        with self._lock:
+            items = [(k, list(c), t[0]) for k, (c, t) in self._values.items()]
+        for key, counts, total in items:
+            labels = dict(zip(self.labelnames, key))
+            running = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                running += count
+                out.append((f"{self.name}_bucket", {**labels, "le": _number(bound)}, running))
+            out.append((f"{self.name}_sum", labels, total))
+            out.append((f"{self.name}_count", labels, running))
+        return out
+
+
+class MetricsRegistry:
+    """
+    Registro de métricas de la aplicación. Los colectores son funciones
+    que devuelven (nombre, tipo, ayuda, [(etiquetas, valor), ...]) y se
+    evalúan en cada scrape.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], Iterable[tuple]]] = []
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            return metric
+
+    def counter(self, name: str, help: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._register(Counter, name, help, labelnames)
+
+    def histogram(self, name: str, help: str, labelnames: Iterable[str] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, help, labelnames, buckets=buckets)
+
+    def collector(self, fn: Callable[[], Iterable[tuple]]) -> Callable[[], Iterable[tuple]]:
+        """Registra un colector (se puede usar como decorador)."""
+        self._collectors.append(fn)
+        return fn
+
+    def render(self) -> str:
+        """
+        Todas las métricas en el formato de texto de Prometheus.
+        """
+        lines: List[str] = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(f"{n}{_labels(l)} {_number(v)}" for n, l, v in metric.samples())
+        for collect in self._collectors:
+            for name, kind, help, values in collect():
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                lines.extend(f"{name}{_labels(l)} {_number(v)}" for l, v in values)
+        return "\n".join(lines) + "\n"
+
+
+# Registro global de la aplicación
+metrics = MetricsRegistry()
+
+
+# —————— Plantillas de endpoint de vCenter ——————
+# Los ids de los recursos se sustituyen por {id} para no crear una serie
+# por VM o red: /rest/vcenter/vm/vm-42/hardware → /rest/vcenter/vm/{id}/hardware
+_ID_SEGMENT = re.compile(r"/(vm|network|host|cluster|datastore|folder|resource-pool)/[^/?]+")
+
+def endpoint_template(path: str) -> str:
+    return _ID_SEGMENT.sub(r"/\1/{id}", path.split("?", 1)[0])
+
+
+# —————— Etapas del refresco del inventario ——————
+refresh_stage_seconds = metrics.histogram(
+    "inventory_refresh_stage_seconds",
+    "Duración de cada etapa de la construcción del inventario",
+    ("vcenter", "stage"),
+)
+
+@contextmanager
+def stage(name: str, vcenter: str = "") -> Iterator[None]:
+    """
+    Mide una etapa del refresco (auth, list, enrichment, placement,
+    network, serialization...) en el histograma y en Server-Timing.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        refresh_stage_seconds.observe(elapsed, vcenter, name)
+        record_timing(name, elapsed)
+
+
+# —————— Server-Timing por petición ——————
+# {fase: [segundos acumulados, número de llamadas]} de la petición en curso;
+# None fuera de una petición o si SERVER_TIMING_ENABLED está desactivado
+_timings: ContextVar[Optional[Dict[str, List[float]]]] = ContextVar("server_timing", default=None)
+
+def start_timing():
+    return _timings.set({})
+
+def finish_timing(token) -> None:
+    _timings.reset(token)
+
+def record_timing(name: str, seconds: float) -> None:
+    """
+    Suma `seconds` a la fase `name` de la petición en curso (si la hay).
+    """
+    timings = _timings.get()
+    if timings is not None:
+        entry = timings.get(name)
+        if entry is None:
+            timings[name] = [seconds, 1]
+        else:
+            entry[0] += seconds
+            entry[1] += 1
+
+@contextmanager
+def timing(name: str) -> Iterator[None]:
+    """
+    Mide un bloque solo para Server-Timing (sin histograma).
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_timing(name, time.perf_counter() - start)
+
+def server_timing_header(total: float) -> str:
+    """
+    Cabecera Server-Timing con la duración total y la de cada fase, p. ej.
+    'app;dur=41.2, vcenter;dur=35.0;desc="3 calls"'.
+    """
+    parts = [f"app;dur={total * 1000:.1f}"]
+    for name, (seconds, calls) in (_timings.get() or {}).items():
+        desc = f';desc="{int(calls)} calls"' if calls > 1 else ""
+        parts.append(f"{name};dur={seconds * 1000:.1f}{desc}")
+    return ", ".join(parts)
+
+
+# —————— Métricas HTTP (middleware ASGI) ——————
+http_requests = metrics.counter(
+    "http_requests_total", "Peticiones HTTP atendidas", ("method", "route", "status"),
+)
+http_seconds = metrics.histogram(
+    "http_request_duration_seconds", "Tiempo hasta el inicio de la respuesta HTTP", ("method", "route"),
+)
+
+class ObservabilityMiddleware:
+    """
+    Middleware ASGI que registra peticiones y latencia por plantilla de
+    ruta y, si `server_timing` está activo, añade la cabecera Server-Timing
+    con el desglose de fases de la petición.
+    """
+
+    def __init__(self, app, server_timing: bool = True):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        token = start_timing() if self.server_timing else None
+        observed = False
+
+        def observe(status: int) -> float:
+            nonlocal observed
+            observed = True
+            elapsed = time.perf_counter() - start
+            route   = scope.get("route")
+            path    = getattr(route, "path", None) or "unmatched"
+            http_requests.inc(scope["method"], path, str(status))
+            http_seconds.observe(elapsed, scope["method"], path)
+            return elapsed
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                elapsed = observe(message["status"])
+                if token is not None:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", server_timing_header(elapsed).encode()))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception:
+            if not observed:
+                observe(500)
+            raise
+        finally:
+            if token is not None:
+                finish_timing(token)
+
+
+# —————— Colector: cachés (app/cache.py) ——————
+_CACHE_COUNTERS = (
+    ("cache_hits_total",          "hits",          "Aciertos positivos por espacio de caché"),
+    ("cache_negative_hits_total", "negative_hits", "Aciertos de entradas negativas por espacio de caché"),
+    ("cache_misses_total",        "misses",        "Fallos por espacio de caché"),
+    ("cache_evictions_total",     "evictions",     "Desalojos por espacio de caché"),
+)
+
+@metrics.collector
+def _cache_metrics():
+    stats = caches.stats()
+    for name, key, help in _CACHE_COUNTERS:
+        yield name, "counter", help, [({"cache": ns}, s[key]) for ns, s in stats.items()]
+    yield "cache_entries", "gauge", "Entradas vigentes por espacio de caché", [
+        ({"cache": ns}, s["entries"]) for ns, s in stats.items()
+    ]
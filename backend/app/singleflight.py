@@ -0,0 +1,172 @@
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+from app.metrics import metrics
+
+# ───────────────────────────────────────────────────────────────────────
+# Agrupación de consultas concurrentes (single-flight)
+# ───────────────────────────────────────────────────────────────────────
+# Cuando varias peticiones piden a la vez lo mismo (el detalle de una VM
+# que abren diez usuarios, su identidad, su ubicación...) solo la primera
+# consulta a vCenter; las demás esperan a esa llamada en curso y reciben
+# su mismo resultado (o su misma excepción). La clave es (operación, id).
+#
+# Sirve tanto a código con hilos (do) como asíncrono (ado), y ambos
+# comparten las llamadas en curso: un hilo puede esperar a una consulta
+# lanzada desde el bucle de eventos y viceversa. No guarda resultados:
+# en cuanto la llamada termina, la siguiente petición consulta de nuevo
+# (o lee la caché que la llamada haya rellenado).
+
+flight_calls = metrics.counter(
+    "singleflight_calls_total",
+    "Llamadas agrupadas por operación: leader consulta a vCenter, shared reutiliza una en curso",
+    ("op", "role"),
+)
+
+
+class _Call:
+    """Una llamada en curso y quienes la esperan."""
+    __slots__ = ("event", "result", "error", "waiters", "threads", "leader_thread", "task")
+
+    def __init__(self):
+        self.event   = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+        self.threads = 0                       # hilos esperando en do()
+        self.leader_thread = False             # la consulta corre en un hilo de do()
+        self.task: Optional[asyncio.Task] = None
+
+    def outcome(self) -> Any:
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+def _resolve(fut: asyncio.Future, call: _Call) -> None:
+    if fut.done():
+        return
+    if isinstance(call.error, asyncio.CancelledError):
+        fut.cancel()
+    elif call.error is not None:
+        fut.set_exception(call.error)
+    else:
+        fut.set_result(call.result)
+
+
+def _op(key: Hashable) -> str:
+    return str(key[0]) if isinstance(key, tuple) and key else str(key)
+
+
+class SingleFlight:
+    """
+    Registro de llamadas en curso por clave:
+      - do(key, fn, *args): versión con hilos; si ya hay una llamada con
+        esa clave espera a que termine en lugar de ejecutar `fn`.
+      - ado(key, fn, *args): versión asíncrona (`fn` devuelve un awaitable).
+        La llamada corre en su propia tarea: si una petición que espera se
+        cancela, las demás siguen esperando; solo si se van todas se
+        cancela también la consulta a vCenter.
+      - forget(*keys): las llamadas en curso dejan de compartirse (p. ej.
+        tras una acción de energía, cuyo resultado ya no sería válido).
+    `fn` no debe volver a pedir su misma clave (se esperaría a sí misma).
+    """
+
+    def __init__(self):
+        self._lock  = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+
+    # —————— Con hilos ——————
+    def do(self, key: Hashable, fn: Callable[..., Any], *args: Any) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                call.leader_thread = True
+            else:
+                call.threads += 1
+        if not leader:
+            flight_calls.inc(_op(key), "shared")
+            call.event.wait()
+            with self._lock:
+                call.threads -= 1
+            return call.outcome()
+
+        flight_calls.inc(_op(key), "leader")
+        try:
+            call.result = fn(*args)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            self._finish(key, call)
+        return call.result
+
+    # —————— Asíncrona ——————
+    async def ado(self, key: Hashable, fn: Callable[..., Awaitable[Any]], *args: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        fut  = loop.create_future()
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            call.waiters.append((loop, fut))
+        if leader:
+            flight_calls.inc(_op(key), "leader")
+            call.task = loop.create_task(self._run(key, call, fn, args))
+        else:
+            flight_calls.inc(_op(key), "shared")
+        try:
+            return await fut
+        except asyncio.CancelledError:
+            self._leave(key, call, loop, fut)
+            raise
+
+    async def _run(self, key: Hashable, call: _Call, fn, args) -> None:
+        try:
+            call.result = await fn(*args)
+        except BaseException as e:
+            call.error = e
+        finally:
+            self._finish(key, call)
+
+    def _leave(self, key: Hashable, call: _Call, loop, fut) -> None:
+        """
+        Una espera asíncrona cancelada se retira; si era la última, no hay
+        hilos esperando y la consulta no corre en un hilo (que no se puede
+        cancelar) se cancela la llamada y se libera la clave.
+        """
+        with self._lock:
+            if (loop, fut) in call.waiters:
+                call.waiters.remove((loop, fut))
+            abandoned = (not call.waiters and not call.threads and not call.leader_thread
+                         and not call.event.is_set())
+            if abandoned and self._calls.get(key) is call:
+                del self._calls[key]
+        if abandoned and call.task is not None:
+            call.task.cancel()
+
+    # —————— Común ——————
+    def _finish(self, key: Hashable, call: _Call) -> None:
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+            waiters, call.waiters = call.waiters, []
+        call.event.set()
+        for loop, fut in waiters:
+            loop.call_soon_threadsafe(_resolve, fut, call)
+
+    def forget(self, *keys: Hashable) -> None:
+        with self._lock:
+            for key in keys:
+                self._calls.pop(key, None)
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+
+# Registro global de la aplicación (claves (operación, id))
+inflight = SingleFlight()
@@ -0,0 +1,337 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+from pyVmomi import vim, vmodl                             # vSphere SDK types
+
+from app.config import COLLECTOR_PAGE_SIZE
+from app.vms.vm_rows import VMRow
+from app.vms.vm_mapping import (
+    COMPAT_MAP, POWER_STATE_MAP, infer_environment,
+    compat_code_from_version, guest_os_from_guest_id, format_disk,
+)
+
+# ───────────────────────────────────────────────────────────────────────
+# Recolección masiva de inventario vía PropertyCollector
+# ───────────────────────────────────────────────────────────────────────
+# En lugar de consultar cada VM por separado, se crea una única
+# ContainerView sobre el rootFolder y se piden todas las propiedades
+# necesarias con RetrievePropertiesEx, paginando con
+# ContinueRetrievePropertiesEx. El coste pasa de O(VMs) a O(páginas).
+
+PC = vmodl.query.PropertyCollector
+
+# Propiedades solicitadas por tipo de objeto gestionado
+VM_PROPERTIES = [
+    "name",
+    "config.template",
+    "config.version",
+    "config.guestId",
+    "config.hardware.numCPU",
+    "config.hardware.memoryMB",
+    "config.hardware.device",
+    "guest.ipAddress",
+    "runtime.powerState",
+    "runtime.host",
+]
+HOST_PROPERTIES    = ["name", "parent"]
+COMPUTE_PROPERTIES = ["name"]
+NETWORK_PROPERTIES = ["name"]
+
+# Redes de todos los tipos (inventario y NetworkResolver de vm_networks).
+# Los subtipos van primero: además del nombre se pide su clave de
+# portgroup o su summary (que incluye el id de la red opaca, que es lo
+# que aparece en el backing de las NICs conectadas a NSX-T).
+NETWORK_TYPES = {
+    vim.dvs.DistributedVirtualPortgroup: ["name", "key"],
+    vim.OpaqueNetwork:                   ["name", "summary"],
+    vim.Network:                         NETWORK_PROPERTIES,
+}
+
+INVENTORY_TYPES = {
+    vim.VirtualMachine:  VM_PROPERTIES,
+    vim.HostSystem:      HOST_PROPERTIES,
+    vim.ComputeResource: COMPUTE_PROPERTIES,
+    **NETWORK_TYPES,
+}
+
+# Subconjunto mínimo para el índice de ubicación VM → host → cluster
+PLACEMENT_TYPES = {
+    vim.VirtualMachine:  ["runtime.host"],
+    vim.HostSystem:      HOST_PROPERTIES,
+    vim.ComputeResource: COMPUTE_PROPERTIES,
+}
+
+# Objetos recolectados: tipo → moId → {propiedad: valor}
+Objects = Dict[str, Dict[str, Dict[str, Any]]]
+
+def view_filter_spec(view, types_props: Dict[type, List[str]]) -> "PC.FilterSpec":
+    """
+    Construye un FilterSpec que recorre la ContainerView indicada
+    y solicita, para cada tipo, solo las propiedades listadas.
+    """
+    traversal = PC.TraversalSpec(
+        name="traverseView", type=vim.view.ContainerView, path="view", skip=False
+    )
+    obj_spec = PC.ObjectSpec(obj=view, skip=True, selectSet=[traversal])
+    prop_specs = [
+        PC.PropertySpec(type=t, pathSet=props, all=False)
+        for t, props in types_props.items()
+    ]
+    return PC.FilterSpec(objectSet=[obj_spec], propSet=prop_specs)
+
+def type_key(obj) -> str:
+    """
+    Clasifica un ManagedObject en la categoría usada por `Objects`.
+    """
+    if isinstance(obj, vim.VirtualMachine):  return "vm"
+    if isinstance(obj, vim.HostSystem):      return "host"
+    if isinstance(obj, vim.ComputeResource): return "compute"
+    if isinstance(obj, vim.Network):         return "network"
+    return "other"
+
+def add_object_content(objects: Objects, oc) -> None:
+    """
+    Incorpora un ObjectContent (objeto + propSet) al diccionario de objetos.
+    """
+    props = objects.setdefault(type_key(oc.obj), {}).setdefault(oc.obj._moId, {})
+    for p in oc.propSet or []:
+        props[p.name] = p.val
+
+def retrieve_objects(
+    content,
+    types_props: Dict[type, List[str]] = INVENTORY_TYPES,
+    page_size: int = COLLECTOR_PAGE_SIZE,
+) -> Objects:
+    """
+    Recupera en bloque las propiedades de todos los objetos de los tipos indicados:
+      1. Crea una ContainerView recursiva sobre el rootFolder.
+      2. Ejecuta RetrievePropertiesEx con tamaño de página configurable.
+      3. Continúa con ContinueRetrievePropertiesEx mientras haya token.
+      4. Destruye la vista y devuelve los objetos agrupados por tipo.
+    """
+    view = content.viewManager.CreateContainerView(
+        content.rootFolder, list(types_props.keys()), True
+    )
+    collector = content.propertyCollector
+    objects: Objects = {"vm": {}, "host": {}, "compute": {}, "network": {}}
+    try:
+        spec   = view_filter_spec(view, types_props)
+        result = collector.RetrievePropertiesEx(
+            specSet=[spec], options=PC.RetrieveOptions(maxObjects=page_size)
+        )
+        while result:
+            for oc in result.objects:
+                add_object_content(objects, oc)
+            if not result.token:
+                break
+            result = collector.ContinueRetrievePropertiesEx(token=result.token)
+    finally:
+        view.Destroy()
+    return objects
+
+def retrieve_properties(content, obj, props: List[str]) -> Dict[str, Any]:
+    """
+    Recupera propiedades de un único objeto gestionado en una sola llamada.
+    Devuelve {} si el objeto ya no existe en el inventario.
+    """
+    spec = PC.FilterSpec(
+        objectSet=[PC.ObjectSpec(obj=obj, skip=False)],
+        propSet=[PC.PropertySpec(type=type(obj), pathSet=props, all=False)],
+    )
+    try:
+        result = content.propertyCollector.RetrievePropertiesEx(
+            specSet=[spec], options=PC.RetrieveOptions()
+        )
+    except vmodl.fault.ManagedObjectNotFound:
+        return {}
+    if not result or not result.objects:
+        return {}
+    return {p.name: p.val for p in result.objects[0].propSet or []}
+
+def collect_network_names(content) -> Dict[str, str]:
+    """
+    Nombres de todas las redes (estándar, portgroups distribuidos y redes
+    opacas) en una sola pasada paginada, indexados por moRef (el id REST)
+    y también por clave de portgroup e id de red opaca, que son los que
+    aparecen en los backings de las NICs.
+    """
+    names: Dict[str, str] = {}
+    for moid, props in retrieve_objects(content, NETWORK_TYPES)["network"].items():
+        name = props.get("name")
+        if not name:
+            continue
+        names[moid] = name
+        for alias in _network_aliases(props):
+            names[alias] = name
+    return names
+
+def _network_aliases(props: Dict[str, Any]) -> List[str]:
+    """Clave de portgroup e id de red opaca de una red (si los tiene)."""
+    return [a for a in (props.get("key"), getattr(props.get("summary"), "opaqueNetworkId", None)) if a]
+
+def network_by_alias(objects: Objects) -> Dict[str, Dict[str, Any]]:
+    """
+    Redes recolectadas indexadas por clave de portgroup e id de red opaca.
+    Se calcula una vez y se guarda en `objects["network_alias"]`; quien
+    modifique las redes de `objects` (vm_sync) debe descartarlo.
+    """
+    aliases = objects.get("network_alias")
+    if aliases is None:
+        aliases = objects["network_alias"] = {
+            alias: props for props in objects["network"].values() for alias in _network_aliases(props)
+        }
+    return aliases
+
+def _moid(ref) -> str:
+    """
+    Devuelve el moId de una referencia gestionada o "" si no existe.
+    """
+    return getattr(ref, "_moId", "") if ref is not None else ""
+
+def resolve_placement(vm_props: Dict[str, Any], objects: Objects) -> Tuple[str, str]:
+    """
+    Resuelve host y cluster de una VM a partir de los objetos ya recolectados.
+    """
+    host_name, clus_name = "<sin datos host>", "<sin datos cluster>"
+    host = objects["host"].get(_moid(vm_props.get("runtime.host")))
+    if host:
+        host_name = host.get("name", host_name)
+        compute = objects["compute"].get(_moid(host.get("parent")))
+        if compute:
+            clus_name = compute.get("name", clus_name)
+    return host_name, clus_name
+
+def build_placement_index(objects: Objects, id_prefix: str = "") -> Dict[str, Tuple[str, str]]:
+    """
+    Construye en una sola pasada el índice id de VM → (host, cluster)
+    usando los hosts y clusters ya recolectados (cada nombre se obtiene una vez).
+    Los ids son moIds, con `id_prefix` delante si hay varios vCenter.
+    """
+    return {
+        id_prefix + vm_id: resolve_placement(props, objects)
+        for vm_id, props in objects["vm"].items()
+    }
+
+def retrieve_vm_placement(content, vm_id: str) -> Tuple[str, str]:
+    """
+    Refresco dirigido de la ubicación de una sola VM:
+    VM → runtime.host → host (name, parent) → cluster (name).
+    """
+    stub = content.propertyCollector._stub
+    objects: Objects = {"vm": {}, "host": {}, "compute": {}, "network": {}}
+    vm_props = retrieve_properties(content, vim.VirtualMachine(vm_id, stub), ["runtime.host"])
+    host_ref = vm_props.get("runtime.host")
+    if host_ref is not None:
+        host_props = retrieve_properties(content, host_ref, HOST_PROPERTIES)
+        objects["host"][_moid(host_ref)] = host_props
+        parent = host_props.get("parent")
+        if isinstance(parent, vim.ComputeResource):
+            objects["compute"][_moid(parent)] = retrieve_properties(
+                content, parent, COMPUTE_PROPERTIES
+            )
+    return resolve_placement(vm_props, objects)
+
+def _backing_network(backing, objects: Objects) -> str:
+    """
+    Traduce el backing de una NIC virtual al nombre de la red conectada.
+    """
+    networks = objects["network"]
+    if isinstance(backing, vim.vm.device.VirtualEthernetCard.DistributedVirtualPortBackingInfo):
+        key = getattr(backing.port, "portgroupKey", None)
+        net = networks.get(key) or network_by_alias(objects).get(key) or {}
+        return net.get("name") or key or ""
+    if isinstance(backing, vim.vm.device.VirtualEthernetCard.OpaqueNetworkBackingInfo):
+        net = network_by_alias(objects).get(backing.opaqueNetworkId) or {}
+        return net.get("name") or backing.opaqueNetworkId or ""
+    net = networks.get(_moid(getattr(backing, "network", None)))
+    if net and net.get("name"):
+        return net["name"]
+    return getattr(backing, "deviceName", "") or ""
+
+def build_vm(
+    vm_id: str,
+    props: Dict[str, Any],
+    objects: Objects,
+    vcenter: Optional[str] = None,
+    id_prefix: str = "",
+) -> VMRow:
+    """
+    Construye la fila compacta de una VM (ver vm_rows) a partir de las propiedades SOAP recolectadas:
+    recursos, compatibilidad, guest OS, IP, discos, NICs, redes y ubicación.
+    `vcenter` y `id_prefix` identifican el vCenter de origen.
+    """
+    vm_name = props.get("name") or f"<sin nombre {vm_id}>"
+
+    compat_code  = compat_code_from_version(props.get("config.version"))
+    compat_human = COMPAT_MAP.get(compat_code, compat_code)
+
+    host_name, cluster_name = resolve_placement(props, objects)
+
+    ips = []
+    if props.get("guest.ipAddress"):
+        ips.append(props["guest.ipAddress"])
+
+    disks, nics, networks = [], [], []
+    for dev in props.get("config.hardware.device") or []:
+        if isinstance(dev, vim.vm.device.VirtualDisk):
+            size = format_disk(dev.capacityInBytes or (dev.capacityInKB or 0) * 1024)
+            if size:
+                disks.append(size)
+        elif isinstance(dev, vim.vm.device.VirtualEthernetCard):
+            label = getattr(dev.deviceInfo, "label", None)
+            if label:
+                nics.append(label)
+            net_name = _backing_network(dev.backing, objects)
+            if net_name:
+                networks.append(net_name)
+
+    if not networks:
+        networks = ["<sin datos>"]
+
+    return VMRow(
+        id                  = id_prefix + vm_id,
+        vcenter             = vcenter,
+        name                = vm_name,
+        power_state         = POWER_STATE_MAP.get(props.get("runtime.powerState"), "unknown"),
+        cpu_count           = props.get("config.hardware.numCPU") or 0,
+        memory_size_MiB     = props.get("config.hardware.memoryMB") or 0,
+        environment         = infer_environment(vm_name),
+        guest_os            = guest_os_from_guest_id(props.get("config.guestId")),
+        host                = host_name,
+        cluster             = cluster_name,
+        compatibility_code  = compat_code,
+        compatibility_human = compat_human,
+        networks            = networks,
+        ip_addresses        = ips,
+        disks               = disks,
+        nics                = nics,
+    )
+
+def build_vms(objects: Objects, vcenter: Optional[str] = None, id_prefix: str = "") -> List[VMRow]:
+    """
+    Construye en memoria las filas de todas las VMs, omitiendo plantillas
+    (la API REST /vcenter/vm tampoco las lista).
+    """
+    return [
+        build_vm(vm_id, props, objects, vcenter, id_prefix)
+        for vm_id, props in objects["vm"].items()
+        if not props.get("config.template")
+    ]
+
+def collect_inventory(
+    content,
+    vcenter: Optional[str] = None,
+    id_prefix: str = "",
+) -> Tuple[List[VMRow], Dict[str, Tuple[str, str]]]:
+    """
+    Recolecta el inventario completo con una sola vista y
+    RetrievePropertiesEx paginado. Devuelve la lista de filas
+    y el índice de ubicación de todas las VMs.
+    """
+    objects = retrieve_objects(content)
+    return build_vms(objects, vcenter, id_prefix), build_placement_index(objects, id_prefix)
+
+def collect_placement(content, id_prefix: str = "") -> Dict[str, Tuple[str, str]]:
+    """
+    Recolecta solo la ubicación (host/cluster) de todas las VMs en una pasada.
+    """
+    return build_placement_index(retrieve_objects(content, PLACEMENT_TYPES), id_prefix)
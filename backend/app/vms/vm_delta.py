@@ -0,0 +1,162 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+from app.cache import caches
+from app.config import INVENTORY_HISTORY_SIZE
+from app.vms.vm_rows import VMRow
+from app.vms.vm_inventory import InventorySnapshot
+from app.vms.vm_index import index_for
+from app.vms.vm_query import VMFilters, select, order_positions, project
+
+# ───────────────────────────────────────────────────────────────────────
+# Versionado (ETag) y deltas entre snapshots de inventario
+# ───────────────────────────────────────────────────────────────────────
+def snapshot_etag(snapshot: InventorySnapshot) -> str:
+    """
+    ETag del snapshot. Incluye la hora de construcción para que un
+    reinicio sin persistencia (que vuelve a empezar en v1) no
+    reutilice etiquetas de snapshots distintos.
+    """
+    return f'"{snapshot.version}-{int(snapshot.built_at * 1000):x}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Evalúa la cabecera If-None-Match (lista de etiquetas, '*' o
+    etiquetas débiles W/"...") contra el ETag vigente.
+    """
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+class SnapshotDiff(NamedTuple):
+    """
+    Diferencias por id de VM entre dos versiones del inventario.
+    """
+    added:   Set[str]
+    changed: Set[str]
+    removed: Set[str]
+
+
+class SnapshotHistory:
+    """
+    Guarda, para las últimas versiones publicadas, una huella por VM
+    (id → hash de su JSON) y calcula con ellas los deltas entre una
+    versión antigua y la actual sin retener los snapshots completos.
+
+    Las VMs que la sincronización reutiliza sin cambios (mismo objeto)
+    conservan su huella, así que solo se recalculan las modificadas.
+    """
+
+    def __init__(self, size: int = INVENTORY_HISTORY_SIZE):
+        self.size = size
+        self._lock = threading.Lock()
+        self._prints: "OrderedDict[int, Dict[str, int]]" = OrderedDict()
+        self._last: Dict[str, VMRow] = {}
+        self._diffs = caches.namespace("snapshot_diffs", maxsize=64, ttl=None)
+
+    def record(self, snapshot: InventorySnapshot) -> None:
+        """
+        Listener del InventoryStore: registra las huellas del snapshot nuevo.
+        """
+        with self._lock:
+            if self._prints and snapshot.version <= next(reversed(self._prints)):
+                # Numeración reiniciada o reutilizada (otro líder): las
+                # huellas antiguas ya no corresponden a esas versiones
+                self._prints.clear()
+                self._diffs.clear()
+            prev_prints = next(reversed(self._prints.values()), {})
+            prints: Dict[str, int] = {}
+            objects: Dict[str, VMRow] = {}
+            for vm in snapshot.vms:
+                if self._last.get(vm.id) is vm and vm.id in prev_prints:
+                    prints[vm.id] = prev_prints[vm.id]
+                else:
+                    prints[vm.id] = hash(vm.values())
+                objects[vm.id] = vm
+            self._last = objects
+            self._prints[snapshot.version] = prints
+            while len(self._prints) > self.size:
+                self._prints.popitem(last=False)
+
+    def diff(self, since: int, snapshot: InventorySnapshot) -> Optional[SnapshotDiff]:
+        """
+        Delta entre la versión `since` y el snapshot dado, o None si esa
+        versión ya no está en el historial (el cliente debe recargar todo).
+        """
+        if since == snapshot.version:
+            return SnapshotDiff(set(), set(), set())
+        key = (since, snapshot.serial)
+        cached = self._diffs.get(key)
+        if cached is not None:
+            return cached
+        with self._lock:
+            old = self._prints.get(since)
+            new = self._prints.get(snapshot.version)
+        if old is None or new is None:
+            return None
+        result = SnapshotDiff(
+            added   = new.keys() - old.keys(),
+            changed = {i for i in new.keys() & old.keys() if new[i] != old[i]},
+            removed = old.keys() - new.keys(),
+        )
+        self._diffs[key] = result
+        return result
+
+    def versions(self) -> List[int]:
+        with self._lock:
+            return list(self._prints)
+
+
+def delta_payload(
+    snapshot: InventorySnapshot,
+    since: int,
+    diff: Optional[SnapshotDiff],
+    filters: VMFilters,
+    keys: Tuple[Tuple[str, bool], ...] = (),
+    fields: Optional[Set[str]] = None,
+) -> dict:
+    """
+    Cuerpo de la respuesta delta de GET /api/vms?since=<versión>:
+    - added/changed : VMs (proyectadas) que el cliente debe insertar o
+      actualizar; una VM que pasa a cumplir los filtros llega en changed.
+    - removed       : ids a eliminar, incluidas las que dejan de cumplir
+      los filtros.
+    - reset         : True si `since` ya no está en el historial; en ese
+      caso added trae el listado completo y el cliente lo sustituye.
+    """
+    if diff is None:
+        return {
+            "version": snapshot.version,
+            "since":   since,
+            "reset":   True,
+            "added":   project([snapshot.vms[p] for p in select(snapshot, filters, keys)], fields),
+            "changed": [],
+            "removed": [],
+        }
+
+    index   = index_for(snapshot)
+    matched = filters.apply(snapshot)
+
+    def positions(ids: Set[str]) -> List[int]:
+        pos = (index.by_id[i] for i in ids)
+        if matched is not None:
+            pos = (p for p in pos if p in matched)
+        return order_positions(snapshot, pos, keys)
+
+    left = set()
+    if matched is not None:
+        left = {i for i in diff.changed if index.by_id[i] not in matched}
+    return {
+        "version": snapshot.version,
+        "since":   since,
+        "reset":   False,
+        "added":   project([snapshot.vms[p] for p in positions(diff.added)], fields),
+        "changed": project([snapshot.vms[p] for p in positions(diff.changed)], fields),
+        "removed": sorted(diff.removed | left),
+    }
@@ -0,0 +1,157 @@
+import asyncio
+import json
+import threading
+from typing import AsyncIterator, Optional, Set
+
+from app.config import INVENTORY_EVENTS_QUEUE, INVENTORY_EVENTS_HEARTBEAT_SECONDS
+from app.vms.vm_inventory import InventorySnapshot
+from app.vms.vm_delta import SnapshotDiff, SnapshotHistory
+from app.vms.vm_index import index_for
+
+# ───────────────────────────────────────────────────────────────────────
+# Difusión de cambios del inventario por Server-Sent Events
+# ───────────────────────────────────────────────────────────────────────
+# Cada snapshot nuevo se compara una sola vez con el anterior y el
+# mensaje resultante (ya codificado) se reparte a todos los clientes
+# conectados: N paneles abiertos cuestan un diff, no N consultas.
+
+def encode_event(event: str, data: dict, event_id: Optional[int] = None) -> bytes:
+    """
+    Codifica un mensaje SSE (event/id/data) listo para enviar.
+    """
+    head = f"event: {event}\n"
+    if event_id is not None:
+        head += f"id: {event_id}\n"
+    return (head + "data: " + json.dumps(data, separators=(",", ":")) + "\n\n").encode()
+
+def delta_event(snapshot: InventorySnapshot, since: int, diff: SnapshotDiff) -> bytes:
+    """
+    Mensaje 'delta' con el mismo formato que GET /api/vms?since=
+    (added/changed con la VM completa, removed con ids).
+    """
+    index = index_for(snapshot)
+    vms   = snapshot.vms
+    return encode_event("delta", {
+        "version": snapshot.version,
+        "since":   since,
+        "added":   [vms[index.by_id[i]].as_dict() for i in sorted(diff.added)],
+        "changed": [vms[index.by_id[i]].as_dict() for i in sorted(diff.changed)],
+        "removed": sorted(diff.removed),
+    }, snapshot.version)
+
+def reset_event(snapshot: InventorySnapshot) -> bytes:
+    """
+    Mensaje 'reset': el cliente debe recargar el listado completo
+    (versión desconocida o cola desbordada).
+    """
+    return encode_event("reset", {"version": snapshot.version}, snapshot.version)
+
+
+class _Client:
+    """Conexión SSE: cola asyncio propia y el bucle de eventos que la atiende."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, size: int):
+        self.loop  = loop
+        self.queue: "asyncio.Queue[bytes]" = asyncio.Queue(maxsize=size)
+
+    def offer(self, message: bytes, reset: bytes) -> None:
+        """
+        Encola un mensaje (en el hilo del bucle). Si el cliente va tan
+        atrasado que la cola está llena, descarta lo pendiente y le pide
+        una recarga completa en lugar de bloquear al resto.
+        """
+        if self.queue.full():
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            message = reset
+        self.queue.put_nowait(message)
+
+
+class InventoryEvents:
+    """
+    Difusor de cambios del inventario:
+      1. Se suscribe al InventoryStore (después de SnapshotHistory).
+      2. Por cada snapshot calcula el delta contra el anterior y lo
+         codifica una sola vez.
+      3. Lo entrega a la cola de cada cliente conectado; cada conexión
+         SSE solo consume de su cola.
+    """
+
+    def __init__(
+        self,
+        history: SnapshotHistory,
+        queue_size: int = INVENTORY_EVENTS_QUEUE,
+        heartbeat: float = INVENTORY_EVENTS_HEARTBEAT_SECONDS,
+    ):
+        self.history    = history
+        self.queue_size = queue_size
+        self.heartbeat  = heartbeat
+        self._lock      = threading.Lock()
+        self._clients:   Set[_Client] = set()
+        self._snapshot:  Optional[InventorySnapshot] = None
+        self.broadcasts = 0
+        self.resets     = 0
+
+    def on_snapshot(self, snapshot: InventorySnapshot) -> None:
+        """
+        Listener del InventoryStore: difunde el delta del snapshot nuevo.
+        """
+        with self._lock:
+            previous, self._snapshot = self._snapshot, snapshot
+            clients = list(self._clients)
+        if not clients:
+            return
+        diff = self.history.diff(previous.version, snapshot) if previous else None
+        if diff is None:
+            message = reset_event(snapshot)
+        elif diff.added or diff.changed or diff.removed:
+            message = delta_event(snapshot, previous.version, diff)
+        else:
+            return
+        reset = reset_event(snapshot)
+        self.broadcasts += 1
+        for client in clients:
+            client.loop.call_soon_threadsafe(client.offer, message, reset)
+
+    async def stream(self, is_disconnected, last_event_id: Optional[str] = None) -> AsyncIterator[bytes]:
+        """
+        Generador de una conexión SSE:
+        - Al conectar envía 'hello' con la versión vigente o, si el
+          navegador reconecta con Last-Event-ID, el delta pendiente
+          desde esa versión (o un 'reset' si ya no está en el historial).
+        - Después reenvía los mensajes difundidos y un comentario
+          keep-alive cada `heartbeat` segundos.
+        """
+        client = _Client(asyncio.get_running_loop(), self.queue_size)
+        with self._lock:
+            self._clients.add(client)
+            snapshot = self._snapshot
+        try:
+            yield b"retry: 5000\n\n"
+            if snapshot is not None:
+                yield self._greeting(snapshot, last_event_id)
+            while True:
+                try:
+                    message = await asyncio.wait_for(client.queue.get(), self.heartbeat)
+                except asyncio.TimeoutError:
+                    if await is_disconnected():
+                        break
+                    message = b": ping\n\n"
+                if message.startswith(b"event: reset"):
+                    self.resets += 1
+                yield message
+        finally:
+            with self._lock:
+                self._clients.discard(client)
+
+    def _greeting(self, snapshot: InventorySnapshot, last_event_id: Optional[str]) -> bytes:
+        if last_event_id and last_event_id.isdigit() and int(last_event_id) != snapshot.version:
+            since = int(last_event_id)
+            diff  = self.history.diff(since, snapshot)
+            return reset_event(snapshot) if diff is None else delta_event(snapshot, since, diff)
+        return encode_event("hello", {"version": snapshot.version}, snapshot.version)
+
+    def status(self) -> dict:
+        with self._lock:
+            clients = len(self._clients)
+        return {"clients": clients, "broadcasts": self.broadcasts, "resets": self.resets}
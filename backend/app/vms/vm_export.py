@@ -0,0 +1,72 @@
+import csv
+import io
+import json
+import zlib
+from typing import Iterable, Iterator, Sequence
+
+from app.vms.vm_rows import VM_FIELDS, VMRow
+
+# ───────────────────────────────────────────────────────────────────────
+# Exportación en streaming (CSV / NDJSON) desde el snapshot
+# ───────────────────────────────────────────────────────────────────────
+EXPORT_FIELDS = VM_FIELDS
+EXPORT_MEDIA  = {"csv": "text/csv; charset=utf-8", "ndjson": "application/x-ndjson"}
+
+# Filas agrupadas por bloque emitido (menos escrituras al socket)
+_CHUNK_ROWS = 500
+
+def _csv_value(value) -> str:
+    if isinstance(value, tuple):
+        return ";".join(value)
+    return "" if value is None else str(value)
+
+def iter_csv(vms: Sequence[VMRow], positions: Iterable[int]) -> Iterator[bytes]:
+    """
+    Genera el CSV por bloques: cabecera y luego filas, sin construir
+    el documento completo en memoria. Las listas se unen con ';'.
+    """
+    buf    = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(EXPORT_FIELDS)
+    rows = 0
+    for p in positions:
+        vm = vms[p]
+        writer.writerow([_csv_value(getattr(vm, f)) for f in EXPORT_FIELDS])
+        rows += 1
+        if rows % _CHUNK_ROWS == 0:
+            yield buf.getvalue().encode()
+            buf.seek(0)
+            buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode()
+
+def iter_ndjson(vms: Sequence[VMRow], positions: Iterable[int]) -> Iterator[bytes]:
+    """
+    Genera una línea JSON por VM, agrupando las líneas en bloques.
+    """
+    chunk = []
+    for p in positions:
+        chunk.append(json.dumps(vms[p].as_dict(), ensure_ascii=False, separators=(",", ":")))
+        if len(chunk) == _CHUNK_ROWS:
+            yield ("\n".join(chunk) + "\n").encode()
+            chunk = []
+    if chunk:
+        yield ("\n".join(chunk) + "\n").encode()
+
+def iter_gzip(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """
+    Comprime en streaming (formato gzip) los bloques de otro generador.
+    """
+    z = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        out = z.compress(chunk)
+        if out:
+            yield out
+    yield z.flush()
+
+def export_stream(fmt: str, vms: Sequence[VMRow], positions: Iterable[int], gzip: bool = False) -> Iterator[bytes]:
+    """
+    Selecciona el generador del formato pedido y, opcionalmente, lo comprime.
+    """
+    stream = iter_csv(vms, positions) if fmt == "csv" else iter_ndjson(vms, positions)
+    return iter_gzip(stream) if gzip else stream
@@ -0,0 +1,172 @@
+import copy
+import threading
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from app.cache import caches
+from app.metrics import stage
+
+from app.vms.vm_rows import VMRow
+from app.vms.vm_inventory import InventorySnapshot
+
+# ───────────────────────────────────────────────────────────────────────
+# Índices en memoria sobre el snapshot de inventario
+# ───────────────────────────────────────────────────────────────────────
+# Se construyen una vez por snapshot. Las posiciones son índices en
+# snapshot.vms, de modo que cualquier filtro se resuelve intersecando
+# conjuntos en lugar de recorrer la lista completa. Un snapshot que solo
+# cambia algunas filas en su sitio (p. ej. un parche tras una acción de
+# energía) deriva su índice del anterior en vez de reconstruirlo.
+
+# Filas cambiadas por encima de las cuales compensa reconstruir el índice
+DERIVE_MAX_CHANGES = 256
+
+# Campos con índice invertido (valor en minúsculas → posiciones)
+INDEXED_FIELDS = ("vcenter", "environment", "host", "cluster", "networks", "guest_os", "power_state")
+
+def _trigrams(text: str) -> Set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _keys(value) -> List[str]:
+    """Claves del índice invertido de un valor (tupla para campos multivalor)."""
+    return [v.lower() for v in (value if isinstance(value, tuple) else (value,)) if v is not None]
+
+
+class _SubstringIndex:
+    """
+    Índice de trigramas para búsquedas por subcadena (insensible a mayúsculas).
+    Cada documento puede tener varios textos (p. ej. varias IPs).
+    """
+
+    def __init__(self, docs: List[List[str]]):
+        self.docs = [[t.lower() for t in texts] for texts in docs]
+        self.grams: Dict[str, Set[int]] = defaultdict(set)
+        for pos, texts in enumerate(self.docs):
+            for text in texts:
+                for gram in _trigrams(text):
+                    self.grams[gram].add(pos)
+
+    def search(self, term: str) -> Set[int]:
+        term = term.lower()
+        if len(term) < 3:
+            candidates: Iterable[int] = range(len(self.docs))
+        else:
+            postings = sorted((self.grams.get(g, set()) for g in _trigrams(term)), key=len)
+            if not postings[0]:
+                return set()
+            candidates = set.intersection(*postings)
+        # Verificación final: los trigramas solo garantizan candidatos
+        return {p for p in candidates if any(term in t for t in self.docs[p])}
+
+
+class InventoryIndex:
+    """
+    Índices de un snapshot:
+    - by_id    : id de VM → posición.
+    - inverted : campo → valor (minúsculas) → posiciones.
+    - names/ips: índices de trigramas para búsqueda por subcadena.
+    """
+
+    def __init__(self, vms: List[VMRow]):
+        self.size  = len(vms)
+        self.by_id = {vm.id: pos for pos, vm in enumerate(vms)}
+        self.inverted: Dict[str, Dict[str, Set[int]]] = {f: defaultdict(set) for f in INDEXED_FIELDS}
+        for pos, vm in enumerate(vms):
+            for field in INDEXED_FIELDS:
+                for key in _keys(getattr(vm, field)):
+                    self.inverted[field][key].add(pos)
+        self.names = _SubstringIndex([[vm.name] for vm in vms])
+        self.ips   = _SubstringIndex([vm.ip_addresses for vm in vms])
+
+    def derive(self, old: List[VMRow], vms: List[VMRow]) -> Optional["InventoryIndex"]:
+        """
+        Índice de `vms` a partir de este (construido sobre `old`) cuando
+        ambos tienen las mismas VMs en las mismas posiciones y solo cambian
+        unas pocas filas. Comparte todo lo que no cambia (copia al escribir);
+        None si no es el caso y hay que reconstruirlo.
+        """
+        if len(vms) != self.size or len(old) != self.size:
+            return None
+        changed = [p for p, (a, b) in enumerate(zip(old, vms)) if a is not b]
+        if len(changed) > DERIVE_MAX_CHANGES or any(old[p].id != vms[p].id for p in changed):
+            return None
+
+        new = copy.copy(self)
+        new.inverted = dict(self.inverted)
+        for field in INDEXED_FIELDS:
+            touched = [p for p in changed if getattr(old[p], field) != getattr(vms[p], field)]
+            if not touched:
+                continue
+            postings = new.inverted[field] = defaultdict(set, self.inverted[field])
+            for p in touched:
+                for key in _keys(getattr(old[p], field)):
+                    positions = postings[key] = postings[key] - {p}
+                    if not positions:
+                        del postings[key]
+                for key in _keys(getattr(vms[p], field)):
+                    postings[key] = postings.get(key, set()) | {p}
+        if any(old[p].name != vms[p].name for p in changed):
+            new.names = _SubstringIndex([[vm.name] for vm in vms])
+        if any(old[p].ip_addresses != vms[p].ip_addresses for p in changed):
+            new.ips = _SubstringIndex([vm.ip_addresses for vm in vms])
+        return new
+
+    def lookup(self, field: str, values: str) -> Set[int]:
+        """
+        Posiciones cuyo campo coincide con alguno de los valores
+        (separados por comas, sin distinguir mayúsculas).
+        """
+        index = self.inverted[field]
+        out: Set[int] = set()
+        for v in values.split(","):
+            out |= index.get(v.strip().lower(), set())
+        return out
+
+    def query(
+        self,
+        name: Optional[str] = None,
+        q: Optional[str] = None,
+        **fields: Optional[str],
+    ) -> Optional[Set[int]]:
+        """
+        Resuelve todos los filtros intersecando conjuntos de posiciones.
+        Devuelve None si no se aplicó ningún filtro (todas las VMs).
+        """
+        sets: List[Set[int]] = []
+        for field, value in fields.items():
+            if value:
+                sets.append(self.lookup(field, value))
+        if name:
+            sets.append(self.names.search(name))
+        if q:
+            sets.append(self.names.search(q) | self.ips.search(q))
+        if not sets:
+            return None
+        sets.sort(key=len)
+        return set.intersection(*sets) if sets[0] else set()
+
+
+# Índices por snapshot (serial)
+_indexes = caches.namespace("index", maxsize=4, ttl=None)
+_lock    = threading.Lock()
+# Último índice construido y las filas sobre las que se construyó
+_last: Optional[Tuple[List[VMRow], InventoryIndex]] = None
+
+def index_for(snapshot: InventorySnapshot) -> InventoryIndex:
+    """
+    Devuelve (construyéndolo una sola vez) el índice del snapshot.
+    """
+    global _last
+    index = _indexes.get(snapshot.serial)
+    if index is None:
+        with _lock:
+            index = _indexes.get(snapshot.serial)
+            if index is None:
+                with stage("index"):
+                    index = _last[1].derive(_last[0], snapshot.vms) if _last else None
+                    if index is None:
+                        index = InventoryIndex(snapshot.vms)
+                    _indexes[snapshot.serial] = index
+                    _last = (snapshot.vms, index)
+    return index
@@ -0,0 +1,440 @@
+import asyncio
+import itertools
+import logging
+import time
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from app.config import INVENTORY_PERSIST_MIN_SECONDS
+from app.metrics import metrics
+
+from app.vms.vm_models import VMBase
+from app.vms.vm_rows import VMRow, compact_vms
+
+log = logging.getLogger(__name__)
+
+refresh_seconds = metrics.histogram(
+    "inventory_refresh_duration_seconds", "Duración de los refrescos completos del inventario",
+)
+refreshes = metrics.counter(
+    "inventory_refreshes_total", "Refrescos completos del inventario por resultado", ("outcome",),
+)
+publishes = metrics.counter(
+    "inventory_publishes_total", "Snapshots publicados (refresco, sincronización o parche)",
+)
+
+# ───────────────────────────────────────────────────────────────────────
+# Snapshot de inventario con refresco en segundo plano
+# ───────────────────────────────────────────────────────────────────────
+# Identidad local de cada snapshot construido o cargado en este proceso
+_serials = itertools.count(1)
+
+@dataclass
+class InventorySnapshot:
+    """
+    Fotografía inmutable del inventario:
+    - vms      : Filas compactas de las VMs (ver vm_rows); los VMBase
+                 recibidos se convierten al construir el snapshot.
+    - version  : Contador monotónico que identifica el snapshot.
+    - built_at : Marca de tiempo (epoch) en que se construyó.
+    - serial   : Identidad del objeto en este proceso. Las cachés
+                 derivadas (índice, filas codificadas, páginas, orden,
+                 estadísticas) se indexan por ella: la versión sola puede
+                 repetirse con otro contenido tras un cambio de líder.
+    """
+    vms: List[VMRow]
+    version: int
+    built_at: float = field(default_factory=time.time)
+    serial: int = field(init=False, default=0)
+
+    def __post_init__(self):
+        self.vms = compact_vms(self.vms)
+        self.serial = next(_serials)
+
+    @property
+    def age(self) -> float:
+        """Segundos transcurridos desde que se construyó el snapshot."""
+        return max(0.0, time.time() - self.built_at)
+
+
+class _Flight:
+    """Reconstrucción en curso a la que se suman los llamadores concurrentes."""
+    def __init__(self):
+        self.done  = threading.Event()
+        self.error: Optional[BaseException] = None
+
+
+class InventoryStore:
+    """
+    Mantiene el último snapshot bueno del inventario:
+      1. Un hilo en segundo plano lo reconstruye cada `interval` segundos.
+      2. El nuevo snapshot sustituye al anterior de forma atómica.
+      3. Las lecturas siempre se sirven del último snapshot disponible.
+      4. Las reconstrucciones concurrentes se agrupan en una sola.
+      5. Opcionalmente persiste cada snapshot y, tras un reinicio, sirve
+         el último persistido mientras se refresca en segundo plano.
+    """
+
+    def __init__(self, loader: Callable[[], List[VMBase]], interval: float, persistence=None):
+        self._loader   = loader
+        self._interval = interval
+        self._persistence  = persistence
+        self._restore_lock = threading.Lock()
+        self._restored     = False
+        self._saving       = False
+        self._dirty        = False
+        self._lock     = threading.Lock()
+        self._snapshot: Optional[InventorySnapshot] = None
+        self._flight:   Optional[_Flight] = None
+        self._version  = 0
+        self._adopted  = 0
+        # Orden de publicación (bajo _lock) y último entregado a los listeners
+        self._published = 0
+        self._delivered = 0
+        self._notify_lock = threading.Lock()
+        self._stop     = threading.Event()
+        self._thread:   Optional[threading.Thread] = None
+        self._ready    = threading.Event()
+        self.last_error: Optional[str] = None
+        # True cuando otro componente (p. ej. InventorySync) publica los snapshots
+        self.external_feed = False
+        # True en los workers seguidores: adoptan los snapshots del líder,
+        # nunca rastrean vCenter por su cuenta ni escriben la persistencia
+        self.follower = False
+        self._listeners: List[Callable[[InventorySnapshot], None]] = []
+        # Esperas asíncronas del primer snapshot: (bucle, futuro)
+        self._waiters: List[tuple] = []
+
+    @property
+    def snapshot(self) -> Optional[InventorySnapshot]:
+        """
+        Último snapshot disponible (o el persistido) sin esperar ni lanzar
+        una reconstrucción; None si todavía no hay ninguno.
+        """
+        return self._snapshot or self._restore()
+
+    @property
+    def current(self) -> Optional[InventorySnapshot]:
+        """
+        Último snapshot publicado en memoria; nunca lee la persistencia
+        (apto para el bucle de eventos, ver aget).
+        """
+        return self._snapshot
+
+    @property
+    def adopted_version(self) -> int:
+        """Última versión adoptada de otro worker (o restaurada)."""
+        return self._adopted
+
+    def get(self) -> InventorySnapshot:
+        """
+        Devuelve el último snapshot bueno (o el persistido, la primera vez).
+        Solo si aún no existe ninguno espera a la reconstrucción en curso
+        (o la inicia). Si el store se alimenta externamente, espera primero
+        a su carga inicial.
+        """
+        snap = self._snapshot or self._restore()
+        if snap is not None:
+            return snap
+        if self.external_feed and self._ready.wait(self._interval):
+            return self._snapshot
+        if self.follower:
+            raise RuntimeError("El worker líder aún no ha publicado el inventario")
+        return self.refresh()
+
+    async def aget(self, timeout: Optional[float] = None) -> InventorySnapshot:
+        """
+        Versión asíncrona de get(): si aún no hay snapshot espera a la
+        carga inicial (o lanza la reconstrucción en un hilo propio) sin
+        ocupar un hilo por cada petición que espera. La restauración del
+        snapshot persistido (SQLite, zlib y listeners) se hace en un hilo.
+        """
+        snap = self._snapshot
+        if snap is None and self._persistence is not None and not self._restored:
+            snap = await asyncio.to_thread(self._restore)
+        if snap is not None:
+            return snap
+        loop = asyncio.get_running_loop()
+        fut  = loop.create_future()
+        with self._lock:
+            self._waiters.append((loop, fut))
+            building = self._flight is not None
+        if self._snapshot is None and not building and not self.external_feed and not self.follower:
+            threading.Thread(target=self._refresh_quietly, name="inventory-initial", daemon=True).start()
+        try:
+            if self._snapshot is None:
+                await asyncio.wait_for(asyncio.shield(fut), timeout or self._interval)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._lock:
+                if (loop, fut) in self._waiters:
+                    self._waiters.remove((loop, fut))
+        if self._snapshot is None:
+            if self.follower:
+                raise RuntimeError("El worker líder aún no ha publicado el inventario")
+            raise RuntimeError(self.last_error or "El inventario aún no está disponible")
+        return self._snapshot
+
+    def _refresh_quietly(self) -> None:
+        try:
+            self.refresh()
+        except Exception:
+            pass  # ya registrado en refresh(); los que esperan reciben el error
+
+    def _wake(self) -> None:
+        """
+        Despierta a las esperas asíncronas (snapshot publicado o refresco fallido).
+        """
+        with self._lock:
+            waiters, self._waiters = self._waiters, []
+        for loop, fut in waiters:
+            loop.call_soon_threadsafe(lambda f=fut: f.done() or f.set_result(None))
+
+    def refresh(self) -> InventorySnapshot:
+        """
+        Reconstruye el inventario y publica un snapshot nuevo.
+        Si ya hay una reconstrucción en curso, espera a su resultado
+        en lugar de lanzar otra.
+        """
+        with self._lock:
+            flight = self._flight
+            leader = flight is None
+            if leader:
+                flight = self._flight = _Flight()
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None and self._snapshot is None:
+                raise flight.error
+            return self._snapshot
+
+        start = time.perf_counter()
+        try:
+            vms = self._loader()
+            self.publish(vms)
+            self.last_error = None
+            refreshes.inc("ok")
+        except BaseException as e:
+            flight.error = e
+            self.last_error = str(e)
+            refreshes.inc("error")
+            log.warning("Refresco de inventario fallido → %s", e)
+            if self._snapshot is None:
+                raise
+        finally:
+            refresh_seconds.observe(time.perf_counter() - start)
+            with self._lock:
+                self._flight = None
+            flight.done.set()
+            self._wake()
+        return self._snapshot
+
+    def publish(self, vms: List[VMBase]) -> InventorySnapshot:
+        """
+        Sustituye atómicamente el snapshot vigente por uno nuevo.
+        """
+        return self._swap(lambda current: vms)
+
+    def publish_source(self, source: str, vms: List[VMBase]) -> InventorySnapshot:
+        """
+        Sustituye solo las VMs de un vCenter (vcenter == source) y
+        conserva las del resto, en el orden en que aparecían los vCenter.
+        """
+        def build(current: Optional[InventorySnapshot]) -> List[VMRow]:
+            groups: Dict[Optional[str], list] = {}
+            for vm in current.vms if current else []:
+                groups.setdefault(vm.vcenter, []).append(vm)
+            groups[source] = vms
+            return [vm for group in groups.values() for vm in group]
+        return self._swap(build)
+
+    def patch(self, changes: Dict[str, Dict[str, Any]]) -> Optional[InventorySnapshot]:
+        """
+        Publica un snapshot nuevo con campos actualizados en VMs concretas
+        ({id: {campo: valor}}), p. ej. tras una acción de energía, sin
+        esperar al siguiente refresco. Las VMs no afectadas se reutilizan.
+        En un seguidor no hace nada: su numeración es la del líder, que
+        recoge el cambio con su sincronización o su próximo refresco.
+        """
+        if not changes or self._snapshot is None or self.follower:
+            return self._snapshot
+        return self._swap(lambda current: [
+            vm.replace(**changes[vm.id]) if vm.id in changes else vm
+            for vm in current.vms
+        ])
+
+    def adopt(self, snap: InventorySnapshot) -> bool:
+        """
+        Sustituye el snapshot por uno construido en otro worker (líder),
+        conservando su versión para que ETag y deltas coincidan entre
+        workers. Ignora versiones que no sean más nuevas que la última
+        adoptada. No se vuelve a persistir.
+        """
+        with self._lock:
+            if snap.version <= self._adopted:
+                return False
+            self._adopted  = snap.version
+            self._version  = max(self._version, snap.version)
+            self._snapshot = snap
+            seq = self._sequence()
+        self._ready.set()
+        self._wake()
+        self._notify(snap, seq)
+        return True
+
+    def _swap(self, build: Callable[[Optional[InventorySnapshot]], List[VMBase]]) -> InventorySnapshot:
+        """
+        Construye la lista de VMs a partir del snapshot vigente y lo
+        sustituye, todo bajo el lock para no pisar publicaciones concurrentes.
+        Un seguidor nunca publica snapshots propios (p. ej. el último delta
+        de una sincronización que se detiene al perder el liderazgo): solo
+        adopta los del líder.
+        """
+        with self._lock:
+            if self.follower:
+                log.debug("Publicación local descartada: el worker es seguidor")
+                return self._snapshot
+            self._version += 1
+            snap = InventorySnapshot(vms=build(self._snapshot), version=self._version)
+            self._snapshot = snap
+            seq = self._sequence()
+        publishes.inc()
+        self._ready.set()
+        self._wake()
+        self._notify(snap, seq)
+        self._schedule_save()
+        return snap
+
+    def subscribe(self, listener: Callable[[InventorySnapshot], None]) -> None:
+        """
+        Registra una función que se invoca con cada snapshot nuevo
+        (p. ej. para precalcular índices).
+        """
+        self._listeners.append(listener)
+
+    def _sequence(self) -> int:
+        """Número de orden de la publicación en curso (llamar bajo _lock)."""
+        self._published += 1
+        return self._published
+
+    def _notify(self, snap: InventorySnapshot, seq: int) -> None:
+        """
+        Entrega el snapshot a los listeners en orden de publicación: dos
+        publicaciones concurrentes (refresco, parche, delta) pueden llegar
+        aquí en cualquier orden, y un snapshot ya superado por otro
+        entregado se descarta (historial, SSE e índices nunca retroceden).
+        """
+        with self._notify_lock:
+            if seq <= self._delivered:
+                log.debug("Snapshot v%s superado antes de notificarse; descartado", snap.version)
+                return
+            self._delivered = seq
+            for listener in self._listeners:
+                try:
+                    listener(snap)
+                except Exception as e:
+                    log.exception("Listener de inventario fallido → %s", e)
+
+    # —————— Persistencia del snapshot ——————
+    def _restore(self) -> Optional[InventorySnapshot]:
+        """
+        Carga (una sola vez, de forma perezosa) el snapshot persistido.
+        No sustituye a un snapshot más reciente ya publicado.
+        """
+        if self._persistence is None or self._restored:
+            return None
+        with self._restore_lock:
+            if self._restored:
+                return self._snapshot
+            self._restored = True
+            try:
+                snap = self._persistence.load()
+            except Exception as e:
+                log.warning("No se pudo restaurar el snapshot persistido → %s", e)
+                return None
+            if snap is None:
+                return None
+            with self._lock:
+                restored = self._snapshot is None
+                if restored:
+                    self._snapshot = snap
+                    self._version  = max(self._version, snap.version)
+                    self._adopted  = max(self._adopted, snap.version)
+                    seq = self._sequence()
+            self._ready.set()
+            self._wake()
+            if restored:
+                self._notify(snap, seq)
+            return self._snapshot
+
+    def _schedule_save(self) -> None:
+        """
+        Marca el snapshot como pendiente de guardar y, si no hay un
+        guardado en curso, lanza un hilo que persiste el más reciente.
+        """
+        if self._persistence is None or self.follower:
+            return
+        with self._lock:
+            self._dirty = True
+            if self._saving:
+                return
+            self._saving = True
+        threading.Thread(target=self._save_loop, name="inventory-persist", daemon=True).start()
+
+    def _save_loop(self) -> None:
+        while True:
+            with self._lock:
+                if not self._dirty:
+                    self._saving = False
+                    return
+                self._dirty = False
+                snap = self._snapshot
+            try:
+                self._persistence.save(snap)
+            except Exception as e:
+                log.warning("No se pudo persistir el snapshot v%s → %s", snap.version, e)
+            # Agrupa los cambios frecuentes (p. ej. deltas de la sincronización);
+            # cada almacén puede fijar su propio intervalo (save_interval)
+            time.sleep(getattr(self._persistence, "save_interval", INVENTORY_PERSIST_MIN_SECONDS))
+
+    # —————— Hilo de refresco periódico ——————
+    def start(self) -> None:
+        """
+        Arranca el hilo que reconstruye el inventario periódicamente.
+        """
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="inventory-refresher", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Detiene el hilo de refresco (la reconstrucción en curso termina sola).
+        """
+        self._stop.set()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception:
+                pass  # ya registrado en refresh(); se reintenta en el próximo ciclo
+            self._stop.wait(self._interval)
+
+    def status(self) -> dict:
+        """
+        Resumen del estado del snapshot para diagnóstico.
+        """
+        snap = self._snapshot
+        return {
+            "version":    snap.version if snap else None,
+            "age_s":      round(snap.age, 1) if snap else None,
+            "vms":        len(snap.vms) if snap else 0,
+            "refreshing": self._flight is not None,
+            "last_error": self.last_error,
+        }
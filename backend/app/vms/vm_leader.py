@@ -0,0 +1,121 @@
+import logging
+import threading
+from typing import Callable, Optional
+
+from app.config import SHARED_POLL_SECONDS, SHARED_LOCK_TTL
+from app.vms.vm_inventory import InventoryStore
+from app.vms.vm_shared_store import owner_id
+
+log = logging.getLogger(__name__)
+
+# ───────────────────────────────────────────────────────────────────────
+# Elección de líder entre workers que comparten el inventario
+# ───────────────────────────────────────────────────────────────────────
+# Solo el worker que posee el lock rastrea vCenter (sincronización o
+# refresco periódico) y escribe el snapshot en el almacén compartido.
+# El resto sondea la cabecera del almacén y adopta cada versión nueva.
+
+class InventoryLeadership:
+    """
+    Coordina un InventoryStore con un almacén compartido:
+      1. Intenta tomar el lock de líder; si lo consigue adopta el último
+         snapshot compartido (para continuar su numeración) y arranca
+         el productor del inventario.
+      2. Como líder, renueva el lock; si lo pierde, detiene el productor
+         y pasa a seguidor.
+      3. Como seguidor, comprueba cada `poll_seconds` la versión
+         compartida y adopta las nuevas.
+    """
+
+    def __init__(
+        self,
+        shared,
+        store: InventoryStore,
+        start_producer: Callable[[], None],
+        stop_producer: Callable[[], None],
+        poll_seconds: float = SHARED_POLL_SECONDS,
+        lock_ttl: float = SHARED_LOCK_TTL,
+    ):
+        self.shared         = shared
+        self.store          = store
+        self.start_producer = start_producer
+        self.stop_producer  = stop_producer
+        self.poll_seconds   = poll_seconds
+        # El lock se renueva con margen antes de caducar
+        self.renew_seconds  = min(poll_seconds, lock_ttl / 3)
+        self.owner          = owner_id()
+        self.leader         = False
+        self.adopted        = 0
+        self.last_error: Optional[str] = None
+        self._stop   = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # —————— Ciclo de vida ——————
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self.store.follower      = True
+        self.store.external_feed = True
+        self._thread = threading.Thread(target=self._run, name="inventory-leadership", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self.leader:
+            self._step_down()
+        try:
+            self.shared.release_leader(self.owner)
+        except Exception:
+            pass
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                if self.leader:
+                    if not self.shared.renew_leader(self.owner):
+                        log.warning("Lock de líder perdido; pasando a seguidor")
+                        self._step_down()
+                elif self.shared.acquire_leader(self.owner):
+                    self._become_leader()
+                else:
+                    self._follow()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                log.warning("Coordinación del inventario compartido fallida → %s", e)
+            self._stop.wait(self.renew_seconds if self.leader else self.poll_seconds)
+
+    # —————— Transiciones ——————
+    def _become_leader(self) -> None:
+        log.info("Worker %s es líder del inventario", self.owner)
+        self._follow()                    # continúa desde la última versión compartida
+        self.store.follower = False
+        self.leader = True
+        self.start_producer()
+
+    def _step_down(self) -> None:
+        self.leader = False
+        self.store.follower      = True
+        self.store.external_feed = True
+        self.stop_producer()
+
+    def _follow(self) -> None:
+        """
+        Adopta el snapshot compartido si es más nuevo que el local.
+        Solo se descarga entero cuando cambia la cabecera.
+        """
+        head = self.shared.head()
+        if head is None or head.version <= self.store.adopted_version:
+            return
+        snap = self.shared.load()
+        if snap is not None and self.store.adopt(snap):
+            self.adopted += 1
+
+    def status(self) -> dict:
+        return {
+            "owner":      self.owner,
+            "leader":     self.leader,
+            "adopted":    self.adopted,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,57 @@
+import re
+from typing import Optional
+
+# —————— Mapeos compartidos entre las rutas REST y SOAP ——————
+
+# Mapa de versiones VMX → descripción humana
+COMPAT_MAP = {
+    "VMX_03": "ESXi 2.5 and later (VM version 3)",
+    # ... (otros mapeos intermedios) ...
+    "VMX_21": "ESXi 8.0 U2 and later (VM version 21)",
+}
+
+# Estados de energía SOAP (runtime.powerState) → formato REST usado por el front-end
+POWER_STATE_MAP = {
+    "poweredOn":  "POWERED_ON",
+    "poweredOff": "POWERED_OFF",
+    "suspended":  "SUSPENDED",
+}
+
+def infer_environment(name: str) -> str:
+    """
+    Inferencia de entorno (test, producción, sandbox, desarrollo)
+    a partir del prefijo del nombre de la VM.
+    """
+    p = (name or "").upper()
+    if p.startswith("T-"): return "test"
+    if p.startswith("P-"): return "producción"
+    if p.startswith("S"): return "sandbox"
+    if p.startswith("D-"): return "desarrollo"
+    return "desconocido"
+
+def compat_code_from_version(version: Optional[str]) -> str:
+    """
+    Convierte la versión SOAP de hardware ("vmx-21") al código REST ("VMX_21").
+    """
+    if not version:
+        return "<sin datos>"
+    return version.upper().replace("-", "_")
+
+def guest_os_from_guest_id(guest_id: Optional[str]) -> Optional[str]:
+    """
+    Convierte un guestId SOAP ("windows9Server64Guest") al identificador
+    que devuelve la API REST ("WINDOWS_9_SERVER_64").
+    """
+    if not guest_id:
+        return None
+    base = guest_id[:-5] if guest_id.endswith("Guest") else guest_id
+    base = re.sub(r"(?<=[a-z])(?=[A-Z0-9])|(?<=[0-9])(?=[A-Za-z])", "_", base)
+    return re.sub(r"_+", "_", base).upper()
+
+def format_disk(capacity_bytes: Optional[int]) -> Optional[str]:
+    """
+    Formatea la capacidad de un disco en bytes como "<n> GB".
+    """
+    if not isinstance(capacity_bytes, int):
+        return None
+    return f"{capacity_bytes // (1024**3)} GB"
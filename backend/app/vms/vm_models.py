@@ -1,5 +1,7 @@
-from typing import List, Optional
-from pydantic import BaseModel
+from typing import Dict, List, Literal, Optional
+from pydantic import BaseModel, Field
+
+from app.config import POWER_JOB_MAX_VMS
 
 # —————— Esquemas de datos para máquinas virtuales ——————
 class VMBase(BaseModel):
@@ -12,8 +14,10 @@ class VMBase(BaseModel):
       • Compatibilidad de la versión de la VM (código y descripción).
       • Conectividad de red (redes, direcciones IP, adaptadores de red).
       • Almacenamiento (lista de discos con su capacidad en GB).
+      • vCenter de origen (cuando se federan varios).
     """
     id: str
+    vcenter: Optional[str] = None
     name: str
     power_state: str
     cpu_count: int
@@ -37,3 +41,64 @@ class VMDetail(VMBase):
     de la máquina virtual cuando sea necesario.
     """
     pass
+
+# —————— Esquemas de agregación (estadísticas por grupo) ——————
+class VMStatsGroup(BaseModel):
+    """
+    Totales de un grupo de VMs:
+      • key             : Valor del campo de agrupación (None si no hay dato).
+      • count           : Número de VMs del grupo.
+      • cpu_count       : Suma de vCPUs.
+      • memory_size_MiB : Suma de memoria asignada.
+      • disk_GB         : Suma de capacidad de disco.
+    """
+    key: Optional[str]
+    count: int
+    cpu_count: int
+    memory_size_MiB: int
+    disk_GB: int
+
+class VMStats(BaseModel):
+    """
+    Resultado de /vms/stats: totales globales y, por cada campo
+    de agrupación pedido, la lista de grupos ordenada por número de VMs.
+    """
+    version: int
+    total: VMStatsGroup
+    groups: Dict[str, List[VMStatsGroup]]
+
+# —————— Esquemas de acciones de energía por lotes ——————
+class PowerBatchRequest(BaseModel):
+    """
+    Cuerpo de POST /vms/power:
+      • vm_ids : VMs sobre las que ejecutar la acción (sin duplicados).
+      • action : start, stop o reset.
+    """
+    vm_ids: List[str] = Field(..., min_length=1, max_length=POWER_JOB_MAX_VMS)
+    action: Literal["start", "stop", "reset"]
+
+class PowerJobItem(BaseModel):
+    """
+    Progreso de una VM dentro de un trabajo:
+      • status  : pending, running, done o error.
+      • message : Resultado o detalle del error devuelto por vCenter.
+    """
+    vm_id: str
+    status: str = "pending"
+    message: Optional[str] = None
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+class PowerJob(BaseModel):
+    """
+    Trabajo de energía por lotes y su progreso por VM.
+    """
+    id: str
+    action: str
+    user: str
+    created_at: float
+    finished_at: Optional[float] = None
+    total: int
+    done: int = 0
+    failed: int = 0
+    items: List[PowerJobItem]
@@ -0,0 +1,198 @@
+import asyncio
+import logging
+import threading
+from typing import Dict, Iterable, Optional
+
+from app.cache import CacheNamespace, MISSING
+from app.config import NETWORK_BATCH_SIZE
+from app.metrics import metrics
+from app.vms.vm_collector import collect_network_names
+from app.vms.vm_session import VCenterSession
+
+log = logging.getLogger(__name__)
+
+network_loads = metrics.counter(
+    "network_resolver_loads_total", "Cargas del mapa de redes por vCenter, origen y resultado",
+    ("vcenter", "source", "outcome"),
+)
+network_batches = metrics.counter(
+    "network_resolver_batches_total", "Consultas por lotes de ids de red desconocidos", ("vcenter",),
+)
+
+# ───────────────────────────────────────────────────────────────────────
+# Resolución de nombres de red en bloque
+# ───────────────────────────────────────────────────────────────────────
+# El mapa id → nombre de un vCenter se carga entero (redes estándar,
+# portgroups distribuidos y redes opacas) y se renueva con su propia
+# cadencia (TTL del espacio "network_map", NETWORK_REFRESH_SECONDS),
+# independiente del refresco de VMs. Los ids que no aparecen en él se
+# resuelven todos juntos en una sola consulta REST filtrada, nunca uno a uno.
+
+class NetworkResolver:
+    """
+    Traductor id de red → nombre de un vCenter:
+      1. load() trae todas las redes con el PropertyCollector (paginado,
+         incluye claves de portgroup e ids de red opaca) o, si SOAP
+         falla, con el listado REST.
+      2. resolve(ids) sirve del mapa y resuelve los ids desconocidos en
+         un único lote (filter.networks) cacheado en `names`.
+      3. Si una carga falla se sigue usando el último mapa bueno y se
+         reintenta tras el TTL negativo.
+    """
+
+    def __init__(
+        self,
+        session: VCenterSession,
+        maps: CacheNamespace,
+        names: CacheNamespace,
+        batch_size: int = NETWORK_BATCH_SIZE,
+    ):
+        self.session    = session
+        self.maps       = maps        # session.name → {id: nombre}
+        self.names      = names       # (session.name, id) → nombre (ids sueltos)
+        self.batch_size = batch_size
+        self._lock      = threading.Lock()
+        self._last: Dict[str, str] = {}
+
+    # —————— Mapa completo ——————
+    def mapping(self) -> Dict[str, str]:
+        """
+        Mapa completo vigente; lo (re)carga si ha caducado. Las cargas
+        concurrentes se agrupan en una sola.
+        """
+        return self._mapping()[0]
+
+    def _mapping(self):
+        """(mapa, True si se acaba de cargar en esta llamada)."""
+        cached = self.maps.get(self.session.name)
+        if cached is not None:
+            return cached, False
+        with self._lock:
+            cached = self.maps.get(self.session.name)
+            if cached is not None:
+                return cached, False
+            try:
+                mapping = self.load()
+                self.maps.set(self.session.name, mapping)
+                self._last = mapping
+                return mapping, True
+            except Exception as e:
+                log.warning("Mapa de redes de %s fallido → %s", self.session.name, e)
+                self.maps.set(self.session.name, self._last, negative=True)
+                return self._last, False
+
+    def load(self) -> Dict[str, str]:
+        """
+        Carga todas las redes del vCenter en una sola pasada (SOAP o REST).
+        """
+        name = self.session.name
+        try:
+            mapping = self.session.soap_call(collect_network_names, op="collect_networks")
+            network_loads.inc(name, "soap", "ok")
+            return mapping
+        except Exception as e:
+            network_loads.inc(name, "soap", "error")
+            log.info("Redes de %s vía SOAP fallidas → %s; usando REST", name, e)
+        try:
+            r = self.session.get("/rest/vcenter/network", timeout=10)
+            r.raise_for_status()
+        except Exception:
+            network_loads.inc(name, "rest", "error")
+            raise
+        network_loads.inc(name, "rest", "ok")
+        return {item["network"]: item["name"] for item in r.json().get("value", [])}
+
+    def restore(self, mapping: Dict[str, str]) -> None:
+        """
+        Recupera un mapa persistido como último mapa bueno.
+        """
+        self._last = mapping
+
+    # —————— Resolución ——————
+    def resolve(self, ids: Iterable[str]) -> Dict[str, str]:
+        """
+        Nombres de los ids indicados. Los que no están en el mapa ni en
+        la caché de ids sueltos se piden en una sola consulta por lote
+        (salvo que el mapa se acabe de cargar: entonces ya es completo).
+        Los ids que vCenter no conoce se devuelven tal cual.
+        """
+        mapping, fresh = self._mapping()
+        out, unknown = self._split(mapping, ids)
+        if unknown and not fresh:
+            out.update(self._fetch(unknown))
+        for nid in unknown:
+            out.setdefault(nid, nid)
+        return out
+
+    async def aresolve(self, ids: Iterable[str]) -> Dict[str, str]:
+        """
+        Versión asíncrona de resolve(): con el mapa ya cargado no sale del
+        bucle de eventos y el lote de ids desconocidos va por el cliente
+        asíncrono; solo una carga completa del mapa (SOAP) usa un hilo.
+        """
+        ids = list(ids)
+        mapping = self.maps.get(self.session.name)
+        if mapping is None:
+            return await asyncio.to_thread(self.resolve, ids)
+        out, unknown = self._split(mapping, ids)
+        for start in range(0, len(unknown), self.batch_size):
+            chunk = unknown[start:start + self.batch_size]
+            network_batches.inc(self.session.name)
+            found: Dict[str, str] = {}
+            try:
+                r = await self.session.aget(
+                    "/rest/vcenter/network", params=[("filter.networks", nid) for nid in chunk], timeout=10
+                )
+                r.raise_for_status()
+                found = {item["network"]: item["name"] for item in r.json().get("value", [])}
+            except Exception as e:
+                log.warning("Lote de %d redes de %s fallido → %s", len(chunk), self.session.name, e)
+            self._remember(chunk, found)
+            out.update(found)
+        for nid in unknown:
+            out.setdefault(nid, nid)
+        return out
+
+    def _split(self, mapping: Dict[str, str], ids: Iterable[str]):
+        """(nombres ya conocidos, ids desconocidos) sin repetidos ni vacíos."""
+        out: Dict[str, str] = {}
+        unknown = []
+        for nid in dict.fromkeys(i for i in ids if i):
+            name = mapping.get(nid)
+            if name is None:
+                name = self.names.get((self.session.name, nid), MISSING)
+            if name is MISSING:
+                unknown.append(nid)
+            else:
+                out[nid] = name
+        return out, unknown
+
+    def name(self, network_id: str) -> str:
+        return self.resolve((network_id,)).get(network_id, network_id)
+
+    def _fetch(self, ids) -> Dict[str, str]:
+        """
+        Resuelve los ids con GET /rest/vcenter/network?filter.networks=...
+        (una petición por cada `batch_size` ids). Los no encontrados o
+        fallidos se cachean como negativos.
+        """
+        found: Dict[str, str] = {}
+        for start in range(0, len(ids), self.batch_size):
+            chunk = ids[start:start + self.batch_size]
+            network_batches.inc(self.session.name)
+            try:
+                r = self.session.get(
+                    "/rest/vcenter/network", params=[("filter.networks", nid) for nid in chunk], timeout=10
+                )
+                r.raise_for_status()
+                found.update({item["network"]: item["name"] for item in r.json().get("value", [])})
+            except Exception as e:
+                log.warning("Lote de %d redes de %s fallido → %s", len(chunk), self.session.name, e)
+        self._remember(ids, found)
+        return found
+
+    def _remember(self, ids, found: Dict[str, str]) -> None:
+        """Cachea los ids del lote; los no encontrados como negativos."""
+        for nid in ids:
+            name: Optional[str] = found.get(nid)
+            self.names.set((self.session.name, nid), name or nid, negative=name is None)
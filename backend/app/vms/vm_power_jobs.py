@@ -0,0 +1,167 @@
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.config import POWER_JOB_CONCURRENCY, POWER_JOB_RETENTION
+from app.vms.vm_models import PowerJob, PowerJobItem
+from app.vms.vm_inventory import InventoryStore
+from app.vms.vm_session import VCenterSession
+
+log = logging.getLogger(__name__)
+
+# ───────────────────────────────────────────────────────────────────────
+# Cola de acciones de energía por lotes
+# ───────────────────────────────────────────────────────────────────────
+# Estado de energía que queda tras cada acción (formato REST de VMBase)
+POWER_RESULT = {
+    "start": "POWERED_ON",
+    "stop":  "POWERED_OFF",
+    "reset": "POWERED_ON",
+}
+
+# Tiempo durante el que se agrupan los parches del snapshot
+_PATCH_DELAY = 1.0
+
+
+class PowerJobQueue:
+    """
+    Ejecuta acciones de energía sobre muchas VMs fuera del hilo de la
+    petición:
+      1. submit() registra el trabajo y devuelve su id de inmediato.
+      2. Un pool acotado (compartido por todos los trabajos) llama a la
+         API REST del vCenter de cada VM (`route` traduce el id a su
+         sesión persistente y moId).
+      3. Cada resultado actualiza el progreso por VM del trabajo.
+      4. Las acciones correctas parchean el snapshot del inventario
+         (power_state), agrupadas para no publicar un snapshot por VM,
+         y avisan a `on_success` (p. ej. para invalidar cachés).
+    """
+
+    def __init__(
+        self,
+        route: Callable[[str], Tuple[VCenterSession, str]],
+        store: InventoryStore,
+        max_workers: int = POWER_JOB_CONCURRENCY,
+        retention: int = POWER_JOB_RETENTION,
+        on_success: Optional[Callable[[str], None]] = None,
+    ):
+        self.route      = route
+        self.store      = store
+        self.on_success = on_success
+        self.retention  = retention
+        self._pool      = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="power-job")
+        self._lock      = threading.Lock()
+        self._jobs: "OrderedDict[str, PowerJob]" = OrderedDict()
+        self._patches: Dict[str, Dict[str, str]] = {}
+        self._flush_timer: Optional[threading.Timer] = None
+
+    # —————— API pública ——————
+    def submit(self, vm_ids: List[str], action: str, user: str) -> PowerJob:
+        """
+        Encola la acción para cada VM (ids duplicados se ignoran).
+        Devuelve una copia del trabajo recién registrado: el original lo
+        modifican los hilos del pool mientras se serializa la respuesta.
+        """
+        ids = list(dict.fromkeys(vm_ids))
+        job = PowerJob(
+            id         = uuid.uuid4().hex,
+            action     = action,
+            user       = user,
+            created_at = time.time(),
+            total      = len(ids),
+            items      = [PowerJobItem(vm_id=i) for i in ids],
+        )
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+            submitted = job.model_copy(deep=True)
+        for item in job.items:
+            self._pool.submit(self._execute, job, item)
+        log.info("Trabajo de energía %s: %s sobre %d VMs (%s)", job.id, action, len(ids), user)
+        return submitted
+
+    def get(self, job_id: str) -> Optional[PowerJob]:
+        """
+        Copia consistente del trabajo (o None si no existe o ya se descartó).
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job.model_copy(deep=True) if job else None
+
+    # —————— Ejecución ——————
+    def _execute(self, job: PowerJob, item: PowerJobItem) -> None:
+        with self._lock:
+            item.status     = "running"
+            item.started_at = time.time()
+        # La API REST de power es síncrona: responde cuando la tarea
+        # de vCenter ha terminado, así que su estado es el de la tarea
+        message = None
+        try:
+            session, moid = self.route(item.vm_id)
+            r  = session.post(f"/rest/vcenter/vm/{moid}/power/{job.action}", timeout=30)
+            ok = r.status_code == 200
+            if not ok:
+                message = f"{r.status_code}: {r.text[:200]}"
+        except Exception as e:
+            ok, message = False, str(e)
+
+        with self._lock:
+            item.status      = "done" if ok else "error"
+            item.message     = message
+            item.finished_at = time.time()
+            if ok:
+                job.done += 1
+            else:
+                job.failed += 1
+            if job.done + job.failed == job.total:
+                job.finished_at = item.finished_at
+        if ok:
+            self._queue_patch(item.vm_id, POWER_RESULT[job.action])
+            if self.on_success:
+                self.on_success(item.vm_id)
+
+    def _queue_patch(self, vm_id: str, power_state: str) -> None:
+        """
+        Acumula el nuevo power_state y programa un único parche del
+        snapshot para todos los resultados que lleguen en _PATCH_DELAY.
+        """
+        with self._lock:
+            self._patches[vm_id] = {"power_state": power_state}
+            if self._flush_timer is not None:
+                return
+            self._flush_timer = threading.Timer(_PATCH_DELAY, self._flush)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+
+    def _flush(self) -> None:
+        with self._lock:
+            patches, self._patches = self._patches, {}
+            self._flush_timer = None
+        try:
+            self.store.patch(patches)
+        except Exception as e:
+            log.warning("No se pudo parchear el snapshot tras acciones de energía → %s", e)
+
+    def _prune(self) -> None:
+        """
+        Descarta los trabajos terminados más antiguos por encima de `retention`.
+        """
+        excess = len(self._jobs) - self.retention
+        for job_id in list(self._jobs):
+            if excess <= 0:
+                break
+            if self._jobs[job_id].finished_at is not None:
+                del self._jobs[job_id]
+                excess -= 1
+
+    def status(self) -> dict:
+        with self._lock:
+            running = sum(1 for j in self._jobs.values() if j.finished_at is None)
+            return {"jobs": len(self._jobs), "running": running, "pending_patches": len(self._patches)}
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
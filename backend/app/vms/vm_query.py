@@ -0,0 +1,170 @@
+from typing import Iterable, List, Optional, Sequence, Set, Tuple
+
+from fastapi import HTTPException, Query
+
+from app.cache import caches
+from app.vms.vm_rows import VM_FIELDS, VMRow
+from app.vms.vm_inventory import InventorySnapshot
+from app.vms.vm_index import index_for
+
+# ───────────────────────────────────────────────────────────────────────
+# Ordenación, paginación y proyección de campos sobre el snapshot
+# ───────────────────────────────────────────────────────────────────────
+# Órdenes completos ya calculados: (versión, orden) → (posiciones ordenadas, rango)
+_sorted_cache = caches.namespace("sorted", maxsize=32, ttl=None)
+
+# —————— Filtros comunes a los listados de VMs ——————
+class VMFilters:
+    """
+    Parámetros de filtrado compartidos por los endpoints de listado.
+    Se resuelven con el índice del snapshot (ver vm_index); los valores
+    de campo admiten varias opciones separadas por comas.
+    """
+    def __init__(
+        self,
+        name: Optional[str]        = Query(None, description="Filtrar por nombre parcial"),
+        vcenter: Optional[str]     = Query(None, description="Filtrar por vCenter de origen"),
+        environment: Optional[str] = Query(None, description="Filtrar por ambiente"),
+        host: Optional[str]        = Query(None, description="Filtrar por host"),
+        cluster: Optional[str]     = Query(None, description="Filtrar por cluster"),
+        network: Optional[str]     = Query(None, description="Filtrar por red/VLAN"),
+        guest_os: Optional[str]    = Query(None, description="Filtrar por sistema operativo"),
+        power_state: Optional[str] = Query(None, description="Filtrar por estado de energía"),
+        q: Optional[str]           = Query(None, description="Buscar por nombre o IP parcial"),
+    ):
+        self.name        = name
+        self.vcenter     = vcenter
+        self.environment = environment
+        self.host        = host
+        self.cluster     = cluster
+        self.network     = network
+        self.guest_os    = guest_os
+        self.power_state = power_state
+        self.q           = q
+
+    def key(self) -> tuple:
+        """
+        Clave hashable de los filtros (para memorizar resultados).
+        """
+        return (self.name, self.vcenter, self.environment, self.host, self.cluster,
+                self.network, self.guest_os, self.power_state, self.q)
+
+    def apply(self, snapshot: InventorySnapshot) -> Optional[Set[int]]:
+        """
+        Posiciones del snapshot que cumplen los filtros (None = todas).
+        """
+        return index_for(snapshot).query(
+            name        = self.name,
+            q           = self.q,
+            vcenter     = self.vcenter,
+            environment = self.environment,
+            host        = self.host,
+            cluster     = self.cluster,
+            networks    = self.network,
+            guest_os    = self.guest_os,
+            power_state = self.power_state,
+        )
+
+def parse_fields(fields: Optional[str]) -> Optional[Set[str]]:
+    """
+    Interpreta `fields=id,name,...` y valida que existan en VMBase.
+    Devuelve None si no se pidió proyección (todos los campos).
+    """
+    if not fields:
+        return None
+    wanted = {f.strip() for f in fields.split(",") if f.strip()}
+    unknown = wanted - set(VM_FIELDS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Campos desconocidos: {', '.join(sorted(unknown))}")
+    return wanted | {"id"}
+
+def parse_sort(sort: Optional[str]) -> Tuple[Tuple[str, bool], ...]:
+    """
+    Interpreta `sort=name,-memory_size_MiB` como [(campo, descendente), ...].
+    """
+    if not sort:
+        return ()
+    keys = []
+    for part in sort.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        desc  = part.startswith("-")
+        field = part.lstrip("+-")
+        if field not in VM_FIELDS:
+            raise HTTPException(status_code=400, detail=f"Campo de orden desconocido: {field}")
+        keys.append((field, desc))
+    return tuple(keys)
+
+def _sort_key(field: str):
+    def key(vm: VMRow):
+        value = getattr(vm, field)
+        if isinstance(value, str):
+            value = value.lower()
+        return (value is None, value if value is not None else "")
+    return key
+
+def _sorted_order(snapshot: InventorySnapshot, keys: Tuple[Tuple[str, bool], ...]):
+    """
+    Orden completo del inventario (posiciones) y su rango inverso,
+    memorizados por snapshot (serial).
+    """
+    cache_key = (snapshot.serial, keys)
+    cached = _sorted_cache.get(cache_key)
+    if cached is None:
+        vms   = snapshot.vms
+        order = list(range(len(vms)))
+        for field, desc in reversed(keys):
+            key = _sort_key(field)
+            order.sort(key=lambda p: key(vms[p]), reverse=desc)
+        rank = [0] * len(order)
+        for r, p in enumerate(order):
+            rank[p] = r
+        cached = _sorted_cache[cache_key] = (order, rank)
+    return cached
+
+def select(
+    snapshot: InventorySnapshot,
+    filters: VMFilters,
+    keys: Tuple[Tuple[str, bool], ...] = (),
+) -> List[int]:
+    """
+    Posiciones del snapshot que cumplen los filtros, en el orden pedido.
+    Solo se ordenan las coincidencias (por rango precalculado).
+    """
+    matched = filters.apply(snapshot)
+    if matched is None:
+        return _sorted_order(snapshot, keys)[0] if keys else list(range(len(snapshot.vms)))
+    return order_positions(snapshot, matched, keys)
+
+def order_positions(
+    snapshot: InventorySnapshot,
+    positions: Iterable[int],
+    keys: Tuple[Tuple[str, bool], ...] = (),
+) -> List[int]:
+    """
+    Ordena un subconjunto de posiciones según el orden pedido
+    (por posición en el snapshot si no se pidió ninguno).
+    """
+    if not keys:
+        return sorted(positions)
+    rank = _sorted_order(snapshot, keys)[1]
+    return sorted(positions, key=rank.__getitem__)
+
+def paginate(items: Sequence, offset: int, limit: Optional[int]) -> Tuple[Sequence, Optional[int]]:
+    """
+    Recorta la página pedida y devuelve también el offset de la siguiente
+    página (None si no hay más).
+    """
+    if limit is None:
+        return items[offset:], None
+    page = items[offset:offset + limit]
+    next_offset = offset + limit if offset + limit < len(items) else None
+    return page, next_offset
+
+def project(vms: Sequence[VMRow], fields: Optional[Set[str]]) -> List[dict]:
+    """
+    Serializa solo los campos pedidos de cada VM de la página
+    (directamente desde las filas, sin pasar por pydantic).
+    """
+    return [vm.as_dict(fields) for vm in vms]
@@ -0,0 +1,111 @@
+import json
+import threading
+from typing import Any, Dict, List, NamedTuple, Optional, Set, Tuple
+
+from app.cache import caches
+from app.config import RENDER_CACHE_BYTES, RENDER_PAGE_MAX_BYTES
+from app.metrics import stage
+from app.vms.vm_inventory import InventorySnapshot
+from app.vms.vm_query import VMFilters, select, paginate, project
+
+try:
+    import orjson       # dependencia opcional: si falta se usa json
+except ImportError:
+    orjson = None
+
+# ───────────────────────────────────────────────────────────────────────
+# Serialización de los listados a bytes JSON, cacheada por snapshot
+# ───────────────────────────────────────────────────────────────────────
+# Cada fila se codifica una sola vez por snapshot (al publicarse) y los
+# listados se montan concatenando esos bytes. Cada combinación de
+# filtros/orden/página/campos queda cacheada con su versión en la clave,
+# de modo que una petición repetida solo copia bytes ya preparados. La
+# caché de páginas se limita por bytes (RENDER_CACHE_BYTES), no guarda
+# páginas mayores que RENDER_PAGE_MAX_BYTES (p. ej. el listado completo
+# de una flota grande) y se vacía de snapshots anteriores al publicarse
+# uno nuevo.
+
+def dumps(obj: Any) -> bytes:
+    """
+    Codifica a JSON compacto (UTF-8) con orjson si está disponible.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+class RenderedPage(NamedTuple):
+    body: bytes
+    total: int
+    next_offset: Optional[int]
+
+
+# Filas codificadas por snapshot (serial) y páginas ya montadas
+_rows   = caches.namespace("encoded_rows", maxsize=2, ttl=None)
+_pages  = caches.namespace("rendered_pages", maxsize=64, ttl=None, max_bytes=RENDER_CACHE_BYTES)
+_lock   = threading.Lock()
+# Filas del último snapshot codificado: las VMs que el siguiente reutiliza
+# (mismo objeto, p. ej. tras un parche o un delta) no se vuelven a codificar
+_last_encoded: Dict[int, bytes] = {}
+_last_vms: List = []
+
+def encoded_rows(snapshot: InventorySnapshot) -> List[bytes]:
+    """
+    JSON de cada VM del snapshot (todos los campos), calculado una sola vez.
+    Se registra como listener del InventoryStore para prepararlo al publicar;
+    solo se codifican las filas que no venían ya en el snapshot anterior.
+    """
+    global _last_encoded, _last_vms
+    rows = _rows.get(snapshot.serial)
+    if rows is None:
+        with _lock:
+            rows = _rows.get(snapshot.serial)
+            if rows is None:
+                with stage("serialization"):
+                    previous = _last_encoded
+                    rows = [previous.get(id(vm)) or dumps(vm.as_dict()) for vm in snapshot.vms]
+                    _rows[snapshot.serial] = rows
+                    # Las filas se conservan referenciadas para que sus id() no se reutilicen
+                    _last_vms     = snapshot.vms
+                    _last_encoded = {id(vm): row for vm, row in zip(snapshot.vms, rows)}
+    return rows
+
+def prune_pages(snapshot: InventorySnapshot) -> int:
+    """
+    Descarta las páginas de snapshots anteriores (listener del
+    InventoryStore); devuelve cuántas se han borrado.
+    """
+    return _pages.invalidate_where(lambda key: key[0] != snapshot.serial)
+
+def render_rows(snapshot: InventorySnapshot, positions, fields: Optional[Set[str]] = None) -> bytes:
+    """
+    Array JSON con las VMs de las posiciones dadas. Sin proyección se
+    concatenan las filas precodificadas; con proyección se codifica la página.
+    """
+    if fields is None:
+        rows = encoded_rows(snapshot)
+        return b"[" + b",".join([rows[p] for p in positions]) + b"]"
+    return dumps(project([snapshot.vms[p] for p in positions], fields))
+
+def render_page(
+    snapshot: InventorySnapshot,
+    filters: VMFilters,
+    keys: Tuple[Tuple[str, bool], ...],
+    offset: int,
+    limit: Optional[int],
+    fields: Optional[Set[str]],
+) -> RenderedPage:
+    """
+    Página de GET /api/vms ya serializada, con el total de coincidencias
+    y el offset de la siguiente página; cacheada por snapshot (serial).
+    """
+    key = (snapshot.serial, filters.key(), keys, offset, limit,
+           frozenset(fields) if fields is not None else None)
+    page = _pages.get(key)
+    if page is None:
+        positions = select(snapshot, filters, keys)
+        chunk, next_offset = paginate(positions, offset, limit)
+        page = RenderedPage(render_rows(snapshot, chunk, fields), len(positions), next_offset)
+        if len(page.body) <= RENDER_PAGE_MAX_BYTES:
+            _pages[key] = page
+    return page
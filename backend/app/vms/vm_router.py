@@ -1,44 +1,281 @@
 # —————— Importaciones y configuración del router ——————
-from fastapi import APIRouter, Depends, Query, Path, HTTPException
+import asyncio
+import logging
+from fastapi import APIRouter, Depends, Query, Path, Header, HTTPException, Request
 from typing import Optional, List
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 
-from app.dependencies import get_current_user
-from app.vms.vm_models import VMBase, VMDetail
-from app.vms.vm_service import get_vms, get_vm_detail, power_action
+from app.config import API_VCENTER_TIMEOUT_SECONDS, API_DISCONNECT_POLL_SECONDS
+from app.dependencies import get_current_user, get_current_user_stream
+from app.metrics import timing
+
+from app.vms.vm_models import VMBase, VMDetail, VMStats, PowerBatchRequest, PowerJob
+from app.vms.vm_service import (
+    inventory, inventory_history, inventory_events, power_jobs,
+    aget_vm_detail, apower_action,
+)
+from app.vms.vm_query import VMFilters, parse_fields, parse_sort, select
+from app.vms.vm_render import dumps, render_page
+from app.vms.vm_stats import parse_group_by, compute_stats
+from app.vms.vm_export import EXPORT_MEDIA, export_stream
+from app.vms.vm_delta import snapshot_etag, etag_matches, delta_payload
+from app.vms.vm_events import encode_event
 
 router = APIRouter()
+log = logging.getLogger(__name__)
+
+async def _until_disconnect(request: Request, awaitable):
+    """
+    Espera `awaitable` con el plazo API_VCENTER_TIMEOUT_SECONDS y la
+    cancela si el cliente cierra la conexión antes; al cancelarse se
+    abortan también sus peticiones en curso a vCenter.
+    - Plazo agotado → 504.
+    - Cliente desconectado → 499 (nadie lo recibe; queda en las métricas).
+    """
+    task = asyncio.ensure_future(awaitable)
+    try:
+        async with asyncio.timeout(API_VCENTER_TIMEOUT_SECONDS):
+            while True:
+                done, _ = await asyncio.wait({task}, timeout=API_DISCONNECT_POLL_SECONDS)
+                if done:
+                    return task.result()
+                if await request.is_disconnected():
+                    raise HTTPException(status_code=499, detail="Cliente desconectado")
+    except TimeoutError:
+        raise HTTPException(status_code=504, detail="vCenter no respondió a tiempo")
+    finally:
+        if not task.done():
+            task.cancel()
 
 # —————— Endpoint: Listar VMs ——————
 @router.get("/vms", response_model=List[VMBase])
-def list_vms(
-    name: Optional[str]        = Query(None, description="Filtrar por nombre parcial"),
-    environment: Optional[str] = Query(None, description="Filtrar por ambiente"),
-    current_user: str          = Depends(get_current_user),
+async def list_vms(
+    request: Request,
+    filters: VMFilters           = Depends(),
+    sort: Optional[str]          = Query(None, description="Orden, p. ej. name o -memory_size_MiB,name"),
+    offset: int                  = Query(0, ge=0, description="Posición inicial de la página"),
+    limit: Optional[int]         = Query(None, ge=1, le=5000, description="Tamaño de página"),
+    fields: Optional[str]        = Query(None, description="Campos a devolver, p. ej. id,name,power_state"),
+    since: Optional[int]         = Query(None, ge=0, description="Devolver solo los cambios desde esta versión"),
+    if_none_match: Optional[str] = Header(None),
+    current_user: str            = Depends(get_current_user),
 ):
     """
     Lista todas las máquinas virtuales disponibles.
-    - Aplica filtros opcionales por nombre y entorno.
+    - Se sirve siempre del último snapshot bueno del inventario;
+      su versión y antigüedad viajan en cabeceras X-Inventory-*.
+    - Aplica filtros opcionales (nombre, entorno, host, cluster, red, SO,
+      estado, búsqueda por nombre/IP) sobre el índice del snapshot.
+    - Ordena en servidor (orden memorizado por snapshot), pagina con
+      offset/limit y proyecta solo los campos pedidos; el total y el
+      offset de la siguiente página viajan en X-Total-Count / X-Next-Offset.
+    - La respuesta se envía como bytes JSON cacheados por snapshot y por
+      combinación de filtros/orden/página/campos (ver vm_render).
+    - Cada snapshot tiene un ETag: con If-None-Match vigente responde 304
+      sin cuerpo.
+    - Con since=<versión> devuelve solo las VMs añadidas, cambiadas o
+      eliminadas desde esa versión (sin paginar); si la versión ya no está
+      en el historial responde con reset=true y el listado completo.
+    - Es async: si aún no hay snapshot espera a la carga inicial sin
+      ocupar un hilo del threadpool.
     - Requiere autenticación previa.
     - Maneja errores internos al obtener la lista de VMs.
     """
-    print("[DEBUG ROUTE] GET /api/vms invoked")
+    wanted   = parse_fields(fields)
+    sort_key = parse_sort(sort)
+
+    try:
+        with timing("snapshot"):
+            snap = inventory.current or await _until_disconnect(request, inventory.aget())
+    except HTTPException:
+        raise
+    except Exception as e:
+        log.error("Error al obtener VMs en list_vms(): %s", e)
+        raise HTTPException(status_code=500, detail="Error interno al obtener VMs")
+
+    headers = {
+        "ETag":                snapshot_etag(snap),
+        "Cache-Control":       "private, no-cache",
+        "X-Inventory-Version": str(snap.version),
+        "X-Inventory-Age":     f"{snap.age:.0f}",
+    }
+    if etag_matches(if_none_match, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+
+    if since is not None:
+        diff = inventory_history.diff(since, snap)
+        return Response(
+            content=dumps(delta_payload(snap, since, diff, filters, sort_key, wanted)),
+            media_type="application/json", headers=headers,
+        )
 
+    # Bytes ya serializados (ver vm_render): ni pydantic ni json por petición
+    with timing("render"):
+        page = render_page(snap, filters, sort_key, offset, limit, wanted)
+    headers["X-Total-Count"] = str(page.total)
+    if page.next_offset is not None:
+        headers["X-Next-Offset"] = str(page.next_offset)
+    return Response(content=page.body, media_type="application/json", headers=headers)
+
+# —————— Endpoint: Estadísticas agregadas de VMs ——————
+@router.get("/vms/stats", response_model=VMStats)
+async def vm_stats(
+    request: Request,
+    group_by: str      = Query("environment,power_state",
+                               description="Campos de agrupación: environment, power_state, host, "
+                                           "cluster, network, guest_os, compatibility_code"),
+    filters: VMFilters = Depends(),
+    current_user: str  = Depends(get_current_user),
+):
+    """
+    Devuelve, por cada campo de agrupación, el número de VMs y la suma
+    de vCPUs, memoria (MiB) y disco (GB) de cada grupo.
+    - Se calcula sobre el snapshot en formato columnar.
+    - El resultado se memoriza por snapshot.
+    - Admite los mismos filtros que el listado de VMs.
+    - Es async como el listado: la espera a la carga inicial no ocupa un
+      hilo y el cálculo se delega al threadpool.
+    """
+    fields = parse_group_by(group_by)
+    try:
+        snap = inventory.current or await _until_disconnect(request, inventory.aget())
+    except HTTPException:
+        raise
+    except Exception as e:
+        log.error("Error al obtener VMs para estadísticas: %s", e)
+        raise HTTPException(status_code=500, detail="Error interno al obtener VMs")
+    return await asyncio.to_thread(compute_stats, snap, fields, filters)
+
+# —————— Endpoint: Exportación de VMs (CSV / NDJSON) ——————
+@router.get("/vms/export")
+async def export_vms(
+    request: Request,
+    format: str         = Query("csv", pattern="^(csv|ndjson)$", description="Formato: csv o ndjson"),
+    gzip: bool          = Query(False, description="Comprimir la descarga con gzip"),
+    sort: Optional[str] = Query(None, description="Orden, p. ej. name o -memory_size_MiB,name"),
+    filters: VMFilters  = Depends(),
+    current_user: str   = Depends(get_current_user),
+):
+    """
+    Exporta las VMs filtradas directamente desde el snapshot:
+    - Admite los mismos filtros y orden que el listado de VMs.
+    - Las filas se generan y envían por bloques (StreamingResponse),
+      por lo que la memoria no crece con el tamaño del inventario.
+    - Con gzip=true la salida se comprime también en streaming.
+    - Es async: la espera al snapshot no ocupa un hilo; la selección se
+      calcula en el threadpool.
+    """
+    sort_key = parse_sort(sort)
     try:
-        vms = get_vms()
+        snap = inventory.current or await _until_disconnect(request, inventory.aget())
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"❌ Error al obtener VMs en get_vms(): {e}")
+        log.error("Error al obtener VMs para exportar: %s", e)
         raise HTTPException(status_code=500, detail="Error interno al obtener VMs")
 
-    if name:
-        vms = [vm for vm in vms if name.lower() in vm.name.lower()]
-    if environment:
-        vms = [vm for vm in vms if vm.environment == environment.lower()]
-    return vms
+    positions = await asyncio.to_thread(select, snap, filters, sort_key)
+    headers = {
+        "Content-Disposition": f'attachment; filename="vms.{format}"',
+        "X-Inventory-Version": str(snap.version),
+    }
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(
+        export_stream(format, snap.vms, positions, gzip),
+        media_type=EXPORT_MEDIA[format],
+        headers=headers,
+    )
+
+# —————— Endpoint: Cambios del inventario en vivo (SSE) ——————
+@router.get("/vms/events")
+async def vm_events(
+    request: Request,
+    last_event_id: Optional[str] = Header(None),
+    current_user: str            = Depends(get_current_user_stream),
+):
+    """
+    Canal Server-Sent Events con los cambios del inventario:
+    - 'hello' al conectar con la versión vigente.
+    - 'delta' por cada snapshot nuevo con las VMs añadidas, cambiadas y
+      eliminadas (mismo formato que GET /api/vms?since=).
+    - 'reset' cuando el cliente debe recargar el listado completo.
+    - Acepta el JWT por cabecera o un token de canal en ?stream_token=
+      (POST /api/stream-token; EventSource no envía cabeceras); al
+      reconectar, Last-Event-ID recupera lo perdido.
+    """
+    return StreamingResponse(
+        inventory_events.stream(request.is_disconnected, last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# —————— Endpoint: Acciones de energía por lotes ——————
+@router.post("/vms/power", response_model=PowerJob, status_code=202)
+def vm_power_batch(
+    body: PowerBatchRequest,
+    current_user: str = Depends(get_current_user),
+):
+    """
+    Encola una acción de energía (start, stop o reset) para muchas VMs:
+    - Responde de inmediato (202) con el trabajo y su id.
+    - Las acciones se ejecutan en segundo plano con concurrencia acotada.
+    - El progreso por VM se consulta en /vms/power/{job_id}
+      (o en vivo en /vms/power/{job_id}/events).
+    """
+    return power_jobs.submit(body.vm_ids, body.action, current_user)
+
+@router.get("/vms/power/{job_id}", response_model=PowerJob)
+def vm_power_job(
+    job_id: str       = Path(..., description="ID del trabajo"),
+    current_user: str = Depends(get_current_user),
+):
+    """
+    Devuelve el progreso por VM de un trabajo de energía.
+    """
+    job = power_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    return job
+
+@router.get("/vms/power/{job_id}/events")
+async def vm_power_job_events(
+    job_id: str       = Path(..., description="ID del trabajo"),
+    current_user: str = Depends(get_current_user_stream),
+):
+    """
+    Canal SSE con el progreso de un trabajo de energía:
+    - 'progress' cada vez que termina alguna VM.
+    - 'done' con el estado final; después se cierra el canal.
+    """
+    if power_jobs.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+
+    async def stream():
+        seen = -1
+        while True:
+            job = power_jobs.get(job_id)
+            if job is None:
+                return
+            finished = job.done + job.failed
+            if job.finished_at is not None:
+                yield encode_event("done", job.model_dump())
+                return
+            if finished != seen:
+                seen = finished
+                yield encode_event("progress", job.model_dump(exclude={"items"}))
+            await asyncio.sleep(0.5)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 # —————— Endpoint: Acciones de energía sobre una VM ——————
 @router.post("/vms/{vm_id}/power/{action}")
-def vm_power_action(
+async def vm_power_action(
+    request: Request,
     vm_id: str        = Path(..., description="ID de la VM"),
     action: str       = Path(..., description="Acción: start, stop o reset"),
     current_user: str = Depends(get_current_user),
@@ -47,21 +284,29 @@ def vm_power_action(
     Ejecuta una acción de power (start, stop o reset) sobre la VM indicada.
     - Valida que la acción sea una de las permitidas.
     - Retorna una respuesta JSON con el resultado o un error 400 si la acción no es válida.
+    - La llamada a vCenter es asíncrona, con plazo y cancelación (ver _until_disconnect).
     """
     if action not in {"start", "stop", "reset"}:
         return JSONResponse(status_code=400, content={"error": "Acción no válida"})
-    return power_action(vm_id, action)
+    return await _until_disconnect(request, apower_action(vm_id, action))
 
 # —————— Endpoint: Detalle de una VM ——————
 @router.get("/vms/{vm_id}", response_model=VMDetail)
-def vm_detail(
+async def vm_detail(
+    request: Request,
     vm_id: str        = Path(..., description="ID de la VM"),
+    fresh: bool       = Query(False, description="Consultar vCenter en lugar del snapshot"),
     current_user: str = Depends(get_current_user),
 ):
     """
     Obtiene el detalle completo de una máquina virtual:
     - Reemplaza guiones bajos por medios para sanitizar el ID.
+    - Se sirve del snapshot salvo con fresh=true o si está desactualizado;
+      en ese caso consulta vCenter (async, con plazo y cancelación) y
+      actualiza el snapshot.
     - Devuelve todos los campos extendidos definidos en VMDetail.
     """
-    safe_id = vm_id.replace("_", "-")
-    return get_vm_detail(safe_id)
+    # Solo el moId admite "_" en lugar de "-"; el nombre del vCenter se respeta
+    source, sep, moid = vm_id.rpartition(":")
+    safe_id = source + sep + moid.replace("_", "-")
+    return await _until_disconnect(request, aget_vm_detail(safe_id, fresh=fresh))
@@ -0,0 +1,116 @@
+import sys
+from operator import attrgetter
+from typing import Any, Dict, Iterable, List, Optional, Set, Type, Union
+
+from app.vms.vm_models import VMBase
+
+# ───────────────────────────────────────────────────────────────────────
+# Representación compacta de las VMs del snapshot
+# ───────────────────────────────────────────────────────────────────────
+# El snapshot guarda filas con __slots__ en lugar de modelos pydantic:
+# sin __dict__ por fila, con los textos repetidos (host, cluster, redes,
+# SO, entorno...) internados una sola vez por proceso y las listas como
+# tuplas inmutables que pueden compartir varios snapshots. Los modelos
+# pydantic solo se crean en el borde de la API (to_model).
+
+VM_FIELDS = tuple(VMBase.model_fields.keys())
+
+# Campos multivalor (listas en la API, tuplas en la fila)
+LIST_FIELDS = frozenset(f for f, info in VMBase.model_fields.items()
+                        if getattr(info.annotation, "__origin__", None) is list)
+
+# Campos de baja cardinalidad cuyos valores se internan
+INTERNED_FIELDS = frozenset((
+    "vcenter", "power_state", "environment", "guest_os", "host", "cluster",
+    "compatibility_code", "compatibility_human", "networks", "disks", "nics",
+))
+
+_intern = sys.intern
+_values = attrgetter(*VM_FIELDS)
+# (campo, es_lista) en el orden de VMBase, para serializar sin consultas
+_PLAN   = tuple((f, f in LIST_FIELDS) for f in VM_FIELDS)
+
+
+def _compact(field: str, value: Any) -> Any:
+    if field in LIST_FIELDS:
+        if not value:
+            return ()
+        if field in INTERNED_FIELDS:
+            return tuple(_intern(v) if isinstance(v, str) else v for v in value)
+        return tuple(value)
+    if field in INTERNED_FIELDS and isinstance(value, str):
+        return _intern(value)
+    return value
+
+
+class VMRow:
+    """
+    Fila inmutable de una VM del snapshot, con los mismos atributos que
+    VMBase (getattr(row, campo) funciona igual en índices, orden y
+    agregaciones). Para cambiar un campo se crea otra fila con replace().
+    """
+    __slots__ = VM_FIELDS
+
+    def __init__(self, **values: Any):
+        for f in VM_FIELDS:
+            object.__setattr__(self, f, _compact(f, values.get(f)))
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError("VMRow es inmutable; usa replace()")
+
+    @classmethod
+    def from_model(cls, vm: Union["VMRow", VMBase, Dict[str, Any]]) -> "VMRow":
+        """
+        Convierte un VMBase (o un dict con sus campos) en fila; las filas
+        se devuelven tal cual.
+        """
+        if isinstance(vm, VMRow):
+            return vm
+        if isinstance(vm, dict):
+            return cls(**vm)
+        return cls(**{f: getattr(vm, f, None) for f in VM_FIELDS})
+
+    def replace(self, **changes: Any) -> "VMRow":
+        """
+        Copia de la fila con los campos indicados cambiados.
+        """
+        values = dict(zip(VM_FIELDS, _values(self)))
+        values.update(changes)
+        return VMRow(**values)
+
+    def as_dict(self, fields: Optional[Set[str]] = None) -> Dict[str, Any]:
+        """
+        Diccionario serializable (listas en vez de tuplas), opcionalmente
+        limitado a `fields`.
+        """
+        if fields is None:
+            return {f: list(v) if is_list else v for (f, is_list), v in zip(_PLAN, _values(self))}
+        return {f: list(v) if is_list else v
+                for (f, is_list), v in zip(_PLAN, _values(self)) if f in fields}
+
+    def to_model(self, model: Type[VMBase] = VMBase) -> VMBase:
+        """
+        Materializa el modelo pydantic (sin revalidar: los datos ya lo estaban).
+        """
+        return model.model_construct(**self.as_dict())
+
+    def values(self) -> tuple:
+        """
+        Valores de todos los campos en orden (hashable; sirve de huella).
+        """
+        return _values(self)
+
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, VMRow) and self.values() == other.values()
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return f"VMRow(id={self.id!r}, name={self.name!r})"
+
+
+def compact_vms(vms: Iterable[Union[VMRow, VMBase, Dict[str, Any]]]) -> List[VMRow]:
+    """
+    Convierte una lista de VMs al formato compacto del snapshot.
+    """
+    return [VMRow.from_model(vm) for vm in vms]
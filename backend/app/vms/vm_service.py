@@ -1,343 +1,591 @@
-import ssl                                # SOAP interaction
-import requests
-import urllib3
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
 from fastapi import HTTPException
-from cachetools import TTLCache
-from typing import List, Dict, Tuple     # SOAP placement returns Tuple
-
-from pyVim.connect import SmartConnect, Disconnect        # SOAP client
-from pyVmomi import vim                                   # vSphere SDK types
-
-from app.config import VCENTER_HOST, VCENTER_USER, VCENTER_PASS
+from typing import Iterable, List, Dict, Optional, Tuple     # SOAP placement returns Tuple
+
+from app.config import (
+    VCENTER_MAX_CONCURRENCY, INVENTORY_REFRESH_SECONDS, INVENTORY_PERSIST_ENABLED,
+    VM_DETAIL_MAX_AGE_SECONDS, INVENTORY_SYNC_ENABLED, SHARED_BACKEND, NETWORK_REFRESH_SECONDS,
+)
+from app.cache import caches, MISSING
+from app.metrics import metrics, stage
+from app.singleflight import inflight
 from app.vms.vm_models import VMBase, VMDetail
+from app.vms.vm_rows import VMRow
+from app.vms.vm_mapping import COMPAT_MAP, infer_environment
+from app.vms.vm_collector import (
+    collect_inventory, collect_placement, retrieve_vm_placement,
+)
+from app.vms.vm_session import (         # sesiones REST/SOAP persistentes
+    VCenterSession, vcenter, vcenters, FEDERATED, vm_id_prefix, resolve_vm,
+)
+from app.vms.vm_networks import NetworkResolver
+from app.vms.vm_inventory import InventoryStore
+from app.vms.vm_sync import InventorySync
+from app.vms.vm_snapshot_store import SqliteSnapshotStore
+from app.vms.vm_shared_store import make_shared_store
+from app.vms.vm_leader import InventoryLeadership
+from app.vms.vm_index import index_for
+from app.vms.vm_render import encoded_rows, prune_pages
+from app.vms.vm_delta import SnapshotHistory
+from app.vms.vm_events import InventoryEvents
+from app.vms.vm_power_jobs import POWER_RESULT, PowerJobQueue
+
+log = logging.getLogger(__name__)
 
 # ───────────────────────────────────────────────────────────────────────
 # Configuración global y mapeos
 # ───────────────────────────────────────────────────────────────────────
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
-# Mapa de versiones VMX → descripción humana
-COMPAT_MAP = {
-    "VMX_03": "ESXi 2.5 and later (VM version 3)",
-    # ... (otros mapeos intermedios) ...
-    "VMX_21": "ESXi 8.0 U2 and later (VM version 21)",
+# CACHÉS de datos para evitar llamadas repetidas (ver app/cache.py;
+# tamaños y TTL configurables con CACHE_MAXSIZES / CACHE_TTLS)
+# Las claves por VM son sus ids de la API (únicos entre vCenter); las de
+# redes incluyen el nombre del vCenter, cuyos ids de red pueden repetirse.
+identity_cache  = caches.namespace("identity",    maxsize=20000)  # información de guest identity
+network_cache   = caches.namespace("network",     maxsize=2000)   # ids de red sueltos fuera del mapa
+net_list_cache  = caches.namespace("network_map", maxsize=max(1, len(vcenters)),  # mapeo de redes por vCenter
+                                  ttl=NETWORK_REFRESH_SECONDS)
+placement_cache = caches.namespace("placement",   maxsize=50000)  # host y cluster (SOAP)
+
+# Resolución de nombres de red en bloque, una por vCenter (ver vm_networks)
+network_resolvers: Dict[str, NetworkResolver] = {
+    name: NetworkResolver(session, net_list_cache, network_cache)
+    for name, session in vcenters.items()
 }
 
-# CACHÉS de datos para evitar llamadas repetidas
-vm_cache        = TTLCache(maxsize=1,    ttl=300)   # listado de VMs
-identity_cache  = TTLCache(maxsize=1000, ttl=300)  # información de guest identity
-network_cache   = TTLCache(maxsize=2000, ttl=300)  # nombres de red individuales
-net_list_cache  = TTLCache(maxsize=1,    ttl=300)  # mapeo completo de redes
-host_cache      = TTLCache(maxsize=200,  ttl=300)  # nombres de host
-placement_cache = TTLCache(maxsize=2000, ttl=300)  # host y cluster (SOAP)
-
-# Configuración para conexión SOAP a vCenter
-SOAP_CONF = {
-    "host": VCENTER_HOST.replace("https://", "").replace("http://", ""),
-    "user": VCENTER_USER,
-    "pwd":  VCENTER_PASS,
-    "port": 443,
-}
+# Espacios con datos de una VM concreta (se invalidan tras cambiar su estado)
+VM_SCOPED_CACHES = ("identity", "placement")
+
+# Consultas por VM agrupadas con single-flight: clave (operación, vm_id)
+# (ver app/singleflight.py); las peticiones simultáneas a la misma VM
+# comparten una sola llamada a vCenter
+VM_FLIGHTS = ("identity", "placement", "detail")
+
+# Campos del detalle con otra representación que la fila del listado: no
+# se escriben de vuelta en el snapshot (guest_os es el nombre completo de
+# la identidad, "Red Hat Enterprise Linux 8 (64-bit)", frente al guestId
+# "RHEL_8_64" por el que se filtra y agrupa el inventario)
+DETAIL_ONLY_FIELDS = ("guest_os",)
 
-def _soap_connect():
+def refresh_placement_index(session: VCenterSession = vcenter) -> Dict[str, Tuple[str, str]]:
     """
-    Crea una conexión no verificada al vCenter via pyVmomi
-    y devuelve el ServiceInstance y su Content.
+    Construye en una sola pasada el índice VM → (host, cluster) de un
+    vCenter y rellena placement_cache para todas sus VMs a la vez.
     """
-    ctx = ssl._create_unverified_context()
-    si = SmartConnect(
-        host=SOAP_CONF["host"],
-        user=SOAP_CONF["user"],
-        pwd=SOAP_CONF["pwd"],
-        port=SOAP_CONF["port"],
-        sslContext=ctx
-    )
-    return si, si.RetrieveContent()
+    prefix = vm_id_prefix(session)
+    try:
+        index = session.soap_call(lambda content: collect_placement(content, prefix), op="collect_placement")
+    except Exception as e:
+        log.warning("Índice de ubicación SOAP de %s fallido → %s", session.name, e)
+        return {}
+
+    placement_cache.update(index)
+    return index
 
 def get_host_cluster_soap(vm_id: str) -> Tuple[str, str]:
     """
     Obtiene el nombre del host y cluster que hospedan la VM.
-    Utiliza pyVmomi (SOAP) y cache para mejorar rendimiento.
+    Consulta el índice en placement_cache; si el moId no está,
+    hace un refresco dirigido solo para esa VM (uno por VM aunque
+    lleguen varias peticiones a la vez).
     """
-    if vm_id in placement_cache:
-        return placement_cache[vm_id]
-
-    host_name, clus_name = "<sin datos host>", "<sin datos cluster>"
+    cached = placement_cache.get(vm_id, MISSING)
+    if cached is not MISSING:
+        return cached
+    return inflight.do(("placement", vm_id), _load_placement, vm_id)
+
+def _load_placement(vm_id: str) -> Tuple[str, str]:
+    cached = placement_cache.get(vm_id, MISSING)
+    if cached is not MISSING:
+        return cached   # la rellenó una llamada que acababa de terminar
     try:
-        si, content = _soap_connect()
-        view = content.viewManager.CreateContainerView(
-            content.rootFolder, [vim.VirtualMachine], True
+        session, moid = resolve_vm(vm_id)
+        placement = session.soap_call(
+            lambda content: retrieve_vm_placement(content, moid), op="vm_placement"
         )
-        for vm in view.view:
-            if vm._moId == vm_id:
-                host_obj    = vm.summary.runtime.host
-                cluster_obj = host_obj.parent
-                host_name   = getattr(host_obj,    "name", host_name)
-                clus_name   = getattr(cluster_obj, "name", clus_name)
-                break
-        view.Destroy()
+        placement_cache.set(vm_id, placement)
     except Exception as e:
-        print(f"[DEBUG] SOAP placement ({vm_id}) fail → {e}")
-    finally:
-        try: Disconnect(si)
-        except: pass
+        log.warning("Ubicación SOAP de %s fallida → %s", vm_id, e)
+        placement = ("<sin datos host>", "<sin datos cluster>")
+        placement_cache.set(vm_id, placement, negative=True)
+    return placement
 
-    placement_cache[vm_id] = (host_name, clus_name)
-    return host_name, clus_name
+def invalidate_vm_caches(vm_id: str) -> None:
+    """
+    Descarta lo cacheado de una VM (identidad, ubicación) tras un cambio
+    de estado, p. ej. una acción de energía, o antes de una lectura en vivo.
+    """
+    caches.invalidate(vm_id, *VM_SCOPED_CACHES)
+
+def vm_state_changed(vm_id: str) -> None:
+    """
+    Tras cambiar el estado de una VM (acción de energía) descarta su caché
+    y deja de compartir sus consultas aún en curso, que ya no valdrían:
+    las siguientes peticiones consultan de nuevo.
+    """
+    invalidate_vm_caches(vm_id)
+    inflight.forget(*((op, vm_id) for op in VM_FLIGHTS))
 
 def get_session_token() -> str:
     """
-    Autentica contra la API REST de vCenter para obtener un token de sesión.
+    Devuelve el token de la sesión REST persistente (ver vm_session),
+    autenticando solo si no hay sesión o ha caducado.
     Lanza HTTPException en caso de fallo.
     """
-    try:
-        r = requests.post(
-            f"{VCENTER_HOST}/rest/com/vmware/cis/session",
-            auth=(VCENTER_USER, VCENTER_PASS),
-            verify=False, timeout=5
-        )
-        r.raise_for_status()
-        return r.json()["value"]
-    except Exception as e:
-        code = getattr(e, "response", None) and e.response.status_code or 500
-        raise HTTPException(status_code=code, detail=f"Auth failed: {e}")
+    return vcenter.token()
 
-def infer_environment(name: str) -> str:
+def load_network_map(session: VCenterSession = vcenter) -> Dict[str, str]:
     """
-    Inferencia de entorno (test, producción, sandbox, desarrollo)
-    a partir del prefijo del nombre de la VM.
+    Mapeo completo de IDs de red → nombres legibles de un vCenter
+    (cargado en bloque y renovado con NETWORK_REFRESH_SECONDS, ver vm_networks).
     """
-    p = (name or "").upper()
-    if p.startswith("T-"): return "test"
-    if p.startswith("P-"): return "producción"
-    if p.startswith("S"): return "sandbox"
-    if p.startswith("D-"): return "desarrollo"
-    return "desconocido"
+    return network_resolvers[session.name].mapping()
 
-def load_network_map(headers: dict) -> Dict[str, str]:
+def fetch_guest_identity(vm_id: str) -> dict:
     """
-    Carga el mapeo completo de IDs de red → nombres legibles.
-    Utiliza cache para evitar llamadas REST repetidas.
+    Obtiene información de identidad del guest OS via REST.
+    Guarda en cache los resultados para reuso; las peticiones simultáneas
+    de la misma VM comparten una sola consulta.
     """
-    if "net_map" in net_list_cache:
-        return net_list_cache["net_map"]
+    val = identity_cache.get(vm_id)
+    if val is not None:
+        return val
+    return inflight.do(("identity", vm_id), _load_guest_identity, vm_id)
+
+def _load_guest_identity(vm_id: str) -> dict:
+    val = identity_cache.get(vm_id)
+    if val is not None:
+        return val
+    try:
+        session, moid = resolve_vm(vm_id)
+        r = session.get(f"/rest/vcenter/vm/{moid}/guest/identity", timeout=5)
+        val = r.json().get("value", {}) if r.status_code == 200 else {}
+        if not isinstance(val, dict):   # respuesta inesperada: sin identidad
+            val = {}
+    except:
+        val = {}
+    # Sin identidad (VMware Tools parado, error...) se reintenta pronto
+    identity_cache.set(vm_id, val, negative=not val)
+    return val
 
+def build_source_inventory(session: VCenterSession = vcenter) -> List[VMRow]:
+    """
+    Construye el inventario de máquinas virtuales de un vCenter:
+      1. Intenta la recolección masiva vía PropertyCollector (O(páginas)).
+      2. Si SOAP falla, recurre al recorrido REST por VM.
+    """
     try:
-        r = requests.get(
-            f"{VCENTER_HOST}/rest/vcenter/network",
-            headers=headers, verify=False, timeout=10
-        )
-        r.raise_for_status()
-        mapping = {item["network"]: item["name"] for item in r.json().get("value", [])}
+        return get_vms_soap(session)
     except Exception as e:
-        print(f"[DEBUG] load_network_map fail → {e}")
-        mapping = {}
+        log.warning("PropertyCollector de %s fallido → %s; usando REST", session.name, e)
+        return get_vms_rest(session)
 
-    net_list_cache["net_map"] = mapping
-    return mapping
+def build_inventory() -> List[VMRow]:
+    """
+    Construye el inventario completo de todos los vCenter configurados,
+    recolectándolos en paralelo. Si un vCenter falla se conservan sus
+    VMs del snapshot anterior; solo falla el refresco si fallan todos.
+    """
+    if not FEDERATED:
+        return build_source_inventory(vcenter)
+
+    with ThreadPoolExecutor(max_workers=len(vcenters)) as pool:
+        futures = {name: pool.submit(build_source_inventory, s) for name, s in vcenters.items()}
+    previous = inventory.snapshot
+    vms: List[VMRow] = []
+    errors = []
+    for name, future in futures.items():
+        try:
+            vms.extend(future.result())
+        except Exception as e:
+            log.warning("Inventario de %s fallido → %s; se conservan sus VMs anteriores", name, e)
+            errors.append(e)
+            if previous is not None:
+                vms.extend(vm for vm in previous.vms if vm.vcenter == name)
+    if len(errors) == len(futures):
+        raise errors[0]
+    return vms
+
+def _snapshot_maps() -> dict:
+    """
+    Mapas auxiliares que se persisten junto al snapshot de VMs.
+    """
+    return {
+        "placement": {k: list(v) for k, v in list(placement_cache.items())},
+        "networks":  dict(net_list_cache.items()),
+    }
 
-def get_network_name(network_id: str, headers: dict) -> str:
+def _restore_maps(extras: dict) -> None:
     """
-    Consulta el nombre de una red específica por su ID via REST,
-    con caching local para mejorar rendimiento.
+    Restaura en caché los mapas de ubicación y redes (por vCenter) persistidos.
     """
-    if network_id in network_cache:
-        return network_cache[network_id]
-    try:
-        r = requests.get(
-            f"{VCENTER_HOST}/rest/vcenter/network/{network_id}",
-            headers=headers, verify=False, timeout=5
-        )
-        r.raise_for_status()
-        name = r.json().get("value", {}).get("name", "<sin nombre>")
-    except Exception as e:
-        print(f"[DEBUG] get_network_name {network_id} fail → {e}")
-        name = "<error>"
-    network_cache[network_id] = name
-    return name
+    placement_cache.update({k: tuple(v) for k, v in extras.get("placement", {}).items()})
+    networks = extras.get("networks") or {}
+    if networks and not all(isinstance(m, dict) for m in networks.values()):
+        networks = {vcenter.name: networks}     # formato anterior: un solo mapa
+    net_list_cache.update(networks)
+    for name, mapping in networks.items():
+        if name in network_resolvers:
+            network_resolvers[name].restore(mapping)
+
+# Almacén compartido entre workers (SHARED_BACKEND); si no se configura,
+# cada worker persiste su propio snapshot en app.db
+shared_store = (
+    make_shared_store(SHARED_BACKEND, extras=_snapshot_maps, on_restore=_restore_maps)
+    if SHARED_BACKEND else None
+)
+
+# Snapshot del inventario, reconstruido en segundo plano (ver main.startup)
+# y persistido para que los reinicios no esperen un rastreo completo
+inventory = InventoryStore(
+    build_inventory,
+    INVENTORY_REFRESH_SECONDS,
+    persistence=shared_store or (
+        SqliteSnapshotStore(extras=_snapshot_maps, on_restore=_restore_maps)
+        if INVENTORY_PERSIST_ENABLED else None
+    ),
+)
+# Índices de consulta y filas JSON precalculados una vez por snapshot
+inventory.subscribe(index_for)
+inventory.subscribe(encoded_rows)
+inventory.subscribe(prune_pages)
+# Huellas de las últimas versiones para responder a GET /api/vms?since=
+inventory_history = SnapshotHistory()
+inventory.subscribe(inventory_history.record)
+# Difusión de los cambios a los paneles conectados por SSE (usa el historial)
+inventory_events = InventoryEvents(inventory_history)
+inventory.subscribe(inventory_events.on_snapshot)
+
+# Acciones de energía por lotes (pool acotado contra vCenter)
+power_jobs = PowerJobQueue(resolve_vm, inventory, on_success=vm_state_changed)
+
+# Sincronización incremental que mantiene el snapshot al día tras la carga
+# inicial: una por vCenter, cada una publica solo sus VMs si hay varios
+inventory_syncs: Dict[str, InventorySync] = {
+    name: InventorySync(
+        session, inventory,
+        on_placement = placement_cache.update,
+        partition    = name if FEDERATED else None,
+    )
+    for name, session in vcenters.items()
+}
 
-def fetch_guest_identity(vm_id: str, headers: dict) -> dict:
+def inventory_live() -> bool:
     """
-    Obtiene información de identidad del guest OS via REST.
-    Guarda en cache los resultados para reuso.
+    True si la sincronización incremental de todos los vCenter está al día.
     """
-    if vm_id in identity_cache:
-        return identity_cache[vm_id]
-    try:
-        r = requests.get(
-            f"{VCENTER_HOST}/rest/vcenter/vm/{vm_id}/guest/identity",
-            headers=headers, verify=False, timeout=5
-        )
-        val = r.json().get("value", {}) if r.status_code == 200 else {}
-    except:
-        val = {}
-    identity_cache[vm_id] = val
-    return val
+    return all(sync.live for sync in inventory_syncs.values())
+
+def start_inventory_feed() -> None:
+    """
+    Arranca el productor del inventario de este worker: la sincronización
+    incremental o, si está desactivada, el refresco completo periódico.
+    """
+    if INVENTORY_SYNC_ENABLED:
+        for sync in inventory_syncs.values():
+            sync.start()
+    else:
+        inventory.start()
+
+def stop_inventory_feed() -> None:
+    for sync in inventory_syncs.values():
+        sync.stop()
+    inventory.stop()
+
+# Con almacén compartido solo el worker líder rastrea vCenter
+inventory_leadership = (
+    InventoryLeadership(shared_store, inventory, start_inventory_feed, stop_inventory_feed)
+    if shared_store else None
+)
+
+# Estado del snapshot y de la sincronización, leído en cada scrape de /metrics
+@metrics.collector
+def _inventory_metrics():
+    snap = inventory.snapshot
+    yield "inventory_snapshot_version", "gauge", "Versión del snapshot vigente", [({}, snap.version if snap else 0)]
+    yield "inventory_snapshot_age_seconds", "gauge", "Antigüedad del snapshot vigente", [({}, snap.age if snap else 0)]
+    yield "inventory_vms", "gauge", "VMs del snapshot vigente por vCenter", [
+        ({"vcenter": name}, n) for name, n in _count_by_vcenter(snap).items()
+    ]
+    yield "inventory_sync_live", "gauge", "1 si la sincronización incremental del vCenter está al día", [
+        ({"vcenter": name}, int(sync.live)) for name, sync in inventory_syncs.items()
+    ]
+
+def _count_by_vcenter(snap) -> Dict[str, int]:
+    counts: Dict[str, int] = {}
+    for vm in snap.vms if snap else []:
+        counts[vm.vcenter or ""] = counts.get(vm.vcenter or "", 0) + 1
+    return counts
 
 def get_vms() -> List[VMBase]:
     """
-    Recupera y construye la lista de máquinas virtuales:
-      1. Autentica y obtiene token de sesión.
-      2. Carga mapeo de redes.
-      3. Llama al endpoint REST para listado de VMs.
-      4. Por cada VM:
-         - Consulta detalles básicos (hardware, guest OS).
-         - Obtiene host y cluster por SOAP.
-         - Extrae IPs, discos y NICs.
-         - Resuelve nombres de redes primarias y fallback.
-      5. Cachea el resultado completo.
-    """
-    if "vms" in vm_cache:
-        return vm_cache["vms"]
-
-    token   = get_session_token()
-    headers = {"vmware-api-session-id": token}
-    net_map = load_network_map(headers)
-
-    r = requests.get(
-        f"{VCENTER_HOST}/rest/vcenter/vm",
-        headers=headers, verify=False, timeout=10
-    )
-    r.raise_for_status()
-
-    out: List[VMBase] = []
-    for vm in r.json().get("value", []):
-        vm_id   = vm["vm"]
-        vm_name = vm["name"] or f"<sin nombre {vm_id}>"
-        env     = infer_environment(vm_name)
-
-        # Detalles básicos via REST
-        s = requests.get(
-            f"{VCENTER_HOST}/rest/vcenter/vm/{vm_id}",
-            headers=headers, verify=False, timeout=5
+    Devuelve la lista de máquinas virtuales del último snapshot bueno
+    (materializa los modelos pydantic a partir de las filas compactas).
+    Solo bloquea si todavía no se ha construido ninguno.
+    """
+    return [vm.to_model() for vm in inventory.get().vms]
+
+def get_vms_soap(session: VCenterSession = vcenter) -> List[VMRow]:
+    """
+    Construye el inventario de un vCenter con una única ContainerView y
+    RetrievePropertiesEx paginado (ver vm_collector), y aprovecha la
+    misma pasada para rellenar placement_cache.
+    """
+    prefix = vm_id_prefix(session)
+    # Una sola pasada trae VMs y ubicación: se mide como "list"
+    with stage("list", session.name):
+        vms, placement = session.soap_call(
+            lambda content: collect_inventory(content, session.name, prefix), op="collect_inventory"
         )
-        guest_os = s.json()["value"].get("guest_OS") if s.status_code == 200 else None
-
-        hw = requests.get(
-            f"{VCENTER_HOST}/rest/vcenter/vm/{vm_id}/hardware",
-            headers=headers, verify=False, timeout=5
-        ).json().get("value", {})
-
-        compat_code  = hw.get("version", "<sin datos>")
-        compat_human = COMPAT_MAP.get(compat_code, compat_code)
-
-        host_name, cluster_name = get_host_cluster_soap(vm_id)
-
-        # Extracción de IPs, discos y NICs del guest
-        ident = fetch_guest_identity(vm_id, headers)
-        ips = []
-        ip_val = ident.get("ip_address")
-        if isinstance(ip_val, str):
-            ips.append(ip_val)
-        elif isinstance(ip_val, list):
-            ips.extend(ip_val)
-
-        disks, nics = [], []
-        if s.status_code == 200:
-            for d in s.json()["value"].get("disks", []):
-                cap = d.get("value", {}).get("capacity")
-                if isinstance(cap, int):
-                    disks.append(f"{cap // (1024**3)} GB")
-            for nic in s.json()["value"].get("nics", []):
-                label = nic.get("value", {}).get("label")
-                if label:
-                    nics.append(label)
-
-        # Resolución de nombres de redes conectadas
-        networks: List[str] = []
-        try:
-            eth = requests.get(
-                f"{VCENTER_HOST}/rest/vcenter/vm/{vm_id}/hardware/ethernet",
-                headers=headers, verify=False, timeout=5
-            )
-            if eth.status_code == 200:
-                for nic in eth.json().get("value", []):
-                    backing = nic.get("backing", {})
-                    if backing.get("network_name"):
-                        networks.append(backing["network_name"])
-                    elif backing.get("network"):
-                        nid = backing["network"]
-                        networks.append(net_map.get(nid) or get_network_name(nid, headers))
-        except Exception as e:
-            print(f"[DEBUG] VM {vm_id}: ethernet fail → {e}")
-
-        # Fallback si no conseguimos datos de red
-        if not networks and s.status_code == 200:
-            for nic in s.json()["value"].get("nics", []):
-                v = nic.get("value", {})
-                backing = v.get("backing", {})
-                if backing.get("network_name"):
-                    networks.append(backing["network_name"])
-                elif backing.get("network"):
-                    nid = backing["network"]
-                    networks.append(net_map.get(nid) or get_network_name(nid, headers))
-
-        if not networks:
-            networks = ["<sin datos>"]
-
-        out.append(
-            VMBase(
-                id                  = vm_id,
-                name                = vm_name,
-                power_state         = vm.get("power_state", "unknown"),
-                cpu_count           = vm.get("cpu_count", 0),
-                memory_size_MiB     = vm.get("memory_size_MiB", 0),
-                environment         = env,
-                guest_os            = guest_os,
-                host                = host_name,
-                cluster             = cluster_name,
-                compatibility_code  = compat_code,
-                compatibility_human = compat_human,
-                networks            = networks,
-                ip_addresses        = ips,
-                disks               = disks,
-                nics                = nics,
-            )
+
+    placement_cache.update(placement)
+    return vms
+
+def get_vms_rest(session: VCenterSession = vcenter) -> List[VMRow]:
+    """
+    Construye la lista de máquinas virtuales de un vCenter vía REST:
+      1. Llama al endpoint REST para listado de VMs.
+      2. Enriquece las VMs en paralelo con un pool acotado de hilos
+         (VCENTER_MAX_CONCURRENCY); el orden del listado se conserva.
+      3. Resuelve de una vez los ids de red de todas las NICs con el
+         NetworkResolver (como mucho una consulta a vCenter).
+    """
+    with stage("list", session.name):
+        r = session.get("/rest/vcenter/vm", timeout=10)
+        r.raise_for_status()
+        vms = r.json().get("value", [])
+
+    # Índice de ubicación construido una sola vez para todas las VMs
+    with stage("placement", session.name):
+        refresh_placement_index(session)
+
+    with stage("enrichment", session.name), ThreadPoolExecutor(max_workers=VCENTER_MAX_CONCURRENCY) as pool:
+        fetched = list(pool.map(lambda vm: _fetch_vm_rest(vm, session), vms))
+
+    with stage("network", session.name):
+        names = network_resolvers[session.name].resolve(
+            nid for _, refs in fetched for _, nid in refs
         )
+    return [VMRow(**fields, networks=_network_names(refs, names)) for fields, refs in fetched]
+
+def _backing_refs(backings: Iterable[dict]) -> List[Tuple[str, str]]:
+    """
+    (nombre, id) de la red de cada backing de NIC: el nombre si vCenter
+    ya lo incluye, si no el id (red estándar, portgroup o red opaca)
+    para resolverlo después en bloque.
+    """
+    refs = []
+    for backing in backings:
+        if backing.get("network_name"):
+            refs.append((backing["network_name"], ""))
+        elif backing.get("network") or backing.get("opaque_network_id"):
+            refs.append(("", backing.get("network") or backing["opaque_network_id"]))
+    return refs
 
-    vm_cache["vms"] = out
-    return out
+def _network_names(refs: List[Tuple[str, str]], names: Dict[str, str]) -> List[str]:
+    return [name or names.get(nid, nid) for name, nid in refs] or ["<sin datos>"]
+
+def _fetch_vm_rest(vm: dict, session: VCenterSession = vcenter) -> Tuple[dict, List[Tuple[str, str]]]:
+    """
+    Enriquece una VM del listado REST:
+      - Consulta detalles básicos (hardware, guest OS).
+      - Obtiene host y cluster del índice de ubicación SOAP.
+      - Extrae IPs, discos y NICs.
+      - Recoge las redes de las NICs (ethernet o, en su defecto, el resumen)
+        sin resolver sus nombres.
+    Devuelve los campos de la fila (salvo networks) y las referencias de red.
+    """
+    moid    = vm["vm"]
+    vm_id   = vm_id_prefix(session) + moid
+    vm_name = vm["name"] or f"<sin nombre {moid}>"
+    env     = infer_environment(vm_name)
+
+    # Detalles básicos via REST
+    s = session.get(f"/rest/vcenter/vm/{moid}", timeout=5)
+    summ = s.json()["value"] if s.status_code == 200 else {}
+    guest_os = summ.get("guest_OS")
+
+    hw = session.get(
+        f"/rest/vcenter/vm/{moid}/hardware", timeout=5
+    ).json().get("value", {})
+
+    compat_code  = hw.get("version", "<sin datos>")
+    compat_human = COMPAT_MAP.get(compat_code, compat_code)
+
+    host_name, cluster_name = get_host_cluster_soap(vm_id)
+
+    # Extracción de IPs, discos y NICs del guest
+    ident = fetch_guest_identity(vm_id)
+    ips = []
+    ip_val = ident.get("ip_address")
+    if isinstance(ip_val, str):
+        ips.append(ip_val)
+    elif isinstance(ip_val, list):
+        ips.extend(ip_val)
+
+    disks, nics = [], []
+    for d in summ.get("disks", []):
+        cap = d.get("value", {}).get("capacity")
+        if isinstance(cap, int):
+            disks.append(f"{cap // (1024**3)} GB")
+    for nic in summ.get("nics", []):
+        label = nic.get("value", {}).get("label")
+        if label:
+            nics.append(label)
+
+    # Redes conectadas (ids sin resolver)
+    refs: List[Tuple[str, str]] = []
+    try:
+        eth = session.get(f"/rest/vcenter/vm/{moid}/hardware/ethernet", timeout=5)
+        if eth.status_code == 200:
+            refs = _backing_refs(nic.get("backing", {}) for nic in eth.json().get("value", []))
+    except Exception as e:
+        log.warning("Ethernet de la VM %s fallido → %s", vm_id, e)
+
+    # Fallback si no conseguimos datos de red
+    if not refs:
+        refs = _backing_refs(nic.get("value", {}).get("backing", {}) for nic in summ.get("nics", []))
+
+    return dict(
+        id                  = vm_id,
+        vcenter             = session.name,
+        name                = vm_name,
+        power_state         = vm.get("power_state", "unknown"),
+        cpu_count           = vm.get("cpu_count", 0),
+        memory_size_MiB     = vm.get("memory_size_MiB", 0),
+        environment         = env,
+        guest_os            = guest_os,
+        host                = host_name,
+        cluster             = cluster_name,
+        compatibility_code  = compat_code,
+        compatibility_human = compat_human,
+        ip_addresses        = ips,
+        disks               = disks,
+        nics                = nics,
+    ), refs
 
 def power_action(vm_id: str, action: str) -> dict:
     """
     Ejecuta una acción de energía (start/stop/reset) sobre una VM
-    vía REST y retorna un mensaje de resultado o lanza error HTTP.
+    vía REST, actualiza su power_state en el snapshot y retorna un
+    mensaje de resultado o lanza error HTTP.
     """
-    token   = get_session_token()
-    headers = {"vmware-api-session-id": token}
-
-    r = requests.post(
-        f"{VCENTER_HOST}/rest/vcenter/vm/{vm_id}/power/{action}",
-        headers=headers, verify=False, timeout=5
-    )
+    session, moid = resolve_vm(vm_id)
+    r = session.post(f"/rest/vcenter/vm/{moid}/power/{action}", timeout=5)
     if r.status_code == 200:
+        # Refleja el nuevo estado en el snapshot sin esperar al refresco
+        inventory.patch({vm_id: {"power_state": POWER_RESULT[action]}})
+        vm_state_changed(vm_id)
         return {"message": f"Acción '{action}' ejecutada en VM {vm_id}"}
     raise HTTPException(status_code=r.status_code, detail=r.text)
 
-def get_vm_detail(vm_id: str) -> VMDetail:
+def get_vm_detail(vm_id: str, fresh: bool = False) -> VMDetail:
+    """
+    Devuelve el detalle de una VM:
+      - Por defecto lo sirve del snapshot (búsqueda O(1) por id en su índice),
+        sin esperar a que se construya si todavía no existe.
+      - Consulta vCenter solo si se pide `fresh`, si la VM no está en el
+        snapshot o si este es más antiguo que VM_DETAIL_MAX_AGE_SECONDS
+        (salvo que la sincronización incremental lo mantenga al día).
+      - El resultado en vivo se escribe de vuelta en el snapshot (salvo
+        DETAIL_ONLY_FIELDS).
+      - El guest OS es siempre el nombre completo de la identidad del guest
+        (cacheada), también cuando el resto sale del snapshot.
+      - Las peticiones simultáneas de la misma VM esperan a una sola
+        consulta en curso y comparten su resultado.
+    """
+    cached, snap, pos = _snapshot_detail(vm_id, fresh)
+    if cached is not None:
+        return _with_guest_name(cached, fetch_guest_identity(vm_id))
+    return inflight.do(("detail", vm_id), _load_vm_detail, vm_id, snap, pos)
+
+def _load_vm_detail(vm_id: str, snap, pos) -> VMDetail:
+    detail = fetch_vm_detail(vm_id)
+    _write_back(snap, pos, detail)
+    return detail
+
+def _snapshot_detail(vm_id: str, fresh: bool):
+    """
+    (detalle servido del snapshot o None si hay que ir a vCenter, snapshot, posición).
+    """
+    snap  = inventory.snapshot
+    pos   = index_for(snap).by_id.get(vm_id) if snap else None
+    stale = snap is None or (snap.age > VM_DETAIL_MAX_AGE_SECONDS and not inventory_live())
+    if pos is not None and not fresh and not stale:
+        return snap.vms[pos].to_model(VMDetail), snap, pos
+    if fresh:
+        invalidate_vm_caches(vm_id)
+    return None, snap, pos
+
+def _with_guest_name(detail: VMDetail, ident: dict) -> VMDetail:
+    """
+    Sustituye el guestId de la fila del snapshot por el nombre completo del guest OS.
+    """
+    return detail.model_copy(update={"guest_os": _guest_os_name(ident, detail.guest_os)})
+
+def _guest_os_name(ident: dict, fallback: Optional[str]) -> str:
+    full = ident.get("full_name")
+    return (
+        full.get("default_message") if isinstance(full, dict) else full
+    ) or ident.get("name") or fallback or "Desconocido"
+
+def _write_back(snap, pos, detail: VMDetail) -> None:
     """
-    Construye y retorna un VMDetail completo:
+    Parchea en el snapshot los campos que hayan cambiado en el detalle en
+    vivo (solo los que comparten representación con el listado).
+    """
+    if pos is None:
+        return
+    current = snap.vms[pos].as_dict()
+    changes = {
+        f: getattr(detail, f) for f in VMBase.model_fields
+        if f not in DETAIL_ONLY_FIELDS and getattr(detail, f) != current[f]
+    }
+    if changes:
+        inventory.patch({detail.id: changes})
+
+def fetch_vm_detail(vm_id: str) -> VMDetail:
+    """
+    Construye y retorna un VMDetail completo consultando vCenter:
       - Obtiene summary, hardware y guest identity.
       - Procesa CPU, memoria, discos, NICs y redes.
       - Incluye host/cluster por SOAP y detalle de guest OS.
     """
-    token   = get_session_token()
-    headers = {"vmware-api-session-id": token}
+    session, moid = resolve_vm(vm_id)
 
     # Resumen principal
-    s = requests.get(
-        f"{VCENTER_HOST}/rest/vcenter/vm/{vm_id}",
-        headers=headers, verify=False, timeout=10
-    )
+    s = session.get(f"/rest/vcenter/vm/{moid}", timeout=10)
     if s.status_code != 200:
         raise HTTPException(status_code=s.status_code, detail=s.text)
     summ = s.json()["value"]
 
-    hw = requests.get(
-        f"{VCENTER_HOST}/rest/vcenter/vm/{vm_id}/hardware",
-        headers=headers, verify=False, timeout=5
+    hw = session.get(
+        f"/rest/vcenter/vm/{moid}/hardware", timeout=5
     ).json().get("value", {})
 
+    placement = get_host_cluster_soap(vm_id)
+    refs  = _summary_refs(summ)
+    names = network_resolvers[session.name].resolve(nid for _, nid in refs)
+    ident = fetch_guest_identity(vm_id)
+    return _vm_detail(vm_id, session, summ, hw, placement, _network_names(refs, names), ident)
+
+def _summary_refs(summ: dict) -> List[Tuple[str, str]]:
+    return _backing_refs(n.get("value", {}).get("backing", {}) for n in summ.get("nics", []))
+
+def _vm_detail(
+    vm_id: str,
+    session: VCenterSession,
+    summ: dict,
+    hw: dict,
+    placement: Tuple[str, str],
+    networks: List[str],
+    ident: dict,
+) -> VMDetail:
+    """
+    Monta el VMDetail a partir de las respuestas ya obtenidas de vCenter
+    (común a la ruta síncrona y a la asíncrona).
+    """
     compat_code  = hw.get("version", "<sin datos>")
     compat_human = COMPAT_MAP.get(compat_code, compat_code)
 
@@ -351,8 +599,7 @@ def get_vm_detail(vm_id: str) -> VMDetail:
     cpu_c = cpu.get("count", 0) if isinstance(cpu, dict) else summ.get("cpu_count", 0)
     mem_c = mem.get("size_MiB", 0) if isinstance(mem, dict) else summ.get("memory_size_MiB", 0)
 
-    net_map = load_network_map(headers)
-    host_name, cluster_name = get_host_cluster_soap(vm_id)
+    host_name, cluster_name = placement
 
     # Discos
     disks: List[str] = []
@@ -361,28 +608,13 @@ def get_vm_detail(vm_id: str) -> VMDetail:
         if isinstance(cap, int):
             disks.append(f"{cap // (1024**3)} GB")
 
-    # NICs y redes
-    nics: List[str] = []
-    networks: List[str] = []
-    for n in summ.get("nics", []):
-        v = n.get("value", {})
-        if label := v.get("label"):
-            nics.append(label)
-        backing = v.get("backing", {})
-        if backing.get("network_name"):
-            networks.append(backing["network_name"])
-        elif backing.get("network"):
-            nid = backing["network"]
-            networks.append(net_map.get(nid) or get_network_name(nid, headers))
-    if not networks:
-        networks = ["<sin datos>"]
+    # NICs (las redes llegan ya resueltas juntas: como mucho una consulta)
+    nics: List[str] = [
+        label for n in summ.get("nics", []) if (label := n.get("value", {}).get("label"))
+    ]
 
     # Identidad y guest OS
-    ident    = fetch_guest_identity(vm_id, headers)
-    full     = ident.get("full_name")
-    guest_os = (
-        full.get("default_message") if isinstance(full, dict) else full
-    ) or ident.get("name") or summ.get("guest_OS") or "Desconocido"
+    guest_os = _guest_os_name(ident, summ.get("guest_OS"))
 
     # IPs
     ips = []
@@ -394,6 +626,7 @@ def get_vm_detail(vm_id: str) -> VMDetail:
 
     return VMDetail(
         id                  = vm_id,
+        vcenter             = session.name,
         name                = name,
         power_state         = power_state,
         cpu_count           = cpu_c,
@@ -409,3 +642,102 @@ def get_vm_detail(vm_id: str) -> VMDetail:
         disks               = disks,
         nics                = nics,
     )
+
+
+# ───────────────────────────────────────────────────────────────────────
+# Ruta asíncrona (endpoints async def sobre VCenterSession.arequest)
+# ───────────────────────────────────────────────────────────────────────
+# Las llamadas REST a vCenter se esperan en el bucle de eventos sin ocupar
+# hilos del threadpool; si la tarea se cancela (cliente desconectado o
+# plazo agotado) las peticiones en curso se abortan. pyVmomi no tiene API
+# asíncrona: la ubicación SOAP solo sale a un hilo si no está cacheada.
+# Tampoco se bloquea el bucle con trabajo del inventario: publicar un
+# parche (nuevo snapshot, índice, filas codificadas, deltas) o restaurar
+# el snapshot persistido se hace en un hilo.
+
+async def afetch_guest_identity(vm_id: str) -> dict:
+    """
+    Versión asíncrona de fetch_guest_identity (misma caché y mismas
+    llamadas en curso).
+    """
+    val = identity_cache.get(vm_id)
+    if val is not None:
+        return val
+    return await inflight.ado(("identity", vm_id), _aload_guest_identity, vm_id)
+
+async def _aload_guest_identity(vm_id: str) -> dict:
+    val = identity_cache.get(vm_id)
+    if val is not None:
+        return val
+    try:
+        session, moid = resolve_vm(vm_id)
+        r = await session.aget(f"/rest/vcenter/vm/{moid}/guest/identity", timeout=5)
+        val = r.json().get("value", {}) if r.status_code == 200 else {}
+        if not isinstance(val, dict):   # respuesta inesperada: sin identidad
+            val = {}
+    except Exception:
+        val = {}
+    identity_cache.set(vm_id, val, negative=not val)
+    return val
+
+async def aget_host_cluster(vm_id: str) -> Tuple[str, str]:
+    """
+    Ubicación desde placement_cache o, si falta, vía SOAP en un hilo aparte.
+    """
+    cached = placement_cache.get(vm_id, MISSING)
+    if cached is not MISSING:
+        return cached
+    return await inflight.ado(("placement", vm_id), asyncio.to_thread, _load_placement, vm_id)
+
+async def afetch_vm_detail(vm_id: str) -> VMDetail:
+    """
+    Versión asíncrona de fetch_vm_detail: resumen, hardware e identidad
+    se piden en paralelo y después ubicación y nombres de red.
+    """
+    session, moid = resolve_vm(vm_id)
+    s, h, ident = await asyncio.gather(
+        session.aget(f"/rest/vcenter/vm/{moid}", timeout=10),
+        session.aget(f"/rest/vcenter/vm/{moid}/hardware", timeout=5),
+        afetch_guest_identity(vm_id),
+    )
+    if s.status_code != 200:
+        raise HTTPException(status_code=s.status_code, detail=s.text)
+    summ = s.json()["value"]
+    hw   = h.json().get("value", {})
+
+    refs = _summary_refs(summ)
+    placement, names = await asyncio.gather(
+        aget_host_cluster(vm_id),
+        network_resolvers[session.name].aresolve(nid for _, nid in refs),
+    )
+    return _vm_detail(vm_id, session, summ, hw, placement, _network_names(refs, names), ident)
+
+async def aget_vm_detail(vm_id: str, fresh: bool = False) -> VMDetail:
+    """
+    Versión asíncrona de get_vm_detail (mismas reglas de snapshot/frescura).
+    """
+    if inventory.current is None:
+        # Primera lectura: puede restaurar el snapshot persistido
+        cached, snap, pos = await asyncio.to_thread(_snapshot_detail, vm_id, fresh)
+    else:
+        cached, snap, pos = _snapshot_detail(vm_id, fresh)
+    if cached is not None:
+        return _with_guest_name(cached, await afetch_guest_identity(vm_id))
+    return await inflight.ado(("detail", vm_id), _aload_vm_detail, vm_id, snap, pos)
+
+async def _aload_vm_detail(vm_id: str, snap, pos) -> VMDetail:
+    detail = await afetch_vm_detail(vm_id)
+    await asyncio.to_thread(_write_back, snap, pos, detail)
+    return detail
+
+async def apower_action(vm_id: str, action: str) -> dict:
+    """
+    Versión asíncrona de power_action.
+    """
+    session, moid = resolve_vm(vm_id)
+    r = await session.apost(f"/rest/vcenter/vm/{moid}/power/{action}", timeout=5)
+    if r.status_code == 200:
+        await asyncio.to_thread(inventory.patch, {vm_id: {"power_state": POWER_RESULT[action]}})
+        vm_state_changed(vm_id)
+        return {"message": f"Acción '{action}' ejecutada en VM {vm_id}"}
+    raise HTTPException(status_code=r.status_code, detail=r.text)
@@ -0,0 +1,547 @@
+import asyncio
+import logging
+import ssl                                # SOAP interaction
+import time
+import threading
+from collections import deque
+from typing import Any, Callable, Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+import httpx                              # cliente REST asíncrono
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+from fastapi import HTTPException
+
+from pyVim.connect import SmartConnect, Disconnect        # SOAP client
+from pyVmomi import vim                                   # vSphere SDK types
+
+from app.config import (
+    VCENTERS,
+    VCENTER_POOL_SIZE, VCENTER_SESSION_MAX_IDLE, VCENTER_MAX_CONCURRENCY,
+)
+from app.metrics import metrics, endpoint_template, record_timing, stage
+
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+log = logging.getLogger(__name__)
+
+# —————— Métricas de las llamadas a vCenter ——————
+vcenter_requests = metrics.counter(
+    "vcenter_requests_total", "Peticiones REST a vCenter por plantilla de endpoint y estado",
+    ("vcenter", "method", "endpoint", "status"),
+)
+vcenter_request_seconds = metrics.histogram(
+    "vcenter_request_duration_seconds", "Latencia de las peticiones REST a vCenter",
+    ("vcenter", "method", "endpoint"),
+)
+vcenter_wait_seconds = metrics.histogram(
+    "vcenter_request_queue_seconds", "Espera por un hueco de VCENTER_MAX_CONCURRENCY antes de enviar",
+    ("vcenter",),
+)
+vcenter_retries = metrics.counter(
+    "vcenter_retries_total", "Reintentos tras invalidarse la sesión (401 REST / NotAuthenticated SOAP)",
+    ("vcenter", "api"),
+)
+vcenter_soap_calls = metrics.counter(
+    "vcenter_soap_calls_total", "Operaciones SOAP contra vCenter por resultado",
+    ("vcenter", "operation", "outcome"),
+)
+vcenter_soap_seconds = metrics.histogram(
+    "vcenter_soap_duration_seconds", "Duración de las operaciones SOAP contra vCenter",
+    ("vcenter", "operation"),
+)
+
+# —————— Tope de concurrencia compartido ——————
+class _Waiter:
+    """Espera de un hueco: un hilo (Event) o una corrutina (future de su bucle)."""
+    __slots__ = ("event", "loop", "fut", "granted")
+
+    def __init__(self, loop=None):
+        self.loop    = loop
+        self.fut     = loop.create_future() if loop else None
+        self.event   = None if loop else threading.Event()
+        self.granted = False
+
+
+def _wake(fut: asyncio.Future) -> None:
+    if not fut.done():
+        fut.set_result(None)
+
+
+class ConcurrencySlots:
+    """
+    Semáforo con un único cupo para hilos (`with`) y corrutinas
+    (`async with`): las peticiones síncronas y las asíncronas contra un
+    mismo vCenter suman juntas hasta VCENTER_MAX_CONCURRENCY. Los huecos
+    se ceden por orden de llegada; una corrutina cancelada mientras
+    espera no consume ninguno (si ya se le había cedido, pasa al
+    siguiente).
+    """
+
+    def __init__(self, size: int):
+        self.size     = size
+        self._lock    = threading.Lock()
+        self._free    = size
+        self._waiters: deque = deque()
+
+    def in_use(self) -> int:
+        return self.size - self._free
+
+    # —————— Hilos ——————
+    def acquire(self) -> None:
+        with self._lock:
+            if self._free and not self._waiters:
+                self._free -= 1
+                return
+            waiter = _Waiter()
+            self._waiters.append(waiter)
+        waiter.event.wait()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+    # —————— Asíncrona ——————
+    async def aacquire(self) -> None:
+        with self._lock:
+            if self._free and not self._waiters:
+                self._free -= 1
+                return
+            waiter = _Waiter(asyncio.get_running_loop())
+            self._waiters.append(waiter)
+        try:
+            await waiter.fut
+        except asyncio.CancelledError:
+            with self._lock:
+                granted = waiter.granted
+                if not granted:
+                    self._waiters.remove(waiter)
+            if granted:
+                self.release()
+            raise
+
+    async def __aenter__(self):
+        await self.aacquire()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.release()
+
+    # —————— Común ——————
+    def release(self) -> None:
+        """Cede el hueco al primero que espera o lo devuelve al cupo."""
+        while True:
+            with self._lock:
+                if not self._waiters:
+                    if self._free >= self.size:
+                        raise ValueError("ConcurrencySlots liberado más veces de las adquiridas")
+                    self._free += 1
+                    return
+                waiter = self._waiters.popleft()
+                waiter.granted = True
+            if waiter.event is not None:
+                waiter.event.set()
+                return
+            try:
+                waiter.loop.call_soon_threadsafe(_wake, waiter.fut)
+                return
+            except RuntimeError:        # su bucle ya se cerró: siguiente
+                continue
+
+
+# ───────────────────────────────────────────────────────────────────────
+# Gestor de sesiones persistentes contra vCenter (REST + SOAP)
+# ───────────────────────────────────────────────────────────────────────
+class VCenterSession:
+    """
+    Mantiene sesiones reutilizables contra un vCenter:
+      • Un requests.Session con keep-alive y pool de conexiones HTTP,
+        con un tope de peticiones simultáneas por vCenter.
+      • Un token REST (vmware-api-session-id) que se renueva ante 401
+        o cuando la sesión lleva demasiado tiempo inactiva.
+      • Un ServiceInstance pyVmomi persistente que se reconecta
+        automáticamente si vCenter invalida la sesión SOAP.
+      • Un httpx.AsyncClient por bucle de eventos (arequest/aget/apost)
+        para los endpoints async, con su propio pool y el mismo token REST
+        (un único login para ambas rutas), de modo que las
+        llamadas lentas no ocupan hilos. El tope de peticiones simultáneas
+        es uno solo para ambas rutas (ver ConcurrencySlots).
+    """
+
+    def __init__(
+        self,
+        host: str,
+        user: str,
+        pwd: str,
+        name: Optional[str] = None,
+        pool_size: int = VCENTER_POOL_SIZE,
+        max_idle: int = VCENTER_SESSION_MAX_IDLE,
+        max_concurrency: int = VCENTER_MAX_CONCURRENCY,
+    ):
+        self.host     = (host or "").rstrip("/")
+        self.name     = name or urlparse(self.host if "://" in self.host else f"https://{self.host}").hostname
+        self.user     = user
+        self.pwd      = pwd
+        self.max_idle = max_idle
+
+        self._lock     = threading.RLock()
+        self._token: Optional[str] = None
+        self._last_use = 0.0
+        self._si       = None
+        self._content  = None
+        # Tope de peticiones REST simultáneas contra este vCenter (hilos y
+        # bucle de eventos comparten el mismo cupo)
+        self._slots    = ConcurrencySlots(max_concurrency)
+
+        self._http = requests.Session()
+        self._http.verify = False
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self._http.mount("https://", adapter)
+        self._http.mount("http://", adapter)
+
+        # Clientes asíncronos: uno por bucle de eventos que los usa (sus
+        # conexiones pertenecen a ese bucle); se cierran al apagarse el bucle
+        self.pool_size       = pool_size
+        self.max_concurrency = max_concurrency
+        self._aclients: Dict[asyncio.AbstractEventLoop, Tuple[httpx.AsyncClient, Any]] = {}
+        self._aclients_lock = threading.Lock()
+
+        self.counters = {
+            "rest_logins":     0,
+            "rest_reauths":    0,
+            "rest_requests":   0,
+            "soap_logins":     0,
+            "soap_reconnects": 0,
+        }
+
+    # —————— REST ——————
+    def _login(self) -> str:
+        """
+        Autentica contra la API REST de vCenter para obtener un token de sesión.
+        Lanza HTTPException en caso de fallo.
+        """
+        start, status = time.perf_counter(), "error"
+        try:
+            r = self._http.post(
+                f"{self.host}/rest/com/vmware/cis/session",
+                auth=(self.user, self.pwd), timeout=5
+            )
+            status = str(r.status_code)
+            r.raise_for_status()
+        except Exception as e:
+            code = getattr(e, "response", None) and e.response.status_code or 500
+            raise HTTPException(status_code=code, detail=f"Auth failed: {e}")
+        finally:
+            self._observe("POST", "/rest/com/vmware/cis/session", status, time.perf_counter() - start)
+        self.counters["rest_logins"] += 1
+        return r.json()["value"]
+
+    def token(self) -> str:
+        """
+        Devuelve el token REST vigente, abriendo una sesión nueva si no
+        existe o si ha superado el tiempo máximo de inactividad.
+        """
+        with self._lock:
+            idle = time.monotonic() - self._last_use
+            if self._token is None or idle > self.max_idle:
+                with stage("auth", self.name):
+                    self._token = self._login()
+            self._last_use = time.monotonic()
+            return self._token
+
+    def _invalidate(self, token: str) -> None:
+        """
+        Descarta el token indicado (si sigue siendo el vigente) tras un 401.
+        """
+        with self._lock:
+            if self._token == token:
+                self._token = None
+                self.counters["rest_reauths"] += 1
+
+    def request(self, method: str, path: str, timeout: float = 5, **kwargs) -> requests.Response:
+        """
+        Ejecuta una petición REST reutilizando sesión y conexiones:
+          1. Añade el token de sesión a las cabeceras.
+          2. Si vCenter responde 401, renueva el token y reintenta una vez.
+        Cada envío se mide por plantilla de endpoint (ver app/metrics).
+        """
+        token = self.token()
+        r = self._send(method, path, token, timeout, **kwargs)
+        if r.status_code == 401:
+            self._invalidate(token)
+            vcenter_retries.inc(self.name, "rest")
+            r = self._send(method, path, self.token(), timeout, **kwargs)
+        return r
+
+    def _send(self, method, path, token, timeout, **kwargs) -> requests.Response:
+        headers = {**kwargs.pop("headers", {}), "vmware-api-session-id": token}
+        queued = time.perf_counter()
+        with self._slots:
+            start, status = time.perf_counter(), "error"
+            vcenter_wait_seconds.observe(start - queued, self.name)
+            self.counters["rest_requests"] += 1
+            try:
+                r = self._http.request(
+                    method, f"{self.host}{path}", headers=headers, timeout=timeout, **kwargs
+                )
+                status = str(r.status_code)
+                return r
+            finally:
+                self._observe(method, endpoint_template(path), status, time.perf_counter() - start)
+
+    def _observe(self, method: str, endpoint: str, status: str, elapsed: float) -> None:
+        vcenter_requests.inc(self.name, method, endpoint, status)
+        vcenter_request_seconds.observe(elapsed, self.name, method, endpoint)
+        record_timing("vcenter", elapsed)
+
+    def get(self, path: str, **kwargs) -> requests.Response:
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path: str, **kwargs) -> requests.Response:
+        return self.request("POST", path, **kwargs)
+
+    # —————— REST asíncrono ——————
+    async def _async_client(self) -> httpx.AsyncClient:
+        """
+        Cliente httpx del bucle de eventos actual (uno por bucle).
+        Se cierra cuando ese bucle se apaga o en aclose() (ver _aclient_lifetime).
+        """
+        loop = asyncio.get_running_loop()
+        with self._aclients_lock:
+            entry = self._aclients.get(loop)
+            created = entry is None
+            if created:
+                # Bucles cerrados sin finalizar sus generadores: solo queda soltarlos
+                for old in [l for l in self._aclients if l.is_closed()]:
+                    del self._aclients[old]
+                client = httpx.AsyncClient(
+                    verify=False,
+                    limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+                )
+                entry = self._aclients[loop] = (client, self._aclient_lifetime(loop, client))
+        if created:
+            await entry[1].__anext__()
+        return entry[0]
+
+    async def _aclient_lifetime(self, loop: asyncio.AbstractEventLoop, client: httpx.AsyncClient):
+        """
+        Generador que vive lo que el cliente: asyncio.run, uvicorn y anyio
+        finalizan los generadores asíncronos pendientes (shutdown_asyncgens)
+        antes de cerrar el bucle, así que el cliente se cierra aún dentro
+        de su bucle y sin dejar sockets huérfanos.
+        """
+        try:
+            yield
+        finally:
+            with self._aclients_lock:
+                if self._aclients.get(loop, (None,))[0] is client:
+                    del self._aclients[loop]
+            await client.aclose()
+
+    async def atoken(self) -> str:
+        """
+        Versión asíncrona de token(): comparte token y cerrojo con la ruta
+        síncrona.
+        - Con un token vigente lo devuelve sin esperar.
+        - Si hay que autenticar ejecuta token() en un hilo: hilos y
+          corrutinas (de cualquier bucle) se serializan en el mismo _lock
+          y abren una sola sesión, sin bloquear el bucle.
+        """
+        token = self._token
+        if token is not None and time.monotonic() - self._last_use <= self.max_idle:
+            self._last_use = time.monotonic()
+            return token
+        return await asyncio.to_thread(self.token)
+
+    async def arequest(self, method: str, path: str, timeout: float = 5, **kwargs) -> httpx.Response:
+        """
+        Igual que request() pero sobre el cliente asíncrono. Si la tarea
+        que la espera se cancela (p. ej. el navegador cierra la petición),
+        la llamada en curso a vCenter se aborta con ella.
+        """
+        token = await self.atoken()
+        r = await self._asend(method, path, token, timeout, **kwargs)
+        if r.status_code == 401:
+            self._invalidate(token)
+            vcenter_retries.inc(self.name, "rest")
+            r = await self._asend(method, path, await self.atoken(), timeout, **kwargs)
+        return r
+
+    async def _asend(self, method, path, token, timeout, **kwargs) -> httpx.Response:
+        client  = await self._async_client()
+        headers = {**kwargs.pop("headers", {}), "vmware-api-session-id": token}
+        queued  = time.perf_counter()
+        async with self._slots:
+            start, status = time.perf_counter(), "error"
+            vcenter_wait_seconds.observe(start - queued, self.name)
+            self.counters["rest_requests"] += 1
+            try:
+                r = await client.request(
+                    method, f"{self.host}{path}", headers=headers, timeout=timeout, **kwargs
+                )
+                status = str(r.status_code)
+                return r
+            except asyncio.CancelledError:
+                status = "cancelled"
+                raise
+            finally:
+                self._observe(method, endpoint_template(path), status, time.perf_counter() - start)
+
+    async def aget(self, path: str, **kwargs) -> httpx.Response:
+        return await self.arequest("GET", path, **kwargs)
+
+    async def apost(self, path: str, **kwargs) -> httpx.Response:
+        return await self.arequest("POST", path, **kwargs)
+
+    async def aclose(self) -> None:
+        """
+        Cierra el cliente asíncrono del bucle actual (si se creó).
+        """
+        with self._aclients_lock:
+            entry = self._aclients.get(asyncio.get_running_loop())
+        if entry is not None:
+            await entry[1].aclose()
+
+    # —————— SOAP ——————
+    def _soap_connect(self):
+        """
+        Crea una conexión no verificada al vCenter vía pyVmomi.
+        """
+        url = urlparse(self.host if "://" in self.host else f"https://{self.host}")
+        si = SmartConnect(
+            host=url.hostname,
+            user=self.user,
+            pwd=self.pwd,
+            port=url.port or 443,
+            sslContext=ssl._create_unverified_context()
+        )
+        self.counters["soap_logins"] += 1
+        return si
+
+    def soap_content(self):
+        """
+        Devuelve el ServiceContent de la conexión SOAP persistente
+        (se obtiene una sola vez por login).
+        """
+        with self._lock:
+            if self._si is None:
+                with stage("auth", self.name):
+                    self._si      = self._soap_connect()
+                    self._content = self._si.RetrieveContent()
+            return self._content
+
+    def soap_call(self, fn: Callable[[Any], Any], op: Optional[str] = None) -> Any:
+        """
+        Ejecuta fn(content) sobre la sesión SOAP persistente.
+        Si vCenter la ha invalidado, reconecta y reintenta una vez.
+        Con `op` se mide la operación completa (reintento incluido);
+        las llamadas de larga duración (WaitForUpdatesEx) lo omiten.
+        """
+        if op is None:
+            return self._soap_call(fn)
+        start, outcome = time.perf_counter(), "error"
+        try:
+            result = self._soap_call(fn)
+            outcome = "ok"
+            return result
+        finally:
+            elapsed = time.perf_counter() - start
+            vcenter_soap_calls.inc(self.name, op, outcome)
+            vcenter_soap_seconds.observe(elapsed, self.name, op)
+            record_timing("vcenter_soap", elapsed)
+
+    def _soap_call(self, fn: Callable[[Any], Any]) -> Any:
+        try:
+            return fn(self.soap_content())
+        except vim.fault.NotAuthenticated:
+            with self._lock:
+                self._drop_soap()
+                self.counters["soap_reconnects"] += 1
+            vcenter_retries.inc(self.name, "soap")
+            return fn(self.soap_content())
+
+    def _drop_soap(self) -> None:
+        try: Disconnect(self._si)
+        except: pass
+        self._si, self._content = None, None
+
+    # —————— Ciclo de vida y métricas ——————
+    def close(self) -> None:
+        """
+        Cierra la sesión REST, desconecta SOAP y libera el pool de conexiones.
+        """
+        with self._lock:
+            if self._token:
+                try:
+                    self._http.delete(
+                        f"{self.host}/rest/com/vmware/cis/session",
+                        headers={"vmware-api-session-id": self._token}, timeout=5
+                    )
+                except Exception as e:
+                    log.warning("Logout REST de %s fallido → %s", self.name, e)
+                self._token = None
+            if self._si is not None:
+                self._drop_soap()
+            self._http.close()
+
+    def metrics(self) -> dict:
+        """
+        Devuelve contadores de sesión y el estado del pool de conexiones HTTP.
+        """
+        pools = []
+        adapters = {id(a): a for a in self._http.adapters.values()}.values()
+        for adapter in adapters:
+            for key in adapter.poolmanager.pools.keys():
+                pool = adapter.poolmanager.pools[key]
+                idle = [c for c in pool.pool.queue if c is not None] if pool.pool else []
+                pools.append({
+                    "host":        f"{key.key_scheme}://{key.key_host}:{key.key_port}",
+                    "connections": pool.num_connections,
+                    "requests":    pool.num_requests,
+                    "idle":        len(idle),
+                    "maxsize":     pool.pool.maxsize if pool.pool else 0,
+                })
+        return {
+            "name":             self.name,
+            "host":             self.host,
+            "rest_session":     self._token is not None,
+            "rest_idle_s":      round(time.monotonic() - self._last_use, 1) if self._token else None,
+            "soap_session":     self._si is not None,
+            **self.counters,
+            "pools":            pools,
+        }
+
+# Una sesión por vCenter configurado (VCENTERS), indexadas por nombre
+vcenters: Dict[str, VCenterSession] = {
+    c["name"]: VCenterSession(c["host"], c["user"], c["password"], name=c["name"])
+    for c in VCENTERS
+}
+# Sesión por defecto (el primer vCenter de la lista)
+vcenter = next(iter(vcenters.values()))
+
+# Con más de un vCenter los moIds pueden repetirse: los ids de VM pasan
+# a ser "<vcenter>:<moId>". Con uno solo se mantienen los moIds tal cual.
+FEDERATED = len(vcenters) > 1
+
+def vm_id_prefix(session: VCenterSession) -> str:
+    """
+    Prefijo de los ids de VM recolectados de `session`.
+    """
+    return f"{session.name}:" if FEDERATED else ""
+
+def resolve_vm(vm_id: str) -> Tuple[VCenterSession, str]:
+    """
+    Traduce un id de VM de la API a (sesión de su vCenter, moId).
+    Lanza HTTPException 404 si el vCenter no está configurado.
+    """
+    if not FEDERATED:
+        return vcenter, vm_id
+    name, sep, moid = vm_id.partition(":")
+    session = vcenters.get(name) if sep else None
+    if session is None:
+        raise HTTPException(status_code=404, detail=f"vCenter desconocido en el id '{vm_id}'")
+    return session, moid
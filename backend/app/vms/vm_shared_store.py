@@ -0,0 +1,223 @@
+import json
+import os
+import socket
+import tempfile
+import uuid
+from typing import Any, Callable, Dict, NamedTuple, Optional
+
+from app.config import SHARED_FILE_PATH, SHARED_REDIS_URL, SHARED_LOCK_TTL, SHARED_PUBLISH_MIN_SECONDS
+from app.vms.vm_inventory import InventorySnapshot
+from app.vms.vm_snapshot_store import dump_snapshot, load_snapshot
+
+try:
+    import fcntl
+except ImportError:          # Windows: bloqueo con msvcrt
+    fcntl = None
+    import msvcrt
+
+# ───────────────────────────────────────────────────────────────────────
+# Almacenes compartidos del snapshot entre workers/hosts
+# ───────────────────────────────────────────────────────────────────────
+# Formato común: una línea JSON de cabecera ({"version", "built_at"})
+# seguida del snapshot serializado con dump_snapshot (JSON + zlib).
+# Leer solo la cabecera permite a los seguidores comprobar si hay una
+# versión nueva sin descargar el inventario completo.
+
+class SnapshotHead(NamedTuple):
+    version: int
+    built_at: float
+
+
+def _pack(snapshot: InventorySnapshot, extras: Dict[str, Any]) -> bytes:
+    head = json.dumps({"version": snapshot.version, "built_at": snapshot.built_at}).encode()
+    return head + b"\n" + dump_snapshot(snapshot, extras)
+
+def _unpack(blob: bytes):
+    head, payload = blob.split(b"\n", 1)
+    meta = json.loads(head)
+    return load_snapshot(payload, meta["version"], meta["built_at"])
+
+def owner_id() -> str:
+    """
+    Identificador único de este worker para el lock de líder.
+    """
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class _SharedStore:
+    """
+    Base de los almacenes compartidos: interfaz de persistencia del
+    InventoryStore (save/load) más head() y el lock de líder.
+    """
+
+    def __init__(
+        self,
+        extras: Optional[Callable[[], Dict[str, Any]]] = None,
+        on_restore: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ):
+        self.extras     = extras
+        self.on_restore = on_restore
+        # Los seguidores solo ven lo publicado aquí: sin el margen de app.db
+        self.save_interval = SHARED_PUBLISH_MIN_SECONDS
+
+    def save(self, snapshot: InventorySnapshot) -> None:
+        self._write(_pack(snapshot, self.extras() if self.extras else {}),
+                     SnapshotHead(snapshot.version, snapshot.built_at))
+
+    def load(self) -> Optional[InventorySnapshot]:
+        blob = self._read()
+        if not blob:
+            return None
+        snapshot, extras = _unpack(blob)
+        if self.on_restore:
+            self.on_restore(extras)
+        return snapshot
+
+
+class FileSnapshotStore(_SharedStore):
+    """
+    Snapshot compartido en un fichero local (varios workers de una
+    misma máquina). Escritura atómica con os.replace; el lock de líder
+    es un flock sobre `<path>.lock`, que el sistema libera solo si el
+    proceso muere.
+    """
+
+    def __init__(self, path: str, **kw):
+        super().__init__(**kw)
+        self.path = path
+        self._lock_fd: Optional[int] = None
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def _write(self, blob: bytes, head: SnapshotHead) -> None:
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)), prefix=".snap-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(blob)
+            os.replace(tmp, self.path)
+        except BaseException:
+            try: os.unlink(tmp)
+            except OSError: pass
+            raise
+
+    def _read(self) -> Optional[bytes]:
+        try:
+            with open(self.path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def head(self) -> Optional[SnapshotHead]:
+        try:
+            with open(self.path, "rb") as f:
+                meta = json.loads(f.readline())
+            return SnapshotHead(meta["version"], meta["built_at"])
+        except (FileNotFoundError, ValueError, KeyError):
+            return None
+
+    # —————— Lock de líder ——————
+    def acquire_leader(self, owner: str) -> bool:
+        if self._lock_fd is not None:
+            return True
+        fd = os.open(self.path + ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, owner.encode())
+        self._lock_fd = fd
+        return True
+
+    def renew_leader(self, owner: str) -> bool:
+        return self._lock_fd is not None
+
+    def release_leader(self, owner: str) -> None:
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)     # cerrar el descriptor libera el flock
+            self._lock_fd = None
+
+
+class RedisSnapshotStore(_SharedStore):
+    """
+    Snapshot compartido en Redis (o cualquier servidor compatible), para
+    workers en varias máquinas. El cliente se inyecta (p. ej. un falso
+    en pruebas); si no, se crea con redis.Redis.from_url(url).
+
+    Claves (prefijo configurable):
+    - <prefix>:snapshot : cabecera + snapshot (una sola escritura atómica).
+    - <prefix>:head     : solo la cabecera, para el sondeo de los seguidores.
+    - <prefix>:leader   : lock de líder (SET NX PX; renovar y liberar comparan
+                          el dueño en un script Lua).
+    """
+
+    def __init__(self, url: Optional[str] = None, client=None, prefix: str = "inventario:vms",
+                 lock_ttl: float = 30, **kw):
+        super().__init__(**kw)
+        if client is None:
+            import redis    # dependencia opcional: solo si se usa este backend
+            client = redis.Redis.from_url(url)
+        self.client   = client
+        self.prefix   = prefix
+        self.lock_ttl = lock_ttl
+
+    def _key(self, name: str) -> str:
+        return f"{self.prefix}:{name}"
+
+    def _write(self, blob: bytes, head: SnapshotHead) -> None:
+        self.client.set(self._key("snapshot"), blob)
+        self.client.set(self._key("head"), json.dumps(head._asdict()))
+
+    def _read(self) -> Optional[bytes]:
+        return self.client.get(self._key("snapshot"))
+
+    def head(self) -> Optional[SnapshotHead]:
+        raw = self.client.get(self._key("head"))
+        if not raw:
+            return None
+        meta = json.loads(raw)
+        return SnapshotHead(meta["version"], meta["built_at"])
+
+    # —————— Lock de líder ——————
+    # Renovar y liberar comparan el dueño y actúan en un solo paso (script
+    # Lua, atómico en Redis): con GET + PEXPIRE/DEL, si el lock caducaba
+    # entre ambas órdenes y otro worker lo tomaba, se le renovaba o borraba.
+    def acquire_leader(self, owner: str) -> bool:
+        if self.renew_leader(owner):
+            return True
+        return bool(self.client.set(self._key("leader"), owner, nx=True, px=int(self.lock_ttl * 1000)))
+
+    def renew_leader(self, owner: str) -> bool:
+        return bool(self.client.eval(_RENEW_SCRIPT, 1, self._key("leader"), owner, int(self.lock_ttl * 1000)))
+
+    def release_leader(self, owner: str) -> None:
+        self.client.eval(_RELEASE_SCRIPT, 1, self._key("leader"), owner)
+
+
+# KEYS[1] = lock, ARGV[1] = dueño, ARGV[2] = TTL en ms
+_RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+def make_shared_store(kind: str, **kw) -> _SharedStore:
+    """
+    Crea el almacén compartido configurado (SHARED_BACKEND = file | redis).
+    """
+    if kind == "file":
+        return FileSnapshotStore(SHARED_FILE_PATH, **kw)
+    if kind == "redis":
+        return RedisSnapshotStore(SHARED_REDIS_URL, lock_ttl=SHARED_LOCK_TTL, **kw)
+    raise ValueError(f"SHARED_BACKEND no soportado: {kind}")
@@ -0,0 +1,109 @@
+import json
+import logging
+import time
+import zlib
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from sqlalchemy import Column, LargeBinary
+from sqlmodel import SQLModel, Field, Session
+
+from app.db import engine
+from app.vms.vm_rows import VMRow
+from app.vms.vm_inventory import InventorySnapshot
+
+log = logging.getLogger(__name__)
+
+# —————— Definición de la tabla de snapshots ——————
+class InventorySnapshotRecord(SQLModel, table=True):
+    """
+    Representa la tabla 'InventorySnapshotRecord' en la base de datos.
+
+    Campos:
+    - key      : Identificador del snapshot (p. ej. "vms").
+    - version  : Versión del snapshot persistido.
+    - built_at : Marca de tiempo (epoch) en que se construyó.
+    - payload  : JSON comprimido con zlib (VMs + mapas auxiliares).
+    """
+    key: str       = Field(primary_key=True)
+    version: int
+    built_at: float
+    payload: bytes = Field(sa_column=Column(LargeBinary, nullable=False))
+
+
+def dump_snapshot(snapshot: InventorySnapshot, extras: Optional[Dict[str, Any]] = None) -> bytes:
+    """
+    Serializa un snapshot (y los mapas auxiliares) a JSON comprimido.
+    """
+    doc = {
+        "vms":    [vm.as_dict() for vm in snapshot.vms],
+        "extras": extras or {},
+    }
+    return zlib.compress(json.dumps(doc, separators=(",", ":")).encode(), 6)
+
+
+def load_snapshot(payload: bytes, version: int, built_at: float) -> Tuple[InventorySnapshot, Dict[str, Any]]:
+    """
+    Reconstruye un snapshot desde su forma serializada. Los datos se
+    escribieron ya validados, así que se cargan directamente como filas.
+    """
+    doc = json.loads(zlib.decompress(payload))
+    vms = [VMRow(**vm) for vm in doc.get("vms", [])]
+    return InventorySnapshot(vms=vms, version=version, built_at=built_at), doc.get("extras", {})
+
+
+class SqliteSnapshotStore:
+    """
+    Persiste el último snapshot del inventario en la base SQLite de la app
+    (app/app.db), para que un reinicio pueda servir datos de inmediato
+    mientras se refresca el inventario en segundo plano.
+    """
+
+    def __init__(
+        self,
+        key: str = "vms",
+        extras: Optional[Callable[[], Dict[str, Any]]] = None,
+        on_restore: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ):
+        self.key        = key
+        self.extras     = extras
+        self.on_restore = on_restore
+        self._table_ready = False
+
+    def _ensure_table(self) -> None:
+        if not self._table_ready:
+            SQLModel.metadata.create_all(engine, tables=[InventorySnapshotRecord.__table__])
+            self._table_ready = True
+
+    def save(self, snapshot: InventorySnapshot) -> None:
+        """
+        Guarda (o reemplaza) el snapshot junto con los mapas auxiliares.
+        """
+        self._ensure_table()
+        extras  = self.extras() if self.extras else {}
+        payload = dump_snapshot(snapshot, extras)
+        with Session(engine) as session:
+            record = session.get(InventorySnapshotRecord, self.key)
+            if record is None:
+                record = InventorySnapshotRecord(key=self.key, version=0, built_at=0, payload=b"")
+            record.version  = snapshot.version
+            record.built_at = snapshot.built_at
+            record.payload  = payload
+            session.add(record)
+            session.commit()
+
+    def load(self) -> Optional[InventorySnapshot]:
+        """
+        Carga el snapshot persistido (si existe) y restaura los mapas auxiliares.
+        """
+        started = time.perf_counter()
+        self._ensure_table()
+        with Session(engine) as session:
+            record = session.get(InventorySnapshotRecord, self.key)
+            if record is None:
+                return None
+            snapshot, extras = load_snapshot(record.payload, record.version, record.built_at)
+        if self.on_restore:
+            self.on_restore(extras)
+        log.info("Snapshot v%s restaurado (%d VMs, %.0f ms)",
+                 snapshot.version, len(snapshot.vms), (time.perf_counter() - started) * 1000)
+        return snapshot
@@ -0,0 +1,118 @@
+import threading
+from array import array
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException
+
+from app.cache import caches
+from app.vms.vm_models import VMStats, VMStatsGroup
+from app.vms.vm_inventory import InventorySnapshot
+from app.vms.vm_query import VMFilters
+
+# ───────────────────────────────────────────────────────────────────────
+# Agregaciones por grupo calculadas sobre el snapshot
+# ───────────────────────────────────────────────────────────────────────
+# Campo de agrupación expuesto → atributo de VMBase
+GROUP_FIELDS = {
+    "vcenter":            "vcenter",
+    "environment":        "environment",
+    "power_state":        "power_state",
+    "host":               "host",
+    "cluster":            "cluster",
+    "network":            "networks",
+    "guest_os":           "guest_os",
+    "compatibility_code": "compatibility_code",
+}
+
+def _disk_gb(disks: List[str]) -> int:
+    total = 0
+    for d in disks:
+        try:
+            total += int(d.split()[0])
+        except (ValueError, IndexError):
+            pass
+    return total
+
+
+class StatsColumns:
+    """
+    Representación columnar del snapshot para agregar:
+    columnas numéricas en arrays compactos y una columna por campo de grupo.
+    """
+
+    def __init__(self, snapshot: InventorySnapshot):
+        vms = snapshot.vms
+        self.cpu    = array("q", (vm.cpu_count for vm in vms))
+        self.memory = array("q", (vm.memory_size_MiB for vm in vms))
+        self.disk   = array("q", (_disk_gb(vm.disks) for vm in vms))
+        self.groups = {
+            field: [getattr(vm, attr) for vm in vms]
+            for field, attr in GROUP_FIELDS.items()
+        }
+
+    def totals(self, key: Optional[str], positions: Sequence[int]) -> VMStatsGroup:
+        return VMStatsGroup(
+            key             = key,
+            count           = len(positions),
+            cpu_count       = sum(map(self.cpu.__getitem__, positions)),
+            memory_size_MiB = sum(map(self.memory.__getitem__, positions)),
+            disk_GB         = sum(map(self.disk.__getitem__, positions)),
+        )
+
+    def group(self, field: str, positions: Sequence[int]) -> List[VMStatsGroup]:
+        """
+        Agrupa las posiciones por el valor de la columna y suma cada grupo.
+        Los campos multivalor (redes) cuentan la VM en cada uno de sus grupos.
+        """
+        column = self.groups[field]
+        buckets: Dict[Optional[str], List[int]] = {}
+        for p in positions:
+            value = column[p]
+            for v in set(value) if isinstance(value, tuple) else (value,):
+                buckets.setdefault(v, []).append(p)
+        out = [self.totals(k, ps) for k, ps in buckets.items()]
+        out.sort(key=lambda g: (-g.count, g.key or ""))
+        return out
+
+
+# Columnas por snapshot (serial) y resultados memorizados por consulta
+_columns = caches.namespace("stats_columns", maxsize=2,   ttl=None)
+_results = caches.namespace("stats",         maxsize=256, ttl=None)
+_lock    = threading.Lock()
+
+def columns_for(snapshot: InventorySnapshot) -> StatsColumns:
+    cols = _columns.get(snapshot.serial)
+    if cols is None:
+        with _lock:
+            cols = _columns.get(snapshot.serial)
+            if cols is None:
+                cols = _columns[snapshot.serial] = StatsColumns(snapshot)
+    return cols
+
+def parse_group_by(group_by: str) -> Tuple[str, ...]:
+    fields = tuple(f.strip() for f in group_by.split(",") if f.strip())
+    unknown = [f for f in fields if f not in GROUP_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Agrupación no soportada: {', '.join(unknown)}")
+    return fields
+
+def compute_stats(snapshot: InventorySnapshot, group_by: Tuple[str, ...], filters: VMFilters) -> VMStats:
+    """
+    Calcula totales y grupos sobre las VMs que cumplen los filtros.
+    El resultado se memoriza por (snapshot, agrupación, filtros).
+    """
+    cache_key = (snapshot.serial, group_by, filters.key())
+    stats = _results.get(cache_key)
+    if stats is not None:
+        return stats
+
+    matched   = filters.apply(snapshot)
+    positions = range(len(snapshot.vms)) if matched is None else sorted(matched)
+    cols      = columns_for(snapshot)
+    stats = VMStats(
+        version = snapshot.version,
+        total   = cols.totals(None, positions),
+        groups  = {field: cols.group(field, positions) for field in group_by},
+    )
+    _results[cache_key] = stats
+    return stats
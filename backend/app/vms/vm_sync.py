@@ -0,0 +1,214 @@
+import logging
+import threading
+import time
+from typing import Callable, Dict, Optional, Set, Tuple
+
+from app.config import INVENTORY_SYNC_WAIT_SECONDS, INVENTORY_SYNC_RETRY_SECONDS
+from app.metrics import metrics, stage
+from app.vms.vm_rows import VMRow
+from app.vms.vm_inventory import InventoryStore
+from app.vms.vm_session import VCenterSession, vm_id_prefix
+from app.vms.vm_collector import (
+    INVENTORY_TYPES, Objects, PC, type_key, view_filter_spec,
+    build_vm, resolve_placement,
+)
+
+log = logging.getLogger(__name__)
+
+sync_updates = metrics.counter(
+    "inventory_sync_updates_total", "Conjuntos de cambios recibidos de WaitForUpdatesEx", ("vcenter",),
+)
+
+# ───────────────────────────────────────────────────────────────────────
+# Sincronización incremental del inventario (WaitForUpdatesEx)
+# ───────────────────────────────────────────────────────────────────────
+# Se mantiene abierto un PropertyFilter sobre VMs, hosts, clusters y
+# redes. La primera llamada a WaitForUpdatesEx (versión "") entrega el
+# inventario completo; las siguientes solo los cambios, que se aplican
+# sobre el almacén en memoria y se publican como un snapshot nuevo.
+
+class InventorySync:
+    """
+    Mantiene el InventoryStore casi en tiempo real aplicando los
+    conjuntos de cambios del PropertyCollector:
+      1. Carga inicial completa (única) a través del propio filtro.
+      2. Aplicación de deltas enter/modify/leave sobre los objetos.
+      3. Reconstrucción solo de las VMs afectadas y publicación del snapshot.
+    Con varios vCenter hay una instancia por vCenter (`partition` = su
+    nombre) y cada una sustituye solo sus propias VMs en el snapshot.
+    """
+
+    def __init__(
+        self,
+        session: VCenterSession,
+        store: InventoryStore,
+        on_placement: Optional[Callable[[Dict[str, Tuple[str, str]]], None]] = None,
+        partition: Optional[str] = None,
+        wait_seconds: int = INVENTORY_SYNC_WAIT_SECONDS,
+        retry_seconds: int = INVENTORY_SYNC_RETRY_SECONDS,
+    ):
+        self.session       = session
+        self.store         = store
+        self.on_placement  = on_placement
+        self.partition     = partition
+        self.id_prefix     = vm_id_prefix(session)
+        self.wait_seconds  = wait_seconds
+        self.retry_seconds = retry_seconds
+
+        self._stop      = threading.Event()
+        self._thread:    Optional[threading.Thread] = None
+        self._collector = None
+        self.version    = ""
+        self.updates    = 0
+        self.last_contact = 0.0
+
+    # —————— Ciclo de vida ——————
+    def start(self) -> None:
+        """
+        Arranca el hilo de sincronización y marca el store como alimentado
+        externamente (las lecturas esperan la carga inicial en vez de lanzar otra).
+        """
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self.store.external_feed = True
+        self._thread = threading.Thread(target=self._run, name=f"inventory-sync-{self.session.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Detiene el hilo y cancela la espera pendiente en vCenter.
+        """
+        self._stop.set()
+        try:
+            if self._collector is not None:
+                self._collector.CancelWaitForUpdates()
+        except Exception:
+            pass
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.session.soap_call(self._sync)
+            except Exception as e:
+                if self._stop.is_set():
+                    break
+                self.store.last_error = str(e)
+                log.warning("Sincronización de inventario de %s fallida → %s; reintento", self.session.name, e)
+            self._stop.wait(self.retry_seconds)
+
+    # —————— Bucle de actualizaciones ——————
+    def _sync(self, content) -> None:
+        """
+        Abre vista, collector dedicado y filtro; aplica actualizaciones
+        hasta que se detenga el hilo. Al salir destruye los objetos de sesión.
+        """
+        view = content.viewManager.CreateContainerView(
+            content.rootFolder, list(INVENTORY_TYPES.keys()), True
+        )
+        collector = content.propertyCollector.CreatePropertyCollector()
+        self._collector = collector
+        objects: Objects = {"vm": {}, "host": {}, "compute": {}, "network": {}}
+        rows:    Dict[str, VMRow] = {}
+        self.version = ""
+        try:
+            collector.CreateFilter(view_filter_spec(view, INVENTORY_TYPES), partialUpdates=False)
+            options = PC.WaitOptions(maxWaitSeconds=self.wait_seconds)
+            pending: Set[str] = set()
+            rebuild_all = False
+            while not self._stop.is_set():
+                update = collector.WaitForUpdatesEx(self.version, options)
+                self.last_contact = time.time()
+                if update is None:
+                    continue  # sin cambios en el intervalo de espera
+                changed, topology = self._apply(objects, update)
+                pending |= changed
+                rebuild_all = rebuild_all or topology
+                self.version = update.version
+                self.updates += 1
+                sync_updates.inc(self.session.name)
+                if update.truncated:
+                    continue  # la carga inicial llega paginada
+                with stage("sync_rebuild", self.session.name):
+                    self._rebuild(objects, rows, None if rebuild_all else pending)
+                pending, rebuild_all = set(), False
+        finally:
+            self._collector = None
+            for obj in (collector, view):
+                try: obj.Destroy()
+                except Exception: pass
+
+    @staticmethod
+    def _apply(objects: Objects, update) -> Tuple[Set[str], bool]:
+        """
+        Aplica un UpdateSet sobre los objetos en memoria.
+        Devuelve los moIds de VM modificados y si cambió algún host,
+        cluster o red (lo que obliga a reconstruir todas las VMs).
+        """
+        changed: Set[str] = set()
+        topology = False
+        for fu in update.filterSet or []:
+            for ou in fu.objectSet or []:
+                kind   = type_key(ou.obj)
+                moid   = ou.obj._moId
+                bucket = objects.setdefault(kind, {})
+                if ou.kind == "leave":
+                    bucket.pop(moid, None)
+                else:
+                    props = bucket.setdefault(moid, {})
+                    for ch in ou.changeSet or []:
+                        if ch.op in ("remove", "indirectRemove"):
+                            props.pop(ch.name, None)
+                        else:
+                            props[ch.name] = ch.val
+                if kind == "vm":
+                    changed.add(moid)
+                else:
+                    topology = True
+                    if kind == "network":
+                        objects.pop("network_alias", None)   # ver network_by_alias
+        return changed, topology
+
+    def _rebuild(self, objects: Objects, rows: Dict[str, VMRow], vm_ids: Optional[Set[str]]) -> None:
+        """
+        Reconstruye las filas indicadas (o todas si vm_ids es None)
+        y publica el snapshot resultante conservando el orden existente.
+        """
+        vms = objects["vm"]
+        targets = set(vms) | set(rows) if vm_ids is None else vm_ids
+        placement: Dict[str, Tuple[str, str]] = {}
+        for vm_id in list(targets):
+            props = vms.get(vm_id)
+            if props is None or props.get("config.template"):
+                rows.pop(vm_id, None)
+                continue
+            rows[vm_id] = build_vm(vm_id, props, objects, self.session.name, self.id_prefix)
+            placement[self.id_prefix + vm_id] = resolve_placement(props, objects)
+
+        if placement and self.on_placement:
+            self.on_placement(placement)
+        if self.partition:
+            self.store.publish_source(self.partition, list(rows.values()))
+        else:
+            self.store.publish(list(rows.values()))
+
+    @property
+    def live(self) -> bool:
+        """
+        True si el filtro está abierto y vCenter respondió hace poco: el
+        snapshot refleja los cambios aunque no se haya reconstruido entero.
+        """
+        running = bool(self._thread and self._thread.is_alive())
+        return running and time.time() - self.last_contact < 2 * self.wait_seconds + 5
+
+    def status(self) -> dict:
+        """
+        Estado de la sincronización: hilo activo, versión y lotes aplicados.
+        """
+        return {
+            "vcenter": self.session.name,
+            "running": bool(self._thread and self._thread.is_alive()),
+            "live":    self.live,
+            "version": self.version,
+            "updates": self.updates,
+        }
@@ -0,0 +1,267 @@
+"""
+Benchmark reproducible del inventario contra el simulador local de vCenter.
+
+Uso (desde backend/):
+    python -m bench.inventory_bench --vms 1000 5000 20000
+    python -m bench.inventory_bench --vms 5000 --latency-ms 5 --error-rate 0.01 --json bench.json
+    python -m bench.inventory_bench --vms 5000 --mode rest
+    python -m bench.inventory_bench --vms 5000 --baseline bench.json --tolerance 0.25
+
+Cada tamaño de flota se mide en un proceso nuevo (RSS máximo aislado):
+- cold_refresh_s     : primera construcción completa del inventario.
+- list_*_ms          : latencia p50/p99 de GET /api/vms ya en caliente
+                       (listado completo y página ordenada de 100).
+- detail_ms          : p50/p99 de get_vm_detail() servido del snapshot.
+- placement_cold_ms  : p50/p99 de get_host_cluster_soap() sin caché (SOAP dirigido).
+- vcenter_requests   : peticiones REST/SOAP recibidas por el simulador, por fase.
+- peak_rss_mb        : memoria residente máxima del proceso.
+Con --baseline, termina con código 1 si alguna métrica empeora más que
+la tolerancia respecto a un JSON anterior.
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+from typing import Callable, Dict, List
+
+# Métricas comparadas con la línea base (menor es mejor)
+REGRESSION_METRICS = (
+    "cold_refresh_s",
+    "list_full_p50_ms", "list_full_p99_ms",
+    "list_page_p50_ms", "list_page_p99_ms",
+    "detail_p50_ms", "detail_p99_ms",
+    "placement_cold_p50_ms", "placement_cold_p99_ms",
+    "refresh_requests",
+    "unresolved_networks",
+    "peak_rss_mb",
+)
+# Diferencias absolutas por debajo de este margen se consideran ruido
+_NOISE_FLOOR = {"_s": 0.05, "_ms": 1.0, "_mb": 5.0, "requests": 5}
+
+
+def percentile(samples: List[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+def timed(fn: Callable[[], object], runs: int) -> List[float]:
+    """
+    Ejecuta fn `runs` veces y devuelve las duraciones en milisegundos.
+    """
+    out = []
+    for _ in range(runs):
+        t = time.perf_counter()
+        fn()
+        out.append((time.perf_counter() - t) * 1000)
+    return out
+
+def peak_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+# —————— Medición de un tamaño de flota (proceso hijo) ——————
+def run_single(args) -> Dict[str, object]:
+    from bench.vcenter_sim import FaultProfile, VCenterSimulator, make_fleet
+
+    sim = VCenterSimulator(
+        make_fleet(args.single, seed=args.seed),
+        rest      = FaultProfile(args.latency_ms, args.jitter_ms, args.error_rate, seed=args.seed),
+        soap      = FaultProfile(args.soap_latency_ms, args.jitter_ms, args.error_rate, seed=args.seed + 1),
+        bulk_soap = args.mode == "soap",
+    ).start()
+
+    # La configuración de la app se lee al importarla
+    os.environ.update(
+        VCENTER_HOST              = sim.url,
+        VCENTER_USER              = "bench@vsphere.local",
+        VCENTER_PASS              = "bench",
+        SECRET_KEY                = os.environ.get("SECRET_KEY") or "bench-secret",
+        INVENTORY_PERSIST_ENABLED = "false",
+        INVENTORY_SYNC_ENABLED    = "false",
+        SHARED_BACKEND            = "",
+    )
+    os.environ.pop("VCENTERS", None)
+
+    from fastapi.testclient import TestClient
+    from app.main import app
+    from app.auth.jwt_handler import create_access_token
+    import app.vms.vm_service as svc
+
+    sim.attach(svc.vcenter)
+    rnd = random.Random(args.seed)
+    result: Dict[str, object] = {"vms": args.single, "mode": args.mode}
+    phases: Dict[str, Dict[str, int]] = {}
+
+    def phase(name: str, fn: Callable[[], object]):
+        before = sim.snapshot_counters()
+        value = fn()
+        after = sim.snapshot_counters()
+        phases[name] = {k: v - before.get(k, 0) for k, v in after.items() if v - before.get(k, 0)}
+        return value
+
+    # 1. Refresco en frío
+    t = time.perf_counter()
+    snap = phase("refresh", svc.inventory.refresh)
+    result["cold_refresh_s"]   = round(time.perf_counter() - t, 3)
+    result["snapshot_vms"]     = len(snap.vms)
+    result["refresh_requests"] = sum(phases["refresh"].values())
+    # Redes que no llegan con su nombre (p. ej. el id de una red opaca)
+    known = {name for name, _ in sim.fleet.networks.values()}
+    result["unresolved_networks"] = sum(1 for vm in snap.vms for n in vm.networks if n not in known)
+
+    # 2. GET /api/vms en caliente (sin eventos de arranque: no lanza refrescos)
+    client  = TestClient(app)
+    headers = {"Authorization": "Bearer " + create_access_token({"sub": "bench"})}
+    errors  = 0
+
+    def get(url: str):
+        nonlocal errors
+        if client.get(url, headers=headers).status_code != 200:
+            errors += 1
+
+    get("/api/vms")     # primera petición: prepara las cachés
+    full = phase("list", lambda: timed(lambda: get("/api/vms"), args.requests))
+    offsets = [rnd.randrange(0, max(1, len(snap.vms) - 100)) for _ in range(args.requests)]
+    it = iter(offsets)
+    page = timed(lambda: get(f"/api/vms?sort=name&limit=100&offset={next(it)}"), args.requests)
+    result.update(
+        list_full_p50_ms = round(percentile(full, 0.50), 2),
+        list_full_p99_ms = round(percentile(full, 0.99), 2),
+        list_page_p50_ms = round(percentile(page, 0.50), 2),
+        list_page_p99_ms = round(percentile(page, 0.99), 2),
+        list_errors      = errors,
+    )
+
+    # 3. Detalle de VM y ubicación SOAP dirigida
+    ids = [vm.id for vm in snap.vms]
+    sample = [rnd.choice(ids) for _ in range(args.requests)]
+    it = iter(sample)
+    detail = phase("detail", lambda: timed(lambda: svc.get_vm_detail(next(it)), len(sample)))
+
+    def cold_placement(vm_id: str):
+        svc.placement_cache.invalidate(vm_id)
+        svc.get_host_cluster_soap(vm_id)
+
+    it = iter(sample[:args.placement_requests])
+    placement = phase("placement", lambda: timed(lambda: cold_placement(next(it)),
+                                                 min(args.placement_requests, len(sample))))
+    result.update(
+        detail_p50_ms         = round(percentile(detail, 0.50), 3),
+        detail_p99_ms         = round(percentile(detail, 0.99), 3),
+        placement_cold_p50_ms = round(percentile(placement, 0.50), 2),
+        placement_cold_p99_ms = round(percentile(placement, 0.99), 2),
+    )
+
+    result["vcenter_requests"] = phases
+    result["peak_rss_mb"] = round(peak_rss_mb(), 1)
+    sim.stop()
+    return result
+
+
+# —————— Orquestación, informe y comparación ——————
+def _child_args(args, size: int) -> List[str]:
+    out = [sys.executable, "-m", "bench.inventory_bench", "--single", str(size)]
+    for name in ("mode", "seed", "latency_ms", "soap_latency_ms", "jitter_ms", "error_rate",
+                 "requests", "placement_requests"):
+        out += [f"--{name.replace('_', '-')}", str(getattr(args, name))]
+    return out
+
+def run_all(args) -> List[Dict[str, object]]:
+    results = []
+    for size in args.vms:
+        proc = subprocess.run(
+            _child_args(args, size), capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        )
+        lines = [l for l in proc.stdout.splitlines() if l.startswith("{")]
+        if proc.returncode != 0 or not lines:
+            sys.stderr.write(proc.stdout[-2000:] + proc.stderr[-4000:])
+            raise SystemExit(f"El benchmark de {size} VMs ha fallado")
+        results.append(json.loads(lines[-1]))
+    return results
+
+def print_report(results: List[Dict[str, object]]) -> None:
+    cols = ("vms", "cold_refresh_s", "refresh_requests", "list_full_p50_ms", "list_full_p99_ms",
+            "list_page_p50_ms", "list_page_p99_ms", "detail_p50_ms", "placement_cold_p50_ms",
+            "peak_rss_mb")
+    widths = [max(len(c), 8) for c in cols]
+    print("  ".join(c.rjust(w) for c, w in zip(cols, widths)))
+    for r in results:
+        print("  ".join(str(r.get(c, "")).rjust(w) for c, w in zip(cols, widths)))
+    for r in results:
+        print(f"\n{r['vms']} VMs — peticiones a vCenter por fase:")
+        for name, counts in r["vcenter_requests"].items():
+            print(f"  {name:<10} " + ", ".join(f"{k}={v}" for k, v in sorted(counts.items())))
+
+def _noise_floor(metric: str) -> float:
+    for suffix, floor in _NOISE_FLOOR.items():
+        if metric.endswith(suffix):
+            return floor
+    return 0.0
+
+def compare(results: List[Dict[str, object]], baseline: List[Dict[str, object]], tolerance: float) -> List[str]:
+    """
+    Métricas que empeoran más que `tolerance` (relativa) y que el margen
+    de ruido respecto a la línea base del mismo tamaño y modo.
+    """
+    base = {(b["vms"], b["mode"]): b for b in baseline}
+    regressions = []
+    for r in results:
+        b = base.get((r["vms"], r["mode"]))
+        if not b:
+            continue
+        for metric in REGRESSION_METRICS:
+            old, new = b.get(metric), r.get(metric)
+            if old is None or new is None:
+                continue
+            if new > old * (1 + tolerance) and new - old > _noise_floor(metric):
+                regressions.append(f"{r['vms']} VMs: {metric} {old} → {new}")
+    return regressions
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Benchmark del inventario contra un vCenter simulado")
+    p.add_argument("--vms", type=int, nargs="+", default=[1000, 5000], help="Tamaños de flota (1k–50k)")
+    p.add_argument("--mode", choices=("soap", "rest"), default="soap",
+                   help="soap: PropertyCollector masivo; rest: recorrido REST por VM")
+    p.add_argument("--seed", type=int, default=42)
+    p.add_argument("--latency-ms", type=float, default=2.0, help="Latencia media por petición REST")
+    p.add_argument("--soap-latency-ms", type=float, default=5.0, help="Latencia media por llamada SOAP")
+    p.add_argument("--jitter-ms", type=float, default=1.0)
+    p.add_argument("--error-rate", type=float, default=0.0, help="Probabilidad de error 503/fault por petición")
+    p.add_argument("--requests", type=int, default=200, help="Peticiones por medida en caliente")
+    p.add_argument("--placement-requests", type=int, default=50)
+    p.add_argument("--json", help="Guarda los resultados en este fichero")
+    p.add_argument("--baseline", help="JSON de una ejecución anterior con el que comparar")
+    p.add_argument("--tolerance", type=float, default=0.2, help="Empeoramiento relativo permitido")
+    p.add_argument("--single", type=int, help=argparse.SUPPRESS)
+    return p.parse_args(argv)
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    if args.single:
+        print(json.dumps(run_single(args)))
+        return 0
+
+    results = run_all(args)
+    print_report(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print("\nRegresiones respecto a la línea base:")
+            for line in regressions:
+                print("  " + line)
+            return 1
+        print("\nSin regresiones respecto a la línea base.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
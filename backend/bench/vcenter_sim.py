@@ -0,0 +1,578 @@
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace as NS
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from pyVmomi import vim, vmodl
+
+# ───────────────────────────────────────────────────────────────────────
+# Simulador local de vCenter (REST + PropertyCollector SOAP)
+# ───────────────────────────────────────────────────────────────────────
+# Sirve una flota sintética y determinista (misma semilla → mismo
+# inventario) con latencia y tasa de errores configurables:
+# - REST: servidor HTTP real con los endpoints /rest/... que usa vm_service.
+# - SOAP: ServiceInstance en proceso que responde a las mismas llamadas
+#   del PropertyCollector (ContainerView, RetrievePropertiesEx paginado,
+#   WaitForUpdatesEx) con objetos pyVmomi reales; se conecta a una
+#   VCenterSession sustituyendo su _soap_connect (ver attach()).
+
+GiB = 1024 ** 3
+
+_ENV_PREFIXES = ("P-", "T-", "S-", "D-")
+_GUESTS = (
+    ("windows9Server64Guest", "Microsoft Windows Server 2016 or later (64-bit)"),
+    ("rhel8_64Guest",         "Red Hat Enterprise Linux 8 (64-bit)"),
+    ("ubuntu64Guest",         "Ubuntu Linux (64-bit)"),
+    ("centos7_64Guest",       "CentOS 7 (64-bit)"),
+)
+_VERSIONS = ("vmx-13", "vmx-15", "vmx-19", "vmx-21")
+_POWER = {"poweredOn": "POWERED_ON", "poweredOff": "POWERED_OFF", "suspended": "SUSPENDED"}
+_ACTIONS = {"start": "poweredOn", "stop": "poweredOff", "reset": "poweredOn"}
+
+
+# —————— Flota sintética ——————
+@dataclass
+class SimVM:
+    moid: str
+    name: str
+    power: str                 # formato SOAP (poweredOn...)
+    cpu: int
+    memory_mb: int
+    guest_id: str
+    guest_name: str
+    version: str
+    host: str                  # moId del host
+    networks: List[str]        # moIds de red (estándar, portgroup o red opaca)
+    disks_gb: List[int]
+    ip: Optional[str]
+    template: bool = False
+
+
+@dataclass
+class Fleet:
+    vms: Dict[str, SimVM]
+    hosts: Dict[str, Tuple[str, str]]          # moId → (nombre, moId del cluster)
+    clusters: Dict[str, str]                   # moId → nombre
+    networks: Dict[str, Tuple[str, str]]       # moId → (nombre, tipo: "standard" | "dvs" | "opaque")
+
+
+def opaque_network_id(moid: str) -> str:
+    """Id NSX-T (UUID determinista) de una red opaca de la flota."""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"nsx:{moid}"))
+
+
+def make_fleet(
+    n_vms: int,
+    seed: int = 42,
+    vms_per_host: int = 40,
+    hosts_per_cluster: int = 16,
+    n_networks: int = 64,
+    template_ratio: float = 0.01,
+) -> Fleet:
+    """
+    Genera una flota determinista de `n_vms` VMs repartidas en hosts,
+    clusters y redes (casi la mitad portgroups distribuidos y una de
+    cada ocho redes opacas de NSX-T).
+    """
+    rnd = random.Random(seed)
+    n_hosts    = max(1, -(-n_vms // vms_per_host))
+    n_clusters = max(1, -(-n_hosts // hosts_per_cluster))
+    clusters = {f"domain-c{i + 1}": f"CL-{i + 1:02d}" for i in range(n_clusters)}
+    cluster_ids = list(clusters)
+    hosts = {
+        f"host-{i + 1}": (f"esx{i + 1:04d}.lab.local", cluster_ids[i // hosts_per_cluster])
+        for i in range(n_hosts)
+    }
+    networks: Dict[str, Tuple[str, str]] = {}
+    for i in range(n_networks):
+        if i % 8 == 7:
+            networks[f"network-o{i + 1}"] = (f"NSX-SEG-{100 + i}", "opaque")
+        elif i % 2:
+            networks[f"dvportgroup-{i + 1}"] = (f"DPG-{100 + i}", "dvs")
+        else:
+            networks[f"network-{i + 1}"] = (f"VLAN{100 + i}", "standard")
+    host_ids, net_ids = list(hosts), list(networks)
+
+    vms: Dict[str, SimVM] = {}
+    for i in range(n_vms):
+        moid = f"vm-{1000 + i}"
+        guest_id, guest_name = rnd.choice(_GUESTS)
+        power = rnd.choices(("poweredOn", "poweredOff", "suspended"), (85, 13, 2))[0]
+        vms[moid] = SimVM(
+            moid       = moid,
+            name       = f"{rnd.choice(_ENV_PREFIXES)}APP{i:05d}",
+            power      = power,
+            cpu        = rnd.choice((1, 2, 2, 4, 4, 8, 16)),
+            memory_mb  = rnd.choice((2048, 4096, 8192, 16384, 32768)),
+            guest_id   = guest_id,
+            guest_name = guest_name,
+            version    = rnd.choice(_VERSIONS),
+            host       = host_ids[i // vms_per_host],
+            networks   = rnd.sample(net_ids, rnd.choice((1, 1, 2, 3))),
+            disks_gb   = [rnd.choice((40, 60, 100)) for _ in range(rnd.choice((1, 1, 2, 3)))],
+            ip         = f"10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}" if power == "poweredOn" else None,
+            template   = rnd.random() < template_ratio,
+        )
+    return Fleet(vms=vms, hosts=hosts, clusters=clusters, networks=networks)
+
+
+# —————— Perfil de fallos y métricas ——————
+@dataclass
+class FaultProfile:
+    """
+    Latencia (media ± jitter, en ms) y probabilidad de error por petición.
+    """
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    error_rate: float = 0.0
+    seed: int = 7
+    _rnd: random.Random = field(default=None, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def __post_init__(self):
+        self._rnd = random.Random(self.seed)
+
+    def apply(self) -> bool:
+        """
+        Espera la latencia simulada y devuelve True si la petición debe fallar.
+        """
+        with self._lock:
+            delay = max(0.0, self.latency_ms + self._rnd.uniform(-self.jitter_ms, self.jitter_ms))
+            fail  = self._rnd.random() < self.error_rate
+        if delay:
+            time.sleep(delay / 1000)
+        return fail
+
+
+class VCenterSimulator:
+    """
+    Simulador completo: flota + servidor REST + ServiceInstance SOAP.
+    `counters` cuenta las peticiones por ruta (REST) y por método (SOAP).
+    """
+
+    def __init__(
+        self,
+        fleet: Fleet,
+        rest: Optional[FaultProfile] = None,
+        soap: Optional[FaultProfile] = None,
+        bulk_soap: bool = True,
+    ):
+        self.fleet     = fleet
+        self.rest      = rest or FaultProfile()
+        self.soap      = soap or FaultProfile()
+        self.bulk_soap = bulk_soap        # False: la vista falla y se usa la ruta REST
+        self.counters: Counter = Counter()
+        self._lock     = threading.Lock()
+        self._tokens: set = set()
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._pending: List[str] = []     # VMs modificadas para WaitForUpdatesEx
+        self._changed  = threading.Condition(self._lock)
+        self._objects  = self._build_objects()
+
+    # —————— Métricas ——————
+    def count(self, key: str) -> None:
+        with self._lock:
+            self.counters[key] += 1
+
+    def snapshot_counters(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.counters)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    # —————— Ciclo de vida ——————
+    def start(self) -> "VCenterSimulator":
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _handler(self))
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="vcenter-sim", daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def attach(self, session) -> None:
+        """
+        Apunta una VCenterSession al simulador: REST a la URL local y la
+        conexión SOAP al ServiceInstance simulado.
+        """
+        session.host = self.url
+        session._soap_connect = lambda: _ServiceInstance(self)
+
+    # —————— Cambios en la flota ——————
+    def set_power(self, moid: str, power: str) -> None:
+        with self._changed:
+            self.fleet.vms[moid].power = power
+            self._objects[moid] = self._vm_object(self.fleet.vms[moid])
+            self._pending.append(moid)
+            self._changed.notify_all()
+
+    # —————— Objetos SOAP ——————
+    def _build_objects(self) -> Dict[str, Tuple[Any, Dict[str, Any]]]:
+        """
+        moId → (referencia pyVmomi, propiedades) de todos los objetos.
+        """
+        f = self.fleet
+        objs: Dict[str, Tuple[Any, Dict[str, Any]]] = {}
+        for moid, name in f.clusters.items():
+            objs[moid] = (vim.ClusterComputeResource(moid, None), {"name": name})
+        for moid, (name, cluster) in f.hosts.items():
+            objs[moid] = (vim.HostSystem(moid, None), {"name": name, "parent": objs[cluster][0]})
+        for moid, (name, kind) in f.networks.items():
+            if kind == "dvs":
+                objs[moid] = (vim.dvs.DistributedVirtualPortgroup(moid, None), {"name": name, "key": moid})
+            elif kind == "opaque":
+                summary = vim.OpaqueNetwork.Summary(
+                    name=name, accessible=True, opaqueNetworkId=opaque_network_id(moid),
+                    opaqueNetworkType="nsx.LogicalSwitch")
+                objs[moid] = (vim.OpaqueNetwork(moid, None), {"name": name, "summary": summary})
+            else:
+                objs[moid] = (vim.Network(moid, None), {"name": name})
+        for vm in f.vms.values():
+            objs[vm.moid] = self._vm_object(vm, objs)
+        return objs
+
+    def _vm_object(self, vm: SimVM, objs: Optional[Dict] = None) -> Tuple[Any, Dict[str, Any]]:
+        objs = objs or self._objects
+        devices: List[Any] = [vim.vm.device.VirtualDisk(capacityInBytes=gb * GiB) for gb in vm.disks_gb]
+        for i, nid in enumerate(vm.networks):
+            name, kind = self.fleet.networks[nid]
+            if kind == "dvs":
+                backing = vim.vm.device.VirtualEthernetCard.DistributedVirtualPortBackingInfo(
+                    port=vim.dvs.PortConnection(portgroupKey=nid))
+            elif kind == "opaque":
+                backing = vim.vm.device.VirtualEthernetCard.OpaqueNetworkBackingInfo(
+                    opaqueNetworkId=opaque_network_id(nid), opaqueNetworkType="nsx.LogicalSwitch")
+            else:
+                backing = vim.vm.device.VirtualEthernetCard.NetworkBackingInfo(
+                    network=objs[nid][0], deviceName=name)
+            devices.append(vim.vm.device.VirtualVmxnet3(
+                deviceInfo=vim.Description(label=f"Network adapter {i + 1}", summary=name),
+                backing=backing))
+        props = {
+            "name":                     vm.name,
+            "config.template":          vm.template,
+            "config.version":           vm.version,
+            "config.guestId":           vm.guest_id,
+            "config.hardware.numCPU":   vm.cpu,
+            "config.hardware.memoryMB": vm.memory_mb,
+            "config.hardware.device":   devices,
+            "guest.ipAddress":          vm.ip,
+            "runtime.powerState":       vm.power,
+            "runtime.host":             objs[vm.host][0],
+        }
+        return vim.VirtualMachine(vm.moid, None), props
+
+    def soap_call(self, method: str) -> None:
+        """
+        Cuenta la llamada SOAP y aplica latencia/errores simulados.
+        """
+        self.count(f"soap.{method}")
+        if self.soap.apply():
+            raise vmodl.RuntimeFault(msg=f"simulated fault in {method}")
+
+
+def _select(props: Dict[str, Any], path_set: List[str]) -> List[NS]:
+    return [NS(name=p, val=props[p]) for p in path_set if p in props and props[p] is not None]
+
+
+class _View(vim.view.ContainerView):
+    def Destroy(self):
+        pass
+
+
+class _PropertyCollector:
+    """
+    Subconjunto del PropertyCollector usado por vm_collector y vm_sync.
+    """
+
+    def __init__(self, sim: VCenterSimulator):
+        self.sim   = sim
+        self._stub = None
+        self._pages: Dict[str, Tuple[List[NS], int]] = {}
+        self._filter = None
+        self._version = 0
+        self._cancel = threading.Event()
+
+    # —————— Recuperación ——————
+    def _contents(self, spec) -> List[NS]:
+        root = spec.objectSet[0].obj
+        if isinstance(root, vim.view.ContainerView):
+            if not self.sim.bulk_soap:
+                raise vmodl.RuntimeFault(msg="simulated PropertyCollector failure")
+            out = []
+            for ref, props in list(self.sim._objects.values()):
+                for ps in spec.propSet:
+                    if isinstance(ref, ps.type):
+                        out.append(NS(obj=ref, propSet=_select(props, ps.pathSet)))
+                        break
+            return out
+        found = self.sim._objects.get(root._moId)
+        if found is None:
+            raise vmodl.fault.ManagedObjectNotFound(obj=root)
+        return [NS(obj=found[0], propSet=_select(found[1], spec.propSet[0].pathSet))]
+
+    def _page(self, objects: List[NS], size: Optional[int]) -> NS:
+        size = size or 100
+        chunk, rest = objects[:size], objects[size:]
+        token = None
+        if rest:
+            token = uuid.uuid4().hex
+            self._pages[token] = (rest, size)
+        return NS(objects=chunk, token=token)
+
+    def RetrievePropertiesEx(self, specSet, options):
+        self.sim.soap_call("RetrievePropertiesEx")
+        return self._page(self._contents(specSet[0]), getattr(options, "maxObjects", None))
+
+    def ContinueRetrievePropertiesEx(self, token):
+        self.sim.soap_call("ContinueRetrievePropertiesEx")
+        rest, size = self._pages.pop(token)
+        return self._page(rest, size)
+
+    # —————— Sincronización incremental ——————
+    def CreatePropertyCollector(self):
+        self.sim.count("soap.CreatePropertyCollector")
+        return _PropertyCollector(self.sim)
+
+    def CreateFilter(self, spec, partialUpdates=False):
+        self.sim.count("soap.CreateFilter")
+        self._filter = spec
+        return NS(Destroy=lambda: None)
+
+    def WaitForUpdatesEx(self, version, options):
+        self.sim.soap_call("WaitForUpdatesEx")
+        if not version:
+            objects = [
+                NS(obj=oc.obj, kind="enter",
+                   changeSet=[NS(name=p.name, op="assign", val=p.val) for p in oc.propSet])
+                for oc in self._contents(self._filter)
+            ]
+            self._version += 1
+            return NS(version=str(self._version), truncated=False, filterSet=[NS(objectSet=objects)])
+        sim = self.sim
+        with sim._changed:
+            if not sim._pending:
+                sim._changed.wait(min(getattr(options, "maxWaitSeconds", 1) or 1, 1))
+            pending, sim._pending = sim._pending, []
+        if self._cancel.is_set():
+            raise vmodl.RequestCanceled()
+        if not pending:
+            return None
+        objects = []
+        for moid in dict.fromkeys(pending):
+            ref, props = sim._objects[moid]
+            objects.append(NS(obj=ref, kind="modify",
+                              changeSet=[NS(name="runtime.powerState", op="assign", val=props["runtime.powerState"])]))
+        self._version += 1
+        return NS(version=str(self._version), truncated=False, filterSet=[NS(objectSet=objects)])
+
+    def CancelWaitForUpdates(self):
+        self._cancel.set()
+
+    def Destroy(self):
+        pass
+
+
+class _ServiceInstance:
+    def __init__(self, sim: VCenterSimulator):
+        sim.count("soap.login")
+        collector = _PropertyCollector(sim)
+        self._content = NS(
+            rootFolder        = vim.Folder("group-d1", None),
+            propertyCollector = collector,
+            viewManager       = NS(CreateContainerView=self._create_view),
+        )
+        self._sim = sim
+
+    def _create_view(self, root, types, recursive):
+        self._sim.soap_call("CreateContainerView")
+        return _View("session[sim]view", None)
+
+    def RetrieveContent(self):
+        return self._content
+
+
+# —————— Servidor REST ——————
+_ROUTES = [
+    ("POST",   re.compile(r"^/rest/com/vmware/cis/session$"),                 "session"),
+    ("DELETE", re.compile(r"^/rest/com/vmware/cis/session$"),                 "logout"),
+    ("GET",    re.compile(r"^/rest/vcenter/vm$"),                             "vm_list"),
+    ("GET",    re.compile(r"^/rest/vcenter/vm/([^/]+)$"),                     "vm"),
+    ("GET",    re.compile(r"^/rest/vcenter/vm/([^/]+)/hardware$"),            "vm_hardware"),
+    ("GET",    re.compile(r"^/rest/vcenter/vm/([^/]+)/hardware/ethernet$"),   "vm_ethernet"),
+    ("GET",    re.compile(r"^/rest/vcenter/vm/([^/]+)/guest/identity$"),      "vm_identity"),
+    ("POST",   re.compile(r"^/rest/vcenter/vm/([^/]+)/power/(start|stop|reset)$"), "vm_power"),
+    ("GET",    re.compile(r"^/rest/vcenter/network$"),                        "network_list"),
+    ("GET",    re.compile(r"^/rest/vcenter/network/([^/]+)$"),                "network"),
+]
+
+
+_REST_NET_TYPES = {"standard": "STANDARD_PORTGROUP", "dvs": "DISTRIBUTED_PORTGROUP", "opaque": "OPAQUE_NETWORK"}
+
+def _rest_backing(nid: str, fleet: Fleet, with_network: bool = True) -> dict:
+    """
+    Backing REST de una NIC. Las redes opacas llevan su id NSX-T; el
+    resumen de la VM (with_network=False) no incluye además el moRef.
+    """
+    kind = fleet.networks[nid][1]
+    backing = {"network": nid, "type": _REST_NET_TYPES[kind]}
+    if kind == "opaque":
+        backing.update(opaque_network_type="nsx.LogicalSwitch", opaque_network_id=opaque_network_id(nid))
+        if not with_network:
+            del backing["network"]
+    return backing
+
+
+def _vm_summary(vm: SimVM, fleet: Fleet) -> dict:
+    return {
+        "name":        vm.name,
+        "power_state": _POWER[vm.power],
+        "guest_OS":    vm.guest_id[:-5].upper() if vm.guest_id.endswith("Guest") else vm.guest_id.upper(),
+        "cpu":         {"count": vm.cpu},
+        "memory":      {"size_MiB": vm.memory_mb},
+        "disks": [
+            {"key": str(2000 + i), "value": {"label": f"Hard disk {i + 1}", "capacity": gb * GiB}}
+            for i, gb in enumerate(vm.disks_gb)
+        ],
+        "nics": [
+            {"key": str(4000 + i), "value": {"label": f"Network adapter {i + 1}",
+                                              "backing": _rest_backing(nid, fleet, with_network=False)}}
+            for i, nid in enumerate(vm.networks)
+        ],
+    }
+
+
+def _handler(sim: VCenterSimulator):
+    fleet = sim.fleet
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"       # keep-alive como vCenter
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, code: int, body: Any = None) -> None:
+            raw = json.dumps(body if body is not None else {}).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(raw)))
+            self.end_headers()
+            self.wfile.write(raw)
+
+        def _dispatch(self, method: str) -> None:
+            path = self.path.split("?", 1)[0]
+            for m, pattern, name in _ROUTES:
+                match = pattern.match(path) if m == method else None
+                if match:
+                    break
+            else:
+                sim.count(f"rest.{method} unknown")
+                return self._send(404, {"type": "not_found"})
+            sim.count(f"rest.{name}")
+            if self.headers.get("Content-Length"):
+                self.rfile.read(int(self.headers["Content-Length"]))
+            if sim.rest.apply():
+                return self._send(503, {"type": "service_unavailable"})
+            if name == "session":
+                token = uuid.uuid4().hex
+                with sim._lock:
+                    sim._tokens.add(token)
+                return self._send(200, {"value": token})
+            token = self.headers.get("vmware-api-session-id")
+            if token not in sim._tokens:
+                return self._send(401, {"type": "unauthenticated"})
+            if name == "logout":
+                with sim._lock:
+                    sim._tokens.discard(token)
+                return self._send(200)
+            return getattr(self, f"_{name}")(*match.groups())
+
+        def do_GET(self):
+            self._dispatch("GET")
+
+        def do_POST(self):
+            self._dispatch("POST")
+
+        def do_DELETE(self):
+            self._dispatch("DELETE")
+
+        # —————— Endpoints ——————
+        def _vm_or_404(self, moid: str) -> Optional[SimVM]:
+            vm = fleet.vms.get(moid)
+            if vm is None:
+                self._send(404, {"type": "not_found"})
+            return vm
+
+        def _vm_list(self):
+            self._send(200, {"value": [
+                {"vm": vm.moid, "name": vm.name, "power_state": _POWER[vm.power],
+                 "cpu_count": vm.cpu, "memory_size_MiB": vm.memory_mb}
+                for vm in fleet.vms.values() if not vm.template
+            ]})
+
+        def _vm(self, moid):
+            vm = self._vm_or_404(moid)
+            if vm:
+                self._send(200, {"value": _vm_summary(vm, fleet)})
+
+        def _vm_hardware(self, moid):
+            vm = self._vm_or_404(moid)
+            if vm:
+                self._send(200, {"value": {"version": vm.version.upper().replace("-", "_")}})
+
+        def _vm_ethernet(self, moid):
+            vm = self._vm_or_404(moid)
+            if vm:
+                self._send(200, {"value": [
+                    {"nic": str(4000 + i), "backing": _rest_backing(nid, fleet)}
+                    for i, nid in enumerate(vm.networks)
+                ]})
+
+        def _vm_identity(self, moid):
+            vm = self._vm_or_404(moid)
+            if vm is None:
+                return
+            if vm.power != "poweredOn":
+                return self._send(503, {"type": "service_unavailable"})   # sin VMware Tools
+            self._send(200, {"value": {
+                "name":       vm.guest_id,
+                "full_name":  {"default_message": vm.guest_name},
+                "ip_address": vm.ip,
+            }})
+
+        def _vm_power(self, moid, action):
+            vm = self._vm_or_404(moid)
+            if vm:
+                sim.set_power(moid, _ACTIONS[action])
+                self._send(200)
+
+        def _network_list(self):
+            query  = parse_qs(urlparse(self.path).query)
+            wanted = set(query.get("filter.networks", ())) or None
+            types  = set(query.get("filter.types", ())) or None
+            items  = [
+                {"network": nid, "name": name, "type": _REST_NET_TYPES[kind]}
+                for nid, (name, kind) in fleet.networks.items()
+                if wanted is None or nid in wanted
+            ]
+            self._send(200, {"value": [i for i in items if types is None or i["type"] in types]})
+
+        def _network(self, nid):
+            net = fleet.networks.get(nid)
+            if net is None:
+                return self._send(404, {"type": "not_found"})
+            self._send(200, {"value": {"name": net[0]}})
+
+    return Handler
@@ -0,0 +1,43 @@
+import os
+import sys
+
+import pytest
+
+# La configuración de la app se lee al importarla: entorno aislado antes
+# de que ninguna prueba importe `app`.
+os.environ.update(
+    VCENTER_HOST              = "https://vcenter.test",
+    VCENTER_USER              = "test@vsphere.local",
+    VCENTER_PASS              = "test",
+    SECRET_KEY                = "test-secret",
+    INVENTORY_PERSIST_ENABLED = "false",
+    INVENTORY_SYNC_ENABLED    = "false",
+    SHARED_BACKEND            = "",
+)
+os.environ.pop("VCENTERS", None)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def sim():
+    """vCenter simulado (bench/vcenter_sim) al que apunta la sesión global."""
+    from bench.vcenter_sim import VCenterSimulator, make_fleet
+    import app.vms.vm_service as svc
+
+    simulator = VCenterSimulator(make_fleet(300, seed=7)).start()
+    simulator.attach(svc.vcenter)
+    yield simulator
+    simulator.stop()
+
+
+@pytest.fixture(scope="session")
+def client(sim):
+    """TestClient sin eventos de arranque (no lanza refrescos ni sincronización)."""
+    from fastapi.testclient import TestClient
+    from app.auth.jwt_handler import create_access_token
+    from app.main import app
+
+    c = TestClient(app)
+    c.headers["Authorization"] = "Bearer " + create_access_token({"sub": "test"})
+    return c
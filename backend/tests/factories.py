@@ -0,0 +1,30 @@
+import time
+
+from app.vms.vm_models import VMBase
+from app.vms.vm_query import VMFilters
+
+_FILTERS = ("name", "vcenter", "environment", "host", "cluster", "network", "guest_os", "power_state", "q")
+
+
+def make_vm(i: int, **fields) -> VMBase:
+    """VM sintética mínima; `fields` sustituye cualquier campo."""
+    base = dict(
+        id=f"vm-{i}", name=f"vm{i:03d}", power_state="POWERED_ON", cpu_count=2,
+        memory_size_MiB=4096, environment="producción", guest_os="UBUNTU_64",
+        host="esx01", cluster="cl01", compatibility_code="VMX_19",
+        compatibility_human="ESXi 7.0 U2 and later (VM version 19)", networks=["VLAN100"],
+    )
+    return VMBase(**{**base, **fields})
+
+def make_filters(**values) -> VMFilters:
+    """VMFilters fuera de FastAPI (sus valores por defecto son Query)."""
+    return VMFilters(**{**dict.fromkeys(_FILTERS), **values})
+
+def wait_for(condition, timeout: float = 5.0, interval: float = 0.02) -> bool:
+    """Espera a que `condition()` sea cierta (hilos en segundo plano)."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(interval)
+    return condition()
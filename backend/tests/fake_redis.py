@@ -0,0 +1,82 @@
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+from app.vms import vm_shared_store
+
+
+class FakeRedis:
+    """
+    Cliente Redis mínimo en memoria para las pruebas del almacén
+    compartido: GET/SET (NX, PX)/PEXPIRE/DEL y EVAL de los scripts del
+    lock de líder, que se ejecutan de forma atómica como en Redis.
+    `on_get(key)` se llama tras cada GET suelto (no dentro de un script),
+    para simular lo que otro worker hace entre dos órdenes.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self.clock  = clock
+        self.data: Dict[str, Tuple[bytes, Optional[float]]] = {}
+        self.on_get: Optional[Callable[[str], None]] = None
+        self._lock  = threading.RLock()
+        self._scripts = {
+            vm_shared_store._RENEW_SCRIPT:   self._renew,
+            vm_shared_store._RELEASE_SCRIPT: self._release,
+        }
+
+    @staticmethod
+    def _bytes(value) -> bytes:
+        return value if isinstance(value, bytes) else str(value).encode()
+
+    def _live(self, key: str) -> Optional[bytes]:
+        item = self.data.get(key)
+        if item is None:
+            return None
+        value, expires = item
+        if expires is not None and self.clock() >= expires:
+            del self.data[key]
+            return None
+        return value
+
+    # —————— Órdenes ——————
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            value = self._live(key)
+        if self.on_get:
+            self.on_get(key)
+        return value
+
+    def set(self, key: str, value, nx: bool = False, px: Optional[int] = None) -> Optional[bool]:
+        with self._lock:
+            if nx and self._live(key) is not None:
+                return None
+            self.data[key] = (self._bytes(value), self.clock() + px / 1000 if px else None)
+            return True
+
+    def pexpire(self, key: str, ms: int) -> bool:
+        with self._lock:
+            value = self._live(key)
+            if value is None:
+                return False
+            self.data[key] = (value, self.clock() + int(ms) / 1000)
+            return True
+
+    def delete(self, *keys: str) -> int:
+        with self._lock:
+            return sum(1 for k in keys if self._live(k) is not None and self.data.pop(k))
+
+    def eval(self, script: str, numkeys: int, *args):
+        keys, argv = args[:numkeys], args[numkeys:]
+        with self._lock:
+            return self._scripts[script](keys, argv)
+
+    # —————— Scripts ——————
+    def _renew(self, keys, argv) -> int:
+        if self._live(keys[0]) == self._bytes(argv[0]):
+            return int(self.pexpire(keys[0], argv[1]))
+        return 0
+
+    def _release(self, keys, argv) -> int:
+        if self._live(keys[0]) == self._bytes(argv[0]):
+            return self.delete(keys[0])
+        return 0
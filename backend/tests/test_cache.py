@@ -0,0 +1,46 @@
+import time
+
+from app.cache import CacheNamespace
+
+
+def test_negative_entries_expire_before_positive_ones():
+    ns = CacheNamespace("t", maxsize=10, ttl=5, negative_ttl=0.1)
+    ns.set("vm-1", {"name": "vm1"})
+    ns.set("vm-2", {}, negative=True)
+    assert ns.get("vm-2") == {}
+    time.sleep(0.15)
+    assert ns.get("vm-2") is None
+    assert ns.get("vm-1") == {"name": "vm1"}
+    stats = ns.stats()
+    assert (stats["hits"], stats["negative_hits"], stats["misses"]) == (1, 1, 1)
+
+def test_negative_ttl_never_exceeds_ttl():
+    assert CacheNamespace("t", maxsize=10, ttl=1, negative_ttl=30).negative_ttl == 1
+
+def test_get_or_load_caches_failures_as_negative():
+    ns, calls = CacheNamespace("t", maxsize=10, ttl=5, negative_ttl=0.1), []
+
+    def load():
+        calls.append(1)
+        return "<error>"
+
+    is_negative = lambda v: v == "<error>"
+    assert ns.get_or_load("net", load, is_negative) == "<error>"
+    assert ns.get_or_load("net", load, is_negative) == "<error>"
+    assert len(calls) == 1
+    time.sleep(0.15)
+    ns.get_or_load("net", load, is_negative)
+    assert len(calls) == 2
+
+def test_lru_without_ttl_evicts_oldest():
+    ns = CacheNamespace("t", maxsize=2, ttl=None)
+    ns.set("a", 1); ns.set("b", 2)
+    ns.get("a")
+    ns.set("c", 3)
+    assert "b" not in ns and "a" in ns and ns.stats()["evictions"] == 1
+
+def test_invalidate_where():
+    ns = CacheNamespace("t", maxsize=10, ttl=None)
+    ns.update({(1, "x"): 1, (1, "y"): 2, (2, "x"): 3})
+    assert ns.invalidate_where(lambda k: k[0] == 1) == 2
+    assert [k for k, _ in ns.items()] == [(2, "x")]
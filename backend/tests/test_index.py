@@ -0,0 +1,56 @@
+from app.vms.vm_index import InventoryIndex
+from app.vms.vm_inventory import InventorySnapshot
+
+from factories import make_vm
+
+
+def _fleet(n: int = 60) -> InventorySnapshot:
+    return InventorySnapshot([
+        make_vm(i, host=f"esx{i % 4}", cluster=f"cl{i % 2}", networks=[f"VLAN{i % 5}", "DPG-1"],
+                power_state="POWERED_OFF" if i % 3 == 0 else "POWERED_ON",
+                ip_addresses=[f"10.0.0.{i}"])
+        for i in range(n)
+    ], version=1)
+
+def _postings(index: InventoryIndex):
+    return {f: {k: set(v) for k, v in values.items() if v} for f, values in index.inverted.items()}
+
+def _brute(snapshot, **match):
+    return {p for p, vm in enumerate(snapshot.vms)
+            if all(getattr(vm, f) == v or (isinstance(getattr(vm, f), tuple) and v in getattr(vm, f))
+                   for f, v in match.items())}
+
+
+def test_lookup_matches_brute_force():
+    snap = _fleet()
+    index = InventoryIndex(snap.vms)
+    assert index.lookup("host", "ESX1") == _brute(snap, host="esx1")
+    assert index.lookup("networks", "vlan2,vlan3") == _brute(snap, networks="VLAN2") | _brute(snap, networks="VLAN3")
+    assert index.query(cluster="cl0", power_state="powered_off") == _brute(snap, cluster="cl0", power_state="POWERED_OFF")
+    assert index.query() is None
+
+def test_substring_search_by_name_and_ip():
+    snap = _fleet()
+    index = InventoryIndex(snap.vms)
+    assert index.query(name="vm04") == {p for p, vm in enumerate(snap.vms) if "vm04" in vm.name}
+    assert index.query(q="10.0.0.5") == {p for p, vm in enumerate(snap.vms)
+                                         if any("10.0.0.5" in ip for ip in vm.ip_addresses)}
+
+def test_derive_equals_full_rebuild():
+    old = _fleet()
+    base = InventoryIndex(old.vms)
+    vms = list(old.vms)
+    vms[3]  = vms[3].replace(power_state="POWERED_ON", host="esx9")
+    vms[10] = vms[10].replace(name="renamed", networks=("VLAN7",))
+    derived = base.derive(old.vms, vms)
+    assert derived is not None
+    full = InventoryIndex(vms)
+    assert _postings(derived) == _postings(full)
+    assert derived.query(name="renamed") == full.query(name="renamed") == {10}
+    # El índice original no cambia (copia al escribir)
+    assert _postings(base) == _postings(InventoryIndex(old.vms))
+
+def test_derive_gives_up_when_positions_change():
+    old = _fleet()
+    base = InventoryIndex(old.vms)
+    assert base.derive(old.vms, list(old.vms)[1:]) is None
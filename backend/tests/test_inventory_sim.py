@@ -0,0 +1,81 @@
+import app.vms.vm_service as svc
+from app.vms import vm_render
+from app.vms.vm_session import vm_id_prefix
+
+from factories import make_filters
+
+
+def _expected_names(sim):
+    return {vm.name for vm in sim.fleet.vms.values() if not vm.template}
+
+def _network_names(sim):
+    return {name for name, _ in sim.fleet.networks.values()}
+
+
+def test_refresh_builds_snapshot_from_vcenter(sim):
+    snap = svc.inventory.refresh()
+    assert {vm.name for vm in snap.vms} == _expected_names(sim)
+    # Todas las redes llegan con su nombre (también las opacas de NSX-T)
+    assert {n for vm in snap.vms for n in vm.networks} <= _network_names(sim)
+    by_id = {vm.id: vm for vm in snap.vms}
+    for moid, vm in list(sim.fleet.vms.items())[:20]:
+        if not vm.template:
+            row = by_id[vm_id_prefix(svc.vcenter) + moid]
+            assert (row.cpu_count, row.memory_size_MiB) == (vm.cpu, vm.memory_mb)
+
+def test_list_query_and_render(sim, client):
+    snap = svc.inventory.refresh()
+    r = client.get("/api/vms?sort=name&limit=25&offset=10&fields=name,power_state")
+    assert r.status_code == 200
+    names = sorted(_expected_names(sim))
+    assert [vm["name"] for vm in r.json()] == names[10:35]
+    assert set(r.json()[0]) == {"id", "name", "power_state"}
+    assert int(r.headers["x-total-count"]) == len(names)
+    assert r.headers["x-inventory-version"] == str(snap.version)
+
+    cluster = snap.vms[0].cluster
+    r = client.get(f"/api/vms?cluster={cluster}&power_state=POWERED_ON")
+    expected = {vm.id for vm in snap.vms if vm.cluster == cluster and vm.power_state == "POWERED_ON"}
+    assert {vm["id"] for vm in r.json()} == expected
+
+    page = vm_render.render_page(snap, make_filters(cluster=cluster), (("name", False),), 0, None, None)
+    assert page.total == len([vm for vm in snap.vms if vm.cluster == cluster])
+
+def test_etag_and_delta_after_power_change(sim, client):
+    snap = svc.inventory.refresh()
+    r = client.get("/api/vms?limit=5")
+    etag, version = r.headers["etag"], int(r.headers["x-inventory-version"])
+    assert client.get("/api/vms?limit=5", headers={"If-None-Match": etag}).status_code == 304
+
+    moid, vm = next((m, v) for m, v in sim.fleet.vms.items() if v.power == "poweredOn" and not v.template)
+    sim.set_power(moid, "poweredOff")
+    try:
+        new = svc.inventory.refresh()
+        assert new.version > version
+        r = client.get("/api/vms?limit=5", headers={"If-None-Match": etag})
+        assert r.status_code == 200 and r.headers["etag"] != etag
+
+        delta = client.get(f"/api/vms?since={version}&fields=name,power_state").json()
+        assert delta["since"] == version and not delta["reset"]
+        assert not delta["added"] and not delta["removed"]
+        assert {"id": vm_id_prefix(svc.vcenter) + moid, "name": vm.name, "power_state": "POWERED_OFF"} in delta["changed"]
+    finally:
+        sim.set_power(moid, "poweredOn")
+    assert snap.version == version
+
+def test_stats_and_export_do_not_block_on_inventory_get(sim, client, monkeypatch):
+    snap = svc.inventory.refresh()
+
+    def blocking_get(*a, **kw):
+        raise AssertionError("inventory.get() bloquea el event loop")
+    monkeypatch.setattr(svc.inventory, "get", blocking_get)
+
+    stats = client.get("/api/vms/stats?group_by=power_state")
+    assert stats.status_code == 200
+    assert stats.json()["version"] == snap.version
+    assert stats.json()["total"]["count"] == len(snap.vms)
+
+    export = client.get("/api/vms/export?format=ndjson&sort=name")
+    assert export.status_code == 200
+    assert export.headers["x-inventory-version"] == str(snap.version)
+    assert len(export.text.splitlines()) == len(snap.vms)
@@ -0,0 +1,57 @@
+import random
+import threading
+import time
+
+from app.vms.vm_delta import SnapshotHistory
+from app.vms.vm_inventory import InventorySnapshot, InventoryStore
+
+from factories import make_vm
+
+
+def _racy_store() -> InventoryStore:
+    """Store cuyas publicaciones tardan un tiempo aleatorio en notificarse."""
+    store = InventoryStore(lambda: [], 300)
+    wake = store._wake
+    rnd = random.Random(5)
+
+    def slow_wake():
+        time.sleep(rnd.random() * 0.003)
+        wake()
+    store._wake = slow_wake
+    return store
+
+def _hammer(n_threads: int, per_thread: int, publish) -> None:
+    threads = [threading.Thread(target=lambda t=t: [publish(t, i) for i in range(per_thread)])
+               for t in range(n_threads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
+def test_listeners_see_increasing_versions_under_concurrent_publishes():
+    store, seen = _racy_store(), []
+    history = SnapshotHistory()
+    store.subscribe(lambda snap: seen.append(snap.version))
+    store.subscribe(history.record)
+    store.publish([make_vm(0)])
+
+    def publish(t, i):
+        if i % 2:
+            store.patch({"vm-0": {"cpu_count": t * 100 + i}})
+        else:
+            store.publish([make_vm(0, cpu_count=t * 100 + i)])
+    _hammer(8, 20, publish)
+
+    assert seen == sorted(set(seen))
+    assert seen[-1] == store.current.version
+    # El historial no se ha vaciado por una versión que llega tarde
+    assert history.diff(seen[-2], store.current) is not None
+
+def test_concurrent_adopts_notify_in_order():
+    store, seen = _racy_store(), []
+    store.subscribe(lambda snap: seen.append(snap.version))
+    _hammer(4, 25, lambda t, i: store.adopt(InventorySnapshot([make_vm(0)], version=i * 4 + t + 1)))
+
+    assert seen == sorted(set(seen))
+    assert seen[-1] == store.current.version == 100
@@ -0,0 +1,98 @@
+import json
+
+import pytest
+
+import app.vms.vm_service as svc
+from app.vms import vm_inventory
+from app.vms.vm_delta import SnapshotHistory
+from app.vms.vm_inventory import InventorySnapshot, InventoryStore
+from app.vms.vm_leader import InventoryLeadership
+from app.vms.vm_render import render_page
+from app.vms.vm_shared_store import FileSnapshotStore
+
+from factories import make_filters, make_vm, wait_for
+
+BY_NAME = (("name", False),)
+
+
+@pytest.fixture
+def workers(sim, tmp_path, monkeypatch):
+    """Crea workers que comparten un FileSnapshotStore y rastrean el simulador."""
+    # El intervalo de app.db no debe frenar la publicación compartida
+    monkeypatch.setattr(vm_inventory, "INVENTORY_PERSIST_MIN_SECONDS", 30)
+    path, started = str(tmp_path / "inventory.snap"), []
+
+    def make():
+        store = InventoryStore(svc.inventory._loader, 300, persistence=FileSnapshotStore(path))
+        lead  = InventoryLeadership(store._persistence, store, store.start, store.stop,
+                                    poll_seconds=0.05, lock_ttl=1)
+        lead.start()
+        started.append(lead)
+        return store, lead
+
+    yield make
+    for lead in started:
+        lead.stop()
+
+def _rows(snapshot):
+    body = render_page(snapshot, make_filters(), BY_NAME, 0, None, None).body
+    return {vm["id"]: vm for vm in json.loads(body)}
+
+
+def test_follower_adopts_leader_snapshots(workers):
+    leader, lead = workers()
+    assert wait_for(lambda: lead.leader and lead.shared.head() is not None)
+    follower, follow = workers()
+    assert wait_for(lambda: follower.current is not None
+                    and follower.current.version == leader.current.version)
+    assert not follow.leader
+    assert _rows(follower.current) == _rows(leader.current)
+
+    # El seguidor no publica cambios propios: su numeración es la del líder
+    snap = follower.current
+    vm_id = snap.vms[0].id
+    assert follower.patch({vm_id: {"power_state": "SUSPENDED"}}) is snap
+
+    leader.patch({vm_id: {"power_state": "POWERED_OFF"}})
+    assert wait_for(lambda: follower.current.version == leader.current.version > snap.version)
+    rows = _rows(follower.current)
+    assert rows[vm_id]["power_state"] == "POWERED_OFF"
+    assert len(rows) == len(leader.current.vms)
+
+def test_follower_takes_over_when_leader_stops(workers):
+    leader, lead = workers()
+    assert wait_for(lambda: lead.leader and lead.shared.head() is not None)
+    follower, follow = workers()
+    assert wait_for(lambda: follower.current is not None)
+    version = follower.current.version
+
+    lead.stop()
+    assert wait_for(lambda: follow.leader)
+    # Continúa la numeración compartida con su propio rastreo
+    assert wait_for(lambda: follower.current.version > version)
+    assert wait_for(lambda: follow.shared.head().version == follower.current.version)
+
+def test_adopt_after_local_publish_renders_new_content():
+    """
+    Un worker que fue líder publicó v2 localmente; el nuevo líder publica
+    otra v2 con otro contenido. Las cachés derivadas (filas codificadas,
+    páginas, historial) no deben mezclar ambos snapshots.
+    """
+    store = InventoryStore(lambda: [], 300)
+    history = SnapshotHistory()
+    store.subscribe(history.record)
+    store.publish([make_vm(i, name=f"a{i}") for i in range(3)])                  # v1
+    store.publish([make_vm(i, name=f"b{i}") for i in range(3)])                  # v2 local
+    assert len(_rows(store.current)) == 3
+
+    store.follower = True
+    assert store.adopt(InventorySnapshot([make_vm(i, name=f"c{i}") for i in range(5)], version=2))
+    rows = _rows(store.current)
+    assert sorted(vm["name"] for vm in rows.values()) == [f"c{i}" for i in range(5)]
+    assert store.adopt(InventorySnapshot([make_vm(i, name=f"d{i}") for i in range(4)], version=3))
+    assert sorted(vm["name"] for vm in _rows(store.current).values()) == [f"d{i}" for i in range(4)]
+    assert history.diff(2, store.current) is not None
+
+    store.patch({"vm-0": {"power_state": "POWERED_OFF"}})
+    assert store.current.version == 3
+    assert _rows(store.current)["vm-0"]["power_state"] == "POWERED_ON"
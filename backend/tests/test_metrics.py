@@ -0,0 +1,33 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app.admin import admin_router
+from app.main import app
+
+
+@pytest.fixture
+def remote():
+    return TestClient(app, client=("10.0.0.5", 50000))
+
+@pytest.fixture
+def local():
+    return TestClient(app, client=("127.0.0.1", 50000))
+
+
+def test_metrics_without_token_only_for_loopback(local, remote, monkeypatch):
+    monkeypatch.setattr(admin_router, "METRICS_TOKEN", "")
+    assert remote.get("/metrics").status_code == 403
+    r = local.get("/metrics")
+    assert r.status_code == 200 and "vcenter_requests_total" in r.text
+    assert TestClient(app, client=("::1", 50000)).get("/metrics").status_code == 200
+
+def test_metrics_token_required_from_anywhere(local, remote, monkeypatch):
+    monkeypatch.setattr(admin_router, "METRICS_TOKEN", "s3cr3t")
+    assert local.get("/metrics").status_code == 401
+    assert remote.get("/metrics", headers={"Authorization": "Bearer otro"}).status_code == 401
+    assert remote.get("/metrics", headers={"Authorization": "Bearer s3cr3t"}).status_code == 200
+
+def test_server_timing_is_off_by_default(sim, client):
+    r = client.get("/api/vms?limit=1")
+    assert r.status_code == 200
+    assert "server-timing" not in r.headers
@@ -0,0 +1,75 @@
+import pytest
+
+from app.cache import CacheNamespace
+from app.vms.vm_networks import NetworkResolver
+from app.vms.vm_session import VCenterSession
+from bench.vcenter_sim import VCenterSimulator, make_fleet, opaque_network_id
+
+
+@pytest.fixture
+def vc():
+    """Simulador propio (se le cambian los fallos) y una sesión apuntando a él."""
+    sim = VCenterSimulator(make_fleet(80, seed=3)).start()
+    session = VCenterSession(sim.url, "test@vsphere.local", "test", name="sim")
+    sim.attach(session)
+    yield sim, session
+    sim.stop()
+
+def _resolver(session) -> NetworkResolver:
+    return NetworkResolver(
+        session,
+        CacheNamespace("network_list_test", maxsize=4, ttl=60, negative_ttl=60),
+        CacheNamespace("network_names_test", maxsize=100, ttl=60),
+    )
+
+def _calls(sim, before, key):
+    return sim.snapshot_counters().get(key, 0) - before.get(key, 0)
+
+
+def test_map_includes_portgroup_keys_and_opaque_ids(vc):
+    sim, session = vc
+    mapping = _resolver(session).mapping()
+    for moid, (name, kind) in sim.fleet.networks.items():
+        assert mapping[moid] == name
+        if kind == "opaque":
+            assert mapping[opaque_network_id(moid)] == name
+
+def test_resolve_loads_the_map_once(vc):
+    sim, session = vc
+    resolver = _resolver(session)
+    ids = list(sim.fleet.networks)[:10] + [opaque_network_id("network-o8")]
+    before = sim.snapshot_counters()
+    names = resolver.resolve(ids)
+    resolver.resolve(ids)
+    assert names[opaque_network_id("network-o8")] == sim.fleet.networks["network-o8"][0]
+    assert _calls(sim, before, "soap.RetrievePropertiesEx") >= 1
+    assert _calls(sim, before, "rest.network_list") == 0
+    again = sim.snapshot_counters()
+    resolver.resolve(ids)
+    assert sim.snapshot_counters() == again
+
+def test_rest_fallback_and_unknown_ids_cached_as_negative(vc):
+    sim, session = vc
+    sim.bulk_soap = False
+    resolver = _resolver(session)
+    standard = next(m for m, (_, kind) in sim.fleet.networks.items() if kind == "standard")
+    assert resolver.resolve([standard])[standard] == sim.fleet.networks[standard][0]
+
+    before = sim.snapshot_counters()
+    assert resolver.resolve(["network-404"]) == {"network-404": "network-404"}
+    assert _calls(sim, before, "rest.network_list") == 1
+    assert resolver.resolve(["network-404"]) == {"network-404": "network-404"}
+    assert _calls(sim, before, "rest.network_list") == 1        # fallo cacheado
+    assert resolver.names.stats()["negative_hits"] == 1
+
+def test_failed_reload_keeps_last_good_map(vc):
+    sim, session = vc
+    resolver = _resolver(session)
+    good = resolver.mapping()
+    resolver.maps.clear()
+    sim.bulk_soap, sim.rest.error_rate = False, 1.0
+    assert resolver.mapping() == good
+    # El fallo queda cacheado como negativo: no se reintenta en cada petición
+    before = sim.snapshot_counters()
+    assert resolver.mapping() == good
+    assert sim.snapshot_counters() == before
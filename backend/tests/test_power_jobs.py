@@ -0,0 +1,45 @@
+import threading
+from types import SimpleNamespace
+
+from app.vms.vm_inventory import InventoryStore
+from app.vms.vm_power_jobs import PowerJobQueue
+
+from factories import make_vm, wait_for
+
+
+class BlockingSession:
+    """Sesión falsa: cada POST de energía espera a `release`."""
+    def __init__(self):
+        self.release = threading.Event()
+        self.posts: list = []
+
+    def post(self, path, timeout=None):
+        self.posts.append(path)
+        self.release.wait(5)
+        return SimpleNamespace(status_code=200, text="")
+
+
+def test_submit_and_get_return_copies():
+    session = BlockingSession()
+    store = InventoryStore(lambda: [], 300)
+    store.publish([make_vm(i) for i in range(3)])
+    queue = PowerJobQueue(lambda vm_id: (session, vm_id), store, max_workers=2)
+    try:
+        job = queue.submit(["vm-0", "vm-1", "vm-1", "vm-2"], "stop", "test")
+        assert job.total == 3 and job.done == 0
+        assert {item.status for item in job.items} == {"pending"}
+        assert wait_for(lambda: len(session.posts) == 2)
+
+        running = queue.get(job.id)
+        assert running is not job
+        assert [item.status for item in running.items].count("running") == 2
+
+        session.release.set()
+        assert wait_for(lambda: queue.get(job.id).finished_at is not None)
+        # Las copias entregadas no cambian con el progreso del trabajo
+        assert job.done == 0 and job.finished_at is None
+        assert [item.status for item in running.items].count("done") == 0
+        assert queue.get(job.id).done == 3
+    finally:
+        session.release.set()
+        queue.shutdown()
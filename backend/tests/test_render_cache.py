@@ -0,0 +1,52 @@
+import json
+
+from app.cache import CacheNamespace
+from app.vms import vm_render
+from app.vms.vm_inventory import InventorySnapshot
+
+from factories import make_filters, make_vm
+
+BY_NAME = (("name", False),)
+
+
+def _snapshot(n: int, version: int = 1) -> InventorySnapshot:
+    return InventorySnapshot([make_vm(i) for i in range(n)], version=version)
+
+def _pages_of(snapshot):
+    return [k for k, _ in vm_render._pages.items() if k[0] == snapshot.serial]
+
+
+def test_page_is_cached_per_snapshot():
+    snap = _snapshot(30)
+    first = vm_render.render_page(snap, make_filters(), BY_NAME, 0, 10, None)
+    again = vm_render.render_page(snap, make_filters(), BY_NAME, 0, 10, None)
+    assert again is first
+    assert (first.total, first.next_offset) == (30, 10)
+    assert [vm["name"] for vm in json.loads(first.body)] == [f"vm{i:03d}" for i in range(10)]
+
+def test_large_pages_are_not_cached(monkeypatch):
+    monkeypatch.setattr(vm_render, "RENDER_PAGE_MAX_BYTES", 1000)
+    snap = _snapshot(50)
+    small = vm_render.render_page(snap, make_filters(), BY_NAME, 0, 1, None)
+    full  = vm_render.render_page(snap, make_filters(), BY_NAME, 0, None, None)
+    assert len(full.body) > 1000
+    assert vm_render.render_page(snap, make_filters(), BY_NAME, 0, 1, None) is small
+    assert vm_render.render_page(snap, make_filters(), BY_NAME, 0, None, None) is not full
+
+def test_cache_is_bounded_by_bytes(monkeypatch):
+    assert vm_render._pages.stats()["unit"] == "bytes"
+    pages = CacheNamespace("rendered_pages_test", maxsize=64, ttl=None, max_bytes=20_000)
+    monkeypatch.setattr(vm_render, "_pages", pages)
+    snap = _snapshot(200)
+    for offset in range(0, 200, 10):
+        vm_render.render_page(snap, make_filters(), BY_NAME, offset, None, None)
+    assert pages.stats()["size"] <= 20_000
+    assert pages.stats()["evictions"] > 0
+
+def test_publish_prunes_older_snapshots():
+    old, new = _snapshot(20, 1), _snapshot(20, 2)
+    vm_render.render_page(old, make_filters(), BY_NAME, 0, 5, None)
+    vm_render.render_page(new, make_filters(), BY_NAME, 0, 5, None)
+    assert _pages_of(old) and _pages_of(new)
+    vm_render.prune_pages(new)
+    assert not _pages_of(old) and _pages_of(new)
@@ -0,0 +1,106 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.vms.vm_session import ConcurrencySlots
+
+
+class Peak:
+    """Cuenta cuántos están dentro a la vez."""
+    def __init__(self):
+        self.lock, self.now, self.max = threading.Lock(), 0, 0
+
+    def enter(self):
+        with self.lock:
+            self.now += 1
+            self.max = max(self.max, self.now)
+
+    def leave(self):
+        with self.lock:
+            self.now -= 1
+
+
+def test_threads_and_coroutines_share_one_budget():
+    slots, peak = ConcurrencySlots(4), Peak()
+
+    def sync_call():
+        with slots:
+            peak.enter()
+            time.sleep(0.01)
+            peak.leave()
+
+    async def async_call():
+        async with slots:
+            peak.enter()
+            await asyncio.sleep(0.01)
+            peak.leave()
+
+    async def main():
+        threads = [threading.Thread(target=sync_call) for _ in range(20)]
+        for t in threads:
+            t.start()
+        await asyncio.gather(*(async_call() for _ in range(20)))
+        for t in threads:
+            await asyncio.to_thread(t.join)
+
+    asyncio.run(main())
+    assert peak.max <= 4
+    assert slots.in_use() == 0
+
+def test_cancelled_waiter_does_not_leak_a_slot():
+    slots = ConcurrencySlots(1)
+
+    async def main():
+        await slots.aacquire()
+        waiter = asyncio.create_task(slots.aacquire())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        slots.release()
+        assert slots.in_use() == 0
+        await asyncio.wait_for(slots.aacquire(), 1)
+        slots.release()
+
+    asyncio.run(main())
+
+def test_slot_handed_over_to_cancelled_waiter_passes_on():
+    slots = ConcurrencySlots(1)
+
+    async def main():
+        await slots.aacquire()
+        first  = asyncio.create_task(slots.aacquire())
+        second = asyncio.create_task(slots.aacquire())
+        await asyncio.sleep(0)
+        slots.release()             # cedido a `first`...
+        first.cancel()              # ...que se cancela antes de despertar
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        await asyncio.wait_for(second, 1)
+        assert slots.in_use() == 1
+        slots.release()
+        assert slots.in_use() == 0
+
+    asyncio.run(main())
+
+def test_thread_waits_for_coroutine_slot():
+    slots, got = ConcurrencySlots(1), threading.Event()
+
+    async def main():
+        await slots.aacquire()
+        t = threading.Thread(target=lambda: (slots.acquire(), got.set()))
+        t.start()
+        await asyncio.sleep(0.05)
+        assert not got.is_set()
+        slots.release()
+        await asyncio.to_thread(t.join, 1)
+        assert got.is_set()
+        slots.release()
+
+    asyncio.run(main())
+
+def test_release_without_acquire_fails():
+    with pytest.raises(ValueError):
+        ConcurrencySlots(2).release()
@@ -0,0 +1,129 @@
+import pytest
+
+from app.vms.vm_inventory import InventorySnapshot
+from app.vms.vm_shared_store import FileSnapshotStore, RedisSnapshotStore
+
+from factories import make_vm
+from fake_redis import FakeRedis
+
+LEADER = "inventario:vms:leader"
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+@pytest.fixture
+def redis(clock):
+    return FakeRedis(clock)
+
+@pytest.fixture
+def store(redis):
+    return RedisSnapshotStore(client=redis, lock_ttl=30)
+
+
+# —————— Lock de líder ——————
+def test_only_one_leader(store):
+    assert store.acquire_leader("a")
+    assert not store.acquire_leader("b")
+    assert store.acquire_leader("a")              # volver a pedirlo lo renueva
+    assert store.renew_leader("a")
+    assert not store.renew_leader("b")
+
+def test_lock_expires_and_is_taken_over(store, clock):
+    assert store.acquire_leader("a")
+    clock.now += 31
+    assert store.acquire_leader("b")
+    assert not store.renew_leader("a")
+    assert store.client.get(LEADER) == b"b"
+
+def test_renew_extends_ttl(store, clock):
+    assert store.acquire_leader("a")
+    for _ in range(5):
+        clock.now += 20
+        assert store.renew_leader("a")
+    assert not store.acquire_leader("b")
+
+def test_release_only_by_owner(store):
+    assert store.acquire_leader("a")
+    store.release_leader("b")
+    assert store.client.get(LEADER) == b"a"
+    store.release_leader("a")
+    assert store.client.get(LEADER) is None
+    assert store.acquire_leader("b")
+
+def _takeover_on_read(redis, clock):
+    """
+    Simula que el lock de "a" caduca y "b" lo toma (con otro TTL) justo
+    después de que alguien lea el dueño con un GET suelto.
+    """
+    def takeover(key):
+        if key == LEADER and redis._live(LEADER) == b"a":
+            clock.now += 31
+            redis.set(LEADER, "b", nx=True, px=10_000)
+    redis.on_get = takeover
+
+def test_renew_race_does_not_extend_new_leader(store, redis, clock):
+    assert store.acquire_leader("a")
+    _takeover_on_read(redis, clock)
+    store.renew_leader("a")
+    if redis.data.get(LEADER, (None,))[0] == b"b":
+        assert redis.data[LEADER][1] == clock.now + 10
+
+def test_release_race_keeps_new_leader(store, redis, clock):
+    assert store.acquire_leader("a")
+    _takeover_on_read(redis, clock)
+    store.release_leader("a")
+    redis.on_get = None
+    if clock.now > 1000.0:          # hubo traspaso: el lock es de "b"
+        assert redis.get(LEADER) == b"b"
+    else:
+        assert redis.get(LEADER) is None
+
+def test_renew_after_takeover_does_not_extend_new_leader(store, redis, clock):
+    assert store.acquire_leader("a")
+    clock.now += 31
+    assert store.acquire_leader("b")
+    clock.now += 25
+    assert not store.renew_leader("a")
+    clock.now += 6                  # el TTL de "b" no se ha alargado
+    assert redis.get(LEADER) is None
+
+
+# —————— Snapshot ——————
+def test_snapshot_roundtrip(store):
+    assert store.load() is None and store.head() is None
+    snap = InventorySnapshot([make_vm(i) for i in range(3)], version=7, built_at=123.0)
+    store.save(snap)
+    head = store.head()
+    assert (head.version, head.built_at) == (7, 123.0)
+    loaded = store.load()
+    assert loaded.version == 7
+    assert [vm.name for vm in loaded.vms] == ["vm000", "vm001", "vm002"]
+
+
+# —————— Almacén en fichero ——————
+def test_file_store_lock_is_exclusive(tmp_path):
+    path = str(tmp_path / "inventory.snap")
+    a, b = FileSnapshotStore(path), FileSnapshotStore(path)
+    assert a.acquire_leader("a") and a.renew_leader("a")
+    assert not b.acquire_leader("b")
+    a.release_leader("a")
+    assert not a.renew_leader("a")
+    assert b.acquire_leader("b")
+    b.release_leader("b")
+
+def test_file_store_roundtrip(tmp_path):
+    store = FileSnapshotStore(str(tmp_path / "inventory.snap"))
+    assert store.load() is None and store.head() is None
+    store.save(InventorySnapshot([make_vm(i) for i in range(4)], version=3, built_at=50.0))
+    assert tuple(store.head()) == (3, 50.0)
+    assert [vm.id for vm in store.load().vms] == [f"vm-{i}" for i in range(4)]
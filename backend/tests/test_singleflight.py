@@ -0,0 +1,146 @@
+import asyncio
+import threading
+
+import pytest
+
+from app.singleflight import SingleFlight
+
+from factories import wait_for
+
+
+def test_concurrent_threads_share_one_call():
+    flight, calls, gate = SingleFlight(), [], threading.Event()
+
+    def load():
+        calls.append(1)
+        gate.wait(2)
+        return "detalle"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do(("detail", "vm-1"), load)))
+               for _ in range(8)]
+    for t in threads:
+        t.start()
+    key = ("detail", "vm-1")
+    assert wait_for(lambda: key in flight._calls and flight._calls[key].threads == 7)
+    call = flight._calls[key]
+    gate.set()
+    for t in threads:
+        t.join(2)
+    assert results == ["detalle"] * 8
+    assert calls == [1] and flight.in_flight() == 0
+    assert call.threads == 0
+
+def test_errors_are_shared_and_not_remembered():
+    flight = SingleFlight()
+
+    def fail():
+        raise RuntimeError("vCenter caído")
+
+    with pytest.raises(RuntimeError):
+        flight.do("k", fail)
+    assert flight.do("k", lambda: 42) == 42
+
+def test_async_waiters_share_one_call():
+    flight, calls = SingleFlight(), []
+
+    async def load():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"name": "vm1"}
+
+    async def main():
+        return await asyncio.gather(*(flight.ado(("identity", "vm-1"), load) for _ in range(10)))
+
+    assert asyncio.run(main()) == [{"name": "vm1"}] * 10
+    assert calls == [1]
+
+def test_cancelled_waiter_does_not_cancel_the_others():
+    flight, cancelled = SingleFlight(), []
+
+    async def load():
+        try:
+            await asyncio.sleep(0.1)
+        except asyncio.CancelledError:
+            cancelled.append(1)
+            raise
+        return "ok"
+
+    async def main():
+        first  = asyncio.create_task(flight.ado("k", load))
+        second = asyncio.create_task(flight.ado("k", load))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        assert await second == "ok"
+        with pytest.raises(asyncio.CancelledError):
+            await first
+
+    asyncio.run(main())
+    assert not cancelled
+
+def test_call_is_cancelled_when_every_waiter_leaves():
+    flight, cancelled = SingleFlight(), []
+
+    async def load():
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            cancelled.append(1)
+            raise
+
+    async def main():
+        task = asyncio.create_task(flight.ado("k", load))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await asyncio.sleep(0.01)
+
+    asyncio.run(main())
+    assert cancelled == [1] and flight.in_flight() == 0
+
+def test_thread_waits_for_async_call():
+    flight, calls = SingleFlight(), []
+
+    async def load():
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        return "compartido"
+
+    async def main():
+        task = asyncio.create_task(flight.ado("k", load))
+        await asyncio.sleep(0.01)
+        from_thread = await asyncio.to_thread(flight.do, "k", lambda: "propio")
+        return from_thread, await task
+
+    assert asyncio.run(main()) == ("compartido", "compartido")
+    assert calls == [1]
+
+def test_cancelled_async_waiter_keeps_thread_leader_in_flight():
+    flight, calls, gate = SingleFlight(), [], threading.Event()
+
+    def load():
+        calls.append(1)
+        gate.wait(2)
+        return "del hilo"
+
+    leader = threading.Thread(target=lambda: flight.do("k", load))
+    leader.start()
+    assert wait_for(lambda: calls == [1])
+
+    async def main():
+        waiter = asyncio.create_task(flight.ado("k", load))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        # El hilo sigue consultando: la clave no se libera
+        assert flight.in_flight() == 1
+        late = asyncio.create_task(flight.ado("k", load))
+        await asyncio.sleep(0.01)
+        gate.set()
+        return await late
+
+    assert asyncio.run(main()) == "del hilo"
+    leader.join(2)
+    assert calls == [1] and flight.in_flight() == 0
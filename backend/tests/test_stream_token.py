@@ -0,0 +1,39 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app.auth.jwt_handler import create_access_token
+
+
+@pytest.fixture
+def anonymous(client):
+    return TestClient(client.app)
+
+def _stream_token(client, path):
+    r = client.post("/api/stream-token", json={"path": path})
+    assert r.status_code == 200
+    return r.json()["stream_token"]
+
+
+def test_stream_token_opens_only_its_stream(client, anonymous):
+    path  = "/api/vms/power/missing/events"
+    token = _stream_token(client, path)
+    # Autenticado: el 404 es del trabajo inexistente, no de la autenticación
+    assert anonymous.get(f"{path}?stream_token={token}").status_code == 404
+    assert anonymous.get(f"/api/vms/power/other/events?stream_token={token}").status_code == 401
+
+def test_stream_token_is_not_an_access_token(client, anonymous):
+    token = _stream_token(client, "/api/vms/events")
+    assert anonymous.get("/api/vms", headers={"Authorization": f"Bearer {token}"}).status_code == 401
+
+def test_access_token_is_not_accepted_in_the_url(anonymous):
+    jwt  = create_access_token({"sub": "test"})
+    path = "/api/vms/power/missing/events"
+    assert anonymous.get(f"{path}?stream_token={jwt}").status_code == 401
+    assert anonymous.get(f"{path}?token={jwt}").status_code == 401
+
+def test_stream_token_requires_authentication(client, anonymous):
+    assert anonymous.post("/api/stream-token", json={"path": "/api/vms/events"}).status_code in (401, 403)
+    assert client.post("/api/stream-token", json={"path": "/api/vms"}).status_code == 400
+
+def test_header_still_accepted_on_streams(client):
+    assert client.get("/api/vms/power/missing/events").status_code == 404
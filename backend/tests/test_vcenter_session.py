@@ -0,0 +1,53 @@
+import asyncio
+import threading
+
+from app.vms.vm_session import VCenterSession
+
+
+def _session(sim) -> VCenterSession:
+    session = VCenterSession("https://vcenter.test", "test@vsphere.local", "test")
+    sim.attach(session)
+    return session
+
+
+def test_async_client_is_closed_with_its_loop(sim):
+    session = _session(sim)
+
+    async def call():
+        assert (await session.aget("/rest/vcenter/vm")).status_code == 200
+        return await session._async_client()
+
+    first  = asyncio.run(call())
+    second = asyncio.run(call())
+    assert first is not second
+    assert first.is_closed and second.is_closed
+    assert not session._aclients
+    assert session.counters["rest_logins"] == 1
+
+def test_aclose_closes_the_current_loop_client(sim):
+    session = _session(sim)
+
+    async def main():
+        client = await session._async_client()
+        await session.aclose()
+        assert client.is_closed and not session._aclients
+        assert await session._async_client() is not client
+
+    asyncio.run(main())
+
+def test_threads_and_loops_share_one_login(sim, monkeypatch):
+    monkeypatch.setattr(sim.rest, "latency_ms", 30)
+    session, tokens = _session(sim), []
+
+    async def many():
+        tokens.extend(await asyncio.gather(*(session.atoken() for _ in range(10))))
+
+    threads = [threading.Thread(target=lambda: tokens.append(session.token())) for _ in range(5)]
+    threads += [threading.Thread(target=lambda: asyncio.run(many())) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(tokens) == 35 and len(set(tokens)) == 1
+    assert session.counters["rest_logins"] == 1